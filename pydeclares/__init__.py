@@ -1,6 +1,9 @@
 from functools import partial
 
+from pydeclares.codec import Codec
+from pydeclares.columnar import DeclaredArray
 from pydeclares.declares import Declared
+from pydeclares.defines import RawJson
 from pydeclares.variables import NamingStyle, compatible_var, vec, kv  # noqa
 
 var = compatible_var
@@ -10,7 +13,10 @@ camelcase_var = partial(var, naming_style=NamingStyle.camelcase)
 version = "1.0.3"
 
 __all__ = [
+    "Codec",
+    "DeclaredArray",
     "Declared",
+    "RawJson",
     "vec",
     "NamingStyle",
     "var",
@@ -0,0 +1,108 @@
+import io
+import json as _json
+from typing import Any, Callable, Dict, Generic, Iterable, List, Optional, Type, TypeVar, Union
+from xml.etree import ElementTree as ET
+
+from pydeclares import declares
+from pydeclares.defines import JsonData
+from pydeclares.marshals import json, xml
+from pydeclares.utils import issubclass_safe
+
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+
+class Codec(Generic[_DT]):
+    """bind a declared class with its serialization options once, the compiled encoder/decoder,
+    `json.JSONEncoder` and `json.JSONDecoder` are resolved at construction and reused on every call.
+
+    >>> person_codec = Codec(Person, skip_none_field=True)
+    >>> s = person_codec.encode(person)
+    >>> person = person_codec.decode(s)
+
+    `format` is "json" or "xml". for json, extra keyword arguments are passed to `json.dumps` and
+    `json_loads` is passed to `json.loads`, `trusted` and `lazy` are the same as `json.Options`;
+    for xml, `indent`, `encoding` and `xml_declaration` are accepted.
+    """
+
+    def __init__(self, cls, format="json", skip_none_field=False, json_loads=None, trusted=False, lazy=False, **kwargs):
+        # type: (Type[_DT], str, bool, Optional[Dict[str, Any]], bool, bool, Any) -> None
+        if not issubclass_safe(cls, declares.Declared):
+            raise TypeError(f"{cls!r} is not a declared class")
+
+        self.cls = cls
+        self.format = format
+        if format == "json":
+            self._init_json(skip_none_field, json_loads or {}, kwargs, trusted, lazy)
+        elif format == "xml":
+            if json_loads or trusted or lazy:
+                raise TypeError("json_loads, trusted and lazy are only accepted by json codec")
+            self._init_xml(skip_none_field, **kwargs)
+        else:
+            raise ValueError(f"unsupported format {format!r}, expect 'json' or 'xml'")
+
+    def _init_json(self, skip_none_field, json_loads, json_dumps, trusted, lazy):
+        # type: (bool, Dict[str, Any], Dict[str, Any], bool, bool) -> None
+        self.options = json.Options(skip_none_field, json_loads, json_dumps, trusted, lazy)
+        scanner = json._raw_scanner(self.cls, json_loads)
+        if scanner is not None:
+            self._loads = scanner.loads  # type: Callable[[str], Any]
+        else:
+            self._loads = json._json_decoder(json_loads).decode
+        self._decoder = json._get_decoder(self.cls, trusted, lazy)
+        if json_dumps:
+            dumps = dict(json_dumps)
+            encoder_cls = dumps.pop("cls", None) or _json.JSONEncoder
+            self._dumps = encoder_cls(**dumps).encode  # type: Optional[Callable[[Any], str]]
+        else:
+            self._dumps = None
+            self._encoder = json._get_encoder(self.cls)
+
+    def _init_xml(self, skip_none_field, indent=None, encoding=None, xml_declaration=None):
+        # type: (bool, Optional[str], Optional[str], Optional[bool]) -> None
+        self.options = xml.Options(skip_none_field, indent)  # type: ignore
+        self._encoding = encoding
+        self._xml_declaration = xml_declaration
+
+    def encode(self, obj):
+        # type: (_DT) -> Union[str, bytes]
+        """encode a declared object into json text, or xml bytes (text if encoding is "unicode")"""
+        if self.format == "xml":
+            stream = io.StringIO() if self._encoding == "unicode" else io.BytesIO()
+            xml.dump(obj, stream, self.options, self._encoding, self._xml_declaration)  # type: ignore
+            return stream.getvalue()  # type: ignore
+
+        if self._dumps is not None:
+            return self._dumps(json._marshal_declared(obj, self.options))  # type: ignore
+
+        buf: List[str] = []
+        if obj.__class__ is self.cls:
+            self._encoder(obj, self.options, buf)
+        else:
+            json._marshal_into(obj, self.options, buf)  # type: ignore
+        return "".join(buf)
+
+    def decode(self, s):
+        # type: (Union[JsonData, ET.Element]) -> _DT
+        """decode json text or bytes, or xml text, bytes or element into a declared object"""
+        if self.format == "xml":
+            elem = s if isinstance(s, ET.Element) else ET.fromstring(s)  # type: ignore
+            return xml.unmarshal(self.cls, elem, self.options)  # type: ignore
+
+        if isinstance(s, (bytes, bytearray)):
+            s = s.decode(_json.detect_encoding(s), "surrogatepass")
+        data = self._loads(s)
+        assert isinstance(data, dict)
+        return self._decoder(data, self.options)
+
+    def encode_many(self, objs):
+        # type: (Iterable[_DT]) -> List[Union[str, bytes]]
+        encode = self.encode
+        return [encode(obj) for obj in objs]
+
+    def decode_many(self, docs):
+        # type: (Iterable[Union[JsonData, ET.Element]]) -> List[_DT]
+        decode = self.decode
+        return [decode(doc) for doc in docs]
+
+    def __repr__(self):
+        return f"Codec({self.cls.__name__}, format={self.format!r})"
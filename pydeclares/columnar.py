@@ -0,0 +1,198 @@
+from array import array
+from sys import intern
+from typing import Any, Callable, Dict, Generic, Iterable, Iterator, List, Mapping, Sequence, Set, Type, TypeVar, Union
+
+from pydeclares import declares, variables
+from pydeclares.defines import MISSING
+from pydeclares.utils import issubclass_safe
+from pydeclares.variables import Kind
+
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+_Column = Union["array[Any]", List[Any]]
+
+
+class DeclaredArray(Generic[_DT]):
+    """a columnar container of declared objects, every field is stored in its own column.
+    `int` and `float` fields are stored in `array.array` of signed 64 bits integers and doubles,
+    strings are interned, other fields are kept in lists.
+
+    >>> people = DeclaredArray(Person, people_list)
+    >>> people.extend_columns({"name": ["sam", "tom"], "age": [18, 20]})
+    >>> total = sum(people.column("age"))
+    >>> people[0].name
+
+    indexing returns a `DeclaredRow` view, call `materialize` of it for a declared instance.
+    None values of numeric columns are stored as 0 and the rows are remembered aside.
+    """
+
+    def __init__(self, cls: Type[_DT], objs: Iterable[_DT] = ()):
+        if not issubclass_safe(cls, declares.Declared):
+            raise TypeError(f"{cls!r} is not a declared class")
+
+        self.cls = cls
+        self._plans = declares.field_plan(cls)
+        self._columns: Dict[str, _Column] = {plan.name: _new_column(plan) for plan in self._plans}
+        self._nulls: Dict[str, Set[int]] = {}
+        self._appends = tuple(self._appender(plan) for plan in self._plans)
+        self._length = 0
+        self.extend(objs)
+
+    def _appender(self, plan: variables.FieldPlan) -> Callable[[Any], None]:
+        name = plan.name
+        column = self._columns[name]
+        append = column.append
+        if isinstance(column, array):
+            nulls = self._nulls
+
+            def append_number(value: Any) -> None:
+                try:
+                    append(value)
+                except TypeError:
+                    if value is not None:
+                        raise
+                    nulls.setdefault(name, set()).add(len(column))
+                    append(0)
+
+            return append_number
+        elif _is_str(plan):
+
+            def append_str(value: Any) -> None:
+                append(intern(value) if value.__class__ is str else value)
+
+            return append_str
+        return append
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, obj: _DT) -> None:
+        for plan, append in zip(self._plans, self._appends):
+            append(getattr(obj, plan.name))
+        self._length += 1
+
+    def extend(self, objs: Iterable[_DT]) -> None:
+        append = self.append
+        for obj in objs:
+            append(obj)
+
+    def extend_columns(self, columns: Mapping[str, Sequence[Any]]) -> None:
+        """append rows column by column, all columns must have the same length. fields out of
+        `columns` get their defaults or None, values are stored without validation as
+        `Declared.construct` does.
+        """
+        unknown = set(columns) - set(self._columns)
+        if unknown:
+            raise AttributeError(f"{self.cls.__name__!r} has no fields {', '.join(sorted(unknown))}")
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError("columns must have the same length")
+        n = lengths.pop() if lengths else 0
+
+        for plan, append in zip(self._plans, self._appends):
+            values = columns.get(plan.name, MISSING)
+            if values is MISSING:
+                values = [plan.make_default() if plan.make_default else None for _ in range(n)]
+            column = self._columns[plan.name]
+            start = len(column)
+            if isinstance(column, array):
+                try:
+                    column.extend(values)
+                    continue
+                except TypeError:
+                    # there are None values, which go through the slow path
+                    del column[start:]
+            elif _is_str(plan):
+                column.extend([intern(v) if v.__class__ is str else v for v in values])
+                continue
+            for value in values:
+                append(value)
+        self._length += n
+
+    def column(self, name: str) -> _Column:
+        """return the column of field `name`, which is a list with None values if a numeric
+        column has them. don't modify it.
+        """
+        column = self._columns[name]
+        nulls = self._nulls.get(name)
+        if not nulls:
+            return column
+        return [None if i in nulls else v for i, v in enumerate(column)]
+
+    def _get(self, index: int, name: str) -> Any:
+        nulls = self._nulls.get(name)
+        if nulls and index in nulls:
+            return None
+        return self._columns[name][index]
+
+    def materialize(self, index: int) -> _DT:
+        """build a declared instance of the row at `index`, without validation"""
+        return self.cls.construct(**{plan.name: self._get(index, plan.name) for plan in self._plans})
+
+    def to_list(self) -> List[_DT]:
+        return [self.materialize(i) for i in range(self._length)]
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            indices = range(self._length)[index]
+            sliced = DeclaredArray(self.cls)
+            for name, column in self._columns.items():
+                sliced._columns[name][:] = column[index]
+                nulls = self._nulls.get(name)
+                if nulls:
+                    sliced._nulls[name] = {i for i, j in enumerate(indices) if j in nulls}
+            sliced._length = len(indices)
+            return sliced
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("array index out of range")
+        return DeclaredRow(self, index)
+
+    def __iter__(self) -> Iterator["DeclaredRow[_DT]"]:
+        for i in range(self._length):
+            yield DeclaredRow(self, i)
+
+    def __repr__(self):
+        return f"DeclaredArray({self.cls.__name__}, rows={self._length})"
+
+
+class DeclaredRow(Generic[_DT]):
+    """read-only view of one row of a `DeclaredArray`"""
+
+    __slots__ = ("_array", "_index")
+
+    def __init__(self, array: DeclaredArray[_DT], index: int):
+        self._array = array
+        self._index = index
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in self._array._columns:
+            raise AttributeError(f"{self._array.cls.__name__!r} row has no attribute {name!r}")
+        return self._array._get(self._index, name)
+
+    def materialize(self) -> _DT:
+        return self._array.materialize(self._index)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, DeclaredRow):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __repr__(self):
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._array._columns)
+        return f"{self._array.cls.__name__}Row({args})"
+
+
+def _new_column(plan: variables.FieldPlan) -> _Column:
+    if plan.kind is Kind.scalar:
+        if isinstance(plan.var, variables.Int):
+            return array("q")
+        elif isinstance(plan.var, variables.Float):
+            return array("d")
+    return []
+
+
+def _is_str(plan: variables.FieldPlan) -> bool:
+    return plan.kind is Kind.scalar and isinstance(plan.var, variables.String)
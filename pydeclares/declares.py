@@ -1,14 +1,21 @@
+import io
+import re
 import urllib.parse as urlparse
+import weakref
 from json.decoder import JSONDecoder
 from json.encoder import JSONEncoder
 from typing import (
+    IO,
     Any,
     Callable,
     ClassVar,
     Dict,
+    FrozenSet,
     Iterable,
+    Iterator,
     List,
     Optional,
+    Set,
     Tuple,
     Type,
     TypeVar,
@@ -21,17 +28,34 @@ from pydeclares import variables, variables as vars
 from pydeclares.defines import MISSING, JsonData
 from pydeclares.exceptions import FieldRequiredError
 from pydeclares.marshals import json, xml
-from pydeclares.utils import isinstance_safe, xml_prettify
+from pydeclares.marshals.exceptions import LazyDecodeError
+from pydeclares.utils import create_fn, isinstance_safe, xml_prettify
 
 Var = variables.Var
+Kind = variables.Kind
 
 _T = TypeVar("_T")
 _DT = TypeVar("_DT", bound="Declared")
 
+# private attributes which are set by class options
+_OPTION_ATTRS = ("_lazy", "_encoded", "_parents", "_changed")
+
 
 class BaseDeclared(type):
-    def __new__(cls, name, bases, namespace):
-        # type: (str, Tuple[type, ...], Dict[str, Any]) -> BaseDeclared
+    def __new__(cls, name, bases, namespace, slots=False, cache_encoded=False, track_changes=False, lazy=False):
+        # type: (str, Tuple[type, ...], Dict[str, Any], bool, bool, bool, bool) -> BaseDeclared
+        """create a declared class, pass `slots=True` as class keyword to store fields in `__slots__`
+
+        >>> class Order(Declared, slots=True):
+        >>>     id = var(int)
+
+        slotted classes have no room for fields kept by `json.Options(lazy=True)` and are decoded
+        eagerly, unless `lazy=True` is passed as well.
+
+        pass `cache_encoded=True` to memoize results of `to_json`, `to_xml_bytes` and `to_query_string`
+        per instance and arguments, see `_cached`. pass `track_changes=True` to record fields assigned
+        after an instance is created or decoded, see `Declared.changed_fields`. both are inherited.
+        """
         if name == "Declared":
             return super(BaseDeclared, cls).__new__(cls, name, bases, namespace)
 
@@ -52,12 +76,59 @@ class BaseDeclared(type):
                 var.name = key
                 meta_vars[key] = var
 
-        meta = {"vars": meta_vars}
+        cache_encoded = cache_encoded or any(getattr(base, "meta", {}).get("cache_encoded") for base in bases)
+        track_changes = track_changes or any(getattr(base, "meta", {}).get("track_changes") for base in bases)
+        lazy = lazy or any(getattr(base, "meta", {}).get("lazy") for base in bases)
+        if slots:
+            namespace["__slots__"] = _make_slots(bases, _slot_names(bases, fields, lazy, cache_encoded, track_changes))
+
+        meta = {
+            "vars": meta_vars,
+            "fields": tuple(meta_vars[f] for f in fields),
+            "plan": tuple(variables.make_plan(meta_vars[f]) for f in fields),
+        }
+        if lazy:
+            meta["lazy"] = True
+        for option, enabled in (("cache_encoded", cache_encoded), ("track_changes", track_changes)):
+            if enabled:
+                _check_nested(name, meta["plan"], option)
+                namespace["__setattr__"] = _setattr_hook
+                meta[option] = True
         new_cls: Any = super(BaseDeclared, cls).__new__(cls, name, bases, namespace)
         setattr(new_cls, "fields", tuple(fields))
         setattr(new_cls, "meta", meta)
         return new_cls
 
+    def __init__(cls, name, bases, namespace, **kwargs):
+        # type: (str, Tuple[type, ...], Dict[str, Any], Any) -> None
+        super().__init__(name, bases, namespace)
+
+
+def _slot_names(bases, fields, lazy, cache_encoded, track_changes):
+    # type: (Tuple[type, ...], List[str], bool, bool, bool) -> List[str]
+    """fields and the private attributes which are used by options"""
+    names = [*fields, "_is_empty"]
+    if lazy:
+        names.append("_lazy")
+    if cache_encoded:
+        names.extend(["_encoded", "_parents"])
+        if not any(base.__weakrefoffset__ for base in bases):
+            names.append("__weakref__")
+    if track_changes:
+        names.append("_changed")
+    return names
+
+
+def _make_slots(bases, names):
+    # type: (Tuple[type, ...], List[str]) -> Tuple[str, ...]
+    """filter out names which have been slots of bases, include fields inherited from declared bases"""
+    inherited = set()
+    for base in bases:
+        for klass in base.__mro__:
+            base_slots = klass.__dict__.get("__slots__", ())
+            inherited.update([base_slots] if isinstance(base_slots, str) else base_slots)
+    return tuple(name for name in names if name not in inherited)
+
 
 class Declared(metaclass=BaseDeclared):
     """declared a serialize object make data class more clearly and flexible, provide
@@ -66,20 +137,28 @@ class Declared(metaclass=BaseDeclared):
     must be provided unless set it required as False.
     """
 
+    __slots__ = ()
     __xml_tag_name__ = ""
+    _lazy: Optional[Tuple[Dict[str, Any], json.Options]] = None
+    # encoded results and weak references to parents of classes with `cache_encoded=True`
+    _encoded: Optional[Dict[Tuple[Any, ...], Any]] = None
+    _parents: Optional[List["weakref.ReferenceType[Declared]"]] = None
+    # names of assigned fields of classes with `track_changes=True`
+    _changed: Optional[Set[str]] = None
     fields: ClassVar[Tuple[str]]
-    meta: ClassVar[Dict[str, "vars.Var[Any, Any]"]]
+    meta: ClassVar[Dict[str, Any]]
 
     def __init__(self, *args, **kwargs):
         # type: (Any, Any) -> None
         kwargs.update(dict(zip(self.fields, args)))
         omits = {}
         omit_fields = []  # type: List[variables.Var]
-        for field in fields(self):
-            field_value = kwargs.get(field.name, MISSING)
+        for plan in self.meta["plan"]:
+            field = plan.var
+            field_value = kwargs.get(plan.name, MISSING)
 
             if field_value is MISSING:
-                field_value = field.make_default()
+                field_value = plan.make_default() if plan.make_default else None
 
             # set `init` to False but `required` is True, that mean is this variable must be init in later
             # otherwise seiralize will be failed.
@@ -93,7 +172,6 @@ class Declared(metaclass=BaseDeclared):
             self._setattr(field, field_value)
 
         self.__post_init__(**omits)
-        self._is_empty = False
 
         for field in omit_fields:
             value = getattr(self, field.name, MISSING)
@@ -104,6 +182,7 @@ class Declared(metaclass=BaseDeclared):
                 )
 
             self._setattr(field, value)
+        self._is_empty = False
 
     def _setattr(self, field, field_value):
         # type: (variables.Var, Optional[Any]) -> None
@@ -121,6 +200,43 @@ class Declared(metaclass=BaseDeclared):
     def __post_init__(self, **omits: Any):
         """"""
 
+    def __getattr__(self, name):
+        # type: (str) -> Any
+        # only called when a field is missing, fields kept by `json.Options(lazy=True)` are decoded here
+        if name in _OPTION_ATTRS:
+            return None
+
+        lazy = self._lazy
+        if lazy is not None and name in lazy[0]:
+            try:
+                value = json._decode_field(self.__class__, name, lazy[0][name], lazy[1])
+            except Exception as e:
+                raise LazyDecodeError(f"can't decode field `{name}` of {self.__class__.__name__!r}: {e}") from e
+            # the parsed data is kept, `lazy` may be shared by copies which have not decoded the field
+            setattr(self, name, value)
+            if self._changed:
+                # decoding is not a change
+                self._changed.discard(name)
+            return value
+        raise AttributeError(f"{self.__class__.__name__!r} object has no attribute {name!r}")
+
+    @classmethod
+    def construct(cls: Type[_DT], **kwargs: Any) -> _DT:
+        """create an instance from trusted data, values are assigned as they are without required
+        checking, type checking and casting. missing fields get their defaults or None,
+        `init=False` fields are accepted like others and `__post_init__` is not called.
+
+        >>> person = Person.construct(name="sam", age=18)
+        """
+        self = cls.__new__(cls)
+        for plan in cls.meta["plan"]:
+            value = kwargs.get(plan.name, MISSING)
+            if value is MISSING:
+                value = plan.make_default() if plan.make_default else None
+            setattr(self, plan.name, value)
+        self._is_empty = False
+        return self
+
     @classmethod
     def has_nest_declared_class(cls):
         _has_nest_declared_class = getattr(cls, "_has_nest_declared_class", None)
@@ -135,32 +251,36 @@ class Declared(metaclass=BaseDeclared):
             return _has_nest_declared_class
 
     @classmethod
-    def from_dict(cls, kvs, enable_serializer=False):
-        # type: (Type[_DT], Dict[str, Any], bool) -> _DT
+    def from_dict(cls, kvs, enable_serializer=False, validate=True, only=None):
+        # type: (Type[_DT], Dict[str, Any], bool, bool, Optional[Iterable[str]]) -> _DT
+        """pass `validate=False` for trusted data, instances are created by `construct`.
+        pass field paths to `only` to build selected fields only, see `_projection`.
+        """
+        projection = None if only is None else _projection(cls, frozenset(only))
         init_kwargs = {}
-        for field in fields(cls):
+        for plan in field_plan(cls):
+            field = plan.var
+            sub = None
+            if projection is not None:
+                if plan.name not in projection:
+                    continue
+                sub = projection[plan.name]
             try:
-                field_value = kvs[field.field_name]
-                if issubclass(field.type_, Declared):
-                    field_value = field.type_.from_dict(field_value)
-                elif (
-                    issubclass(field.type_, List)
-                    and isinstance(field, variables.vec)
-                    and issubclass(field.item_type, Declared)
-                ):
+                field_value = kvs[plan.field_name]
+                if plan.kind is Kind.declared:
+                    field_value = plan.type_.from_dict(field_value, validate=validate, only=sub)
+                elif plan.kind is Kind.vec and plan.items[0].kind is Kind.declared:
                     assert isinstance(
                         field_value, Iterable
                     ), f"field `{field.name}` cannot receive not iterable type"
-                    field_value = [field.item_type.from_dict(v) for v in field_value]
-                elif (
-                    issubclass(field.type_, Dict)
-                    and isinstance(field, variables.kv)
-                    and issubclass(field.v_type, Declared)
-                ):
+                    field_value = [field.item_type.from_dict(v, validate=validate, only=sub) for v in field_value]
+                elif plan.kind is Kind.kv and plan.items[1].kind is Kind.declared:
                     assert isinstance(
                         field_value, Iterable
                     ), f"field `{field.name}` cannot receive not iterable type"
-                    field_value = {k: field.v_type.from_dict(v) for k, v in field_value.items()}
+                    field_value = {
+                        k: field.v_type.from_dict(v, validate=validate, only=sub) for k, v in field_value.items()
+                    }
             except KeyError:
                 default = field.make_default()
                 if default is None:
@@ -172,27 +292,37 @@ class Declared(metaclass=BaseDeclared):
 
             init_kwargs[field.name] = field_value
 
+        if projection is not None:
+            return _build_projected(cls, init_kwargs, projection, validate)
+        if not validate:
+            return cls.construct(**init_kwargs)
         return cls(**init_kwargs)
 
-    def to_dict(self, skip_none_field=False, enable_serializer=False):
-        # type: (bool, bool) -> Dict[str, Any]
+    def to_dict(self, skip_none_field=False, enable_serializer=False, include=None, exclude=None):
+        # type: (bool, bool, Optional[Iterable[str]], Optional[Iterable[str]]) -> Dict[str, Any]
+        """`include` and `exclude` are field paths to serialize or omit, see `_mask`"""
+        mask = _mask(self.__class__, include, exclude)
         result = []
-        field: Var[Any, Any]
-        for field in fields(self):
-            if field.ignore_serialize:
+        for plan in field_plan(self):
+            field = plan.var
+            if field.ignore_serialize or plan.name not in mask:
                 continue
 
             field_value = getattr(self, field.name, MISSING)
             if skip_none_field and field_value is None:
                 continue
 
+            sub_include, sub_exclude = mask[plan.name]
             if isinstance_safe(field_value, Declared):
-                field_value = field_value.to_dict(skip_none_field)
+                field_value = field_value.to_dict(skip_none_field, include=sub_include, exclude=sub_exclude)
+            elif (sub_include is not None or sub_exclude is not None) and field_value is not None:
+                # declared items are kept as objects, unless a path such as `items[*].sku` masks them
+                field_value = _masked_items(field_value, skip_none_field, sub_include, sub_exclude)
 
             if field.serializer and enable_serializer:
                 field_value = field.serializer.to_representation(field_value)
 
-            result.append((field.field_name, field_value))
+            result.append((plan.field_name, field_value))
 
         return dict(result)
 
@@ -229,8 +359,12 @@ class Declared(metaclass=BaseDeclared):
         if self.has_nest_declared_class():
             raise ValueError("can't deserialize to nested declared class.")
 
-        data = self.to_dict(skip_none_field, True)
-        return urlparse.urlencode(data, **urlkwargs)
+        def encode():
+            return urlparse.urlencode(self.to_dict(skip_none_field, True), **urlkwargs)
+
+        if self.meta.get("cache_encoded"):
+            return _cached(self, ("query_string", skip_none_field, *sorted(urlkwargs.items())), encode)
+        return encode()
 
     @overload
     def to_json(
@@ -245,13 +379,31 @@ class Declared(metaclass=BaseDeclared):
         default: Optional[Callable[[Any], Any]] = ...,
         sort_keys: bool = ...,
         skip_none_field: bool = ...,
+        include: Optional[Iterable[str]] = ...,
+        exclude: Optional[Iterable[str]] = ...,
+        only_changed: bool = ...,
+        json_patch: bool = ...,
         **kwds: Any,
     ) -> str:
         ...
 
-    def to_json(self, skip_none_field=False, **kw):
-        # type: (bool, Any) -> "str"
-        return json.marshal(self, json.Options(skip_none_field, json_loads=kw))
+    def to_json(self, skip_none_field=False, include=None, exclude=None, only_changed=False, json_patch=False, **kw):
+        # type: (bool, Optional[Iterable[str]], Optional[Iterable[str]], bool, bool, Any) -> "str"
+        """`only_changed` encodes fields in `changed_fields` only, as a partial object, or as a list
+        of RFC 6902 operations if `json_patch` is True, see `json.marshal_changes`.
+        """
+        if only_changed:
+            if include is not None or exclude is not None:
+                raise ValueError("include and exclude can't be used with only_changed")
+            marshal_changes = json.marshal_patch if json_patch else json.marshal_changes
+            return marshal_changes(self, json.Options(skip_none_field, json_dumps=kw), self.changed_fields())
+
+        def encode():
+            return json.marshal(self, json.Options(skip_none_field, json_dumps=kw), include, exclude)
+
+        if self.meta.get("cache_encoded"):
+            return _cached(self, ("json", skip_none_field, *_mask_key(include, exclude), *sorted(kw.items())), encode)
+        return encode()
 
     @overload
     @classmethod
@@ -265,16 +417,17 @@ class Declared(metaclass=BaseDeclared):
         parse_int: Optional[Callable[[str], Any]] = ...,
         parse_constant: Optional[Callable[[str], Any]] = ...,
         object_pairs_hook: Optional[Callable[[List[Tuple[Any, Any]]], Any]] = ...,
+        only: Optional[Iterable[str]] = ...,
         **kwds: Any,
     ) -> _DT:
         ...
 
     @classmethod
-    def from_json(cls: Type[_DT], s: JsonData, **kw: Any) -> _DT:
-        return json.unmarshal(cls, s, json.Options(json_dumps=kw))
+    def from_json(cls: Type[_DT], s: JsonData, only: Optional[Iterable[str]] = None, **kw: Any) -> _DT:
+        return json.unmarshal(cls, s, json.Options(json_loads=kw), only)
 
     @classmethod
-    def from_xml(cls: Type[_DT], element: ET.Element) -> _DT:
+    def from_xml(cls: Type[_DT], element: ET.Element, only: Optional[Iterable[str]] = None) -> _DT:
         """
         >>> class Struct(Declared):
         >>>     tag = var(str)
@@ -286,28 +439,89 @@ class Declared(metaclass=BaseDeclared):
         >>>     style = var(str)
         >>>     ......
         """
-        return xml.unmarshal(cls, element, xml.Options())
+        return xml.unmarshal(cls, element, xml.Options(), only)
 
     @classmethod
-    def from_xml_string(cls: Type[_DT], xml_string: str) -> _DT:
-        return cls.from_xml(ET.XML(xml_string))  # type: ignore
+    def from_xml_string(cls: Type[_DT], xml_string: str, only: Optional[Iterable[str]] = None) -> _DT:
+        return cls.from_xml(ET.XML(xml_string), only)  # type: ignore
 
-    def to_xml(self, skip_none_field=False, indent=None):
-        # type: (bool, Optional[str]) -> ET.Element
+    def to_xml(self, skip_none_field=False, indent=None, include=None, exclude=None):
+        # type: (bool, Optional[str], Optional[Iterable[str]], Optional[Iterable[str]]) -> ET.Element
         """
         <?xml version="1.0"?>
         <tag id="`id`" style="`style`">
             `text`
         </tag>
         """
-        node = xml.marshal(self, xml.Options(skip_none_field, indent))
+        node = xml.marshal(self, xml.Options(skip_none_field, indent), include, exclude)
         if indent is not None:
             xml_prettify(node, indent, "\n")
         return node
 
-    def to_xml_bytes(self, skip_none_field=False, indent=None, **kw) -> bytes:
-        # type: (bool, Optional[str], Any) -> bytes
-        return ET.tostring(self.to_xml(skip_none_field, indent), **kw)
+    def to_xml_bytes(self, skip_none_field=False, indent=None, include=None, exclude=None, **kw) -> bytes:
+        # type: (bool, Optional[str], Optional[Iterable[str]], Optional[Iterable[str]], Any) -> bytes
+        if self.meta.get("cache_encoded"):
+            key = ("xml", skip_none_field, indent, *_mask_key(include, exclude), *sorted(kw.items()))
+            return _cached(self, key, lambda: self._to_xml_bytes(skip_none_field, indent, include, exclude, **kw))
+        return self._to_xml_bytes(skip_none_field, indent, include, exclude, **kw)
+
+    def _to_xml_bytes(self, skip_none_field, indent, include, exclude, **kw):
+        # type: (bool, Optional[str], Optional[Iterable[str]], Optional[Iterable[str]], Any) -> bytes
+        if (
+            include is not None
+            or exclude is not None
+            or kw.get("method") not in (None, "xml")
+            or not set(kw) <= {"encoding", "xml_declaration", "method"}
+        ):
+            return ET.tostring(self.to_xml(skip_none_field, indent, include, exclude), **kw)
+
+        kw.pop("method", None)
+        stream = io.StringIO() if kw.get("encoding") == "unicode" else io.BytesIO()
+        xml.dump(self, stream, xml.Options(skip_none_field, indent), **kw)
+        return stream.getvalue()  # type: ignore
+
+    def to_xml_file(self, fp, skip_none_field=False, indent=None, encoding=None, xml_declaration=None):
+        # type: (IO[Any], bool, Optional[str], Optional[str], Optional[bool]) -> None
+        """write xml into a file object directly, see `xml.dump`"""
+        xml.dump(self, fp, xml.Options(skip_none_field, indent), encoding, xml_declaration)
+
+    def changed_fields(self):
+        # type: () -> Set[str]
+        """return names of fields assigned since the instance was created, decoded or marked clean.
+        changes inside nested declared objects are reported as paths such as `customer.email`, a vec
+        or kv field is reported as a whole when any declared item in it changed. copies and unpickled
+        instances start without changes.
+        """
+        if "track_changes" not in self.meta:
+            raise TypeError(f"`{self.__class__.__name__}` doesn't track changes, declare it with `track_changes=True`")
+        return _changed_paths(self)
+
+    def mark_clean(self):
+        # type: () -> None
+        """forget changes of this instance and nested declared objects"""
+        for _, child in _children(self):
+            if "track_changes" in child.meta:
+                child.mark_clean()
+        object.__setattr__(self, "_changed", set())
+
+    def apply_merge_patch(self, patch, **kw):
+        # type: (Union[JsonData, Dict[str, Any]], Any) -> None
+        """apply a RFC 7396 merge patch in place, only fields in the patch are decoded and assigned,
+        see `json.apply_merge_patch`. keyword arguments are passed to `json.loads`.
+        """
+        json.apply_merge_patch(self, patch, json.Options(json_loads=kw))
+
+    def apply_json_patch(self, ops, **kw):
+        # type: (Union[JsonData, List[Dict[str, Any]]], Any) -> None
+        """apply RFC 6902 operations in place, see `json.apply_patch`. keyword arguments are passed
+        to `json.loads`.
+        """
+        json.apply_patch(self, ops, json.Options(json_loads=kw))
+
+    def invalidate_cache(self):
+        # type: () -> None
+        """drop encoded results of this instance and its parents, see `_cached`"""
+        _invalidate(self)
 
     @classmethod
     def empty(cls):
@@ -320,6 +534,18 @@ class Declared(metaclass=BaseDeclared):
     def __bool__(self):
         return not self._is_empty
 
+    def __reduce__(self):
+        """pickle field values as a tuple in field order, tagged with the field names of class as
+        schema. the names tuple is shared by all instances of the class, so pickle memoizes it once.
+        other attributes in `__dict__` are pickled as state, attributes of class options are not.
+        """
+        meta = self.__class__.meta
+        try:
+            reduce = meta["reduce"]
+        except KeyError:
+            reduce = meta["reduce"] = _compile_reduce(self.__class__)
+        return reduce(self)
+
     def __str__(self):
         args = [
             f"{field_name}={str(getattr(self, field_name, 'missing'))}"
@@ -342,23 +568,336 @@ class Declared(metaclass=BaseDeclared):
         return hash(tuple(str(getattr(self, f.name)) for f in fields(self)))
 
 
-def fields(class_or_instance: Union[Type[_DT], _DT]) -> Tuple[Var[Any, Any]]:
+def _check_nested(name, plans, option):
+    # type: (str, Iterable[variables.FieldPlan], str) -> None
+    """nested declared classes must report their changes, so they have to enable `option` as well"""
+    for plan in plans:
+        for p in (plan, *plan.items):
+            if p.kind is Kind.declared and not p.type_.meta.get(option):
+                raise TypeError(f"`{p.type_.__name__}` is nested in `{name}`, declare it with `{option}=True` as well")
+
+
+def _setattr_hook(self, name, value):
+    # type: (Declared, str, Any) -> None
+    """`__setattr__` of classes with `cache_encoded=True` or `track_changes=True`. assigning a field
+    records it as changed, drops encoded results of the instance and its parents, and declared values
+    in it get the instance as a parent.
+
+    `_is_empty` is assigned at last when an instance is created or decoded, which resets changes.
+    """
+    object.__setattr__(self, name, value)
+    meta = self.meta
+    if name not in meta["vars"]:
+        if name == "_is_empty" and "track_changes" in meta:
+            object.__setattr__(self, "_changed", set())
+        return
+
+    if "track_changes" in meta:
+        changed = self._changed
+        if changed is None:
+            object.__setattr__(self, "_changed", {name})
+        else:
+            changed.add(name)
+    if "cache_encoded" not in meta:
+        return
+
+    if isinstance(value, Declared):
+        _adopt(value, self)
+    elif isinstance(value, list):
+        for item in value:
+            if isinstance(item, Declared):
+                _adopt(item, self)
+    elif isinstance(value, dict):
+        for item in value.values():
+            if isinstance(item, Declared):
+                _adopt(item, self)
+    _invalidate(self)
+
+
+def _children(declared):
+    # type: (Declared) -> Iterator[Tuple[str, Declared]]
+    """yield (field name, declared object) of nested declared values, lazy fields are skipped"""
+    for plan in field_plan(declared):
+        if plan.kind is not Kind.declared and plan.kind is not Kind.vec and plan.kind is not Kind.kv:
+            continue
+        try:
+            value = object.__getattribute__(declared, plan.name)
+        except AttributeError:
+            continue
+        if isinstance(value, Declared):
+            yield plan.name, value
+        elif isinstance(value, (list, dict)):
+            for item in value.values() if isinstance(value, dict) else value:
+                if isinstance(item, Declared):
+                    yield plan.name, item
+
+
+def _changed_paths(declared):
+    # type: (Declared) -> Set[str]
+    changed = set(declared._changed or ())
+    for name, child in _children(declared):
+        if name in changed:
+            continue
+        paths = _changed_paths(child)
+        if not paths:
+            continue
+        if isinstance(object.__getattribute__(declared, name), Declared):
+            changed.update(f"{name}.{path}" for path in paths)
+        else:
+            changed.add(name)
+    return changed
+
+
+def _adopt(child, parent):
+    # type: (Declared, Declared) -> None
+    parents = child._parents
+    if parents is None:
+        object.__setattr__(child, "_parents", [weakref.ref(parent)])
+    elif not any(ref() is parent for ref in parents):
+        parents[:] = [ref for ref in parents if ref() is not None]
+        parents.append(weakref.ref(parent))
+
+
+def _invalidate(declared):
+    # type: (Declared) -> None
+    if declared._encoded:
+        declared._encoded.clear()
+    parents = declared._parents
+    if parents:
+        for ref in parents:
+            parent = ref()
+            if parent is not None:
+                _invalidate(parent)
+
+
+def _cached(declared, key, encode):
+    # type: (Declared, Tuple[Any, ...], Callable[[], _T]) -> _T
+    """return the encoded result of `key` which is memoized in the instance, results are dropped
+    when a field of the instance or its nested declared objects is assigned. in-place changes of
+    vec and kv values can't be seen, call `invalidate_cache` after them.
+
+    results and parents are not copied or pickled, see `Declared.__reduce__`. copies assign their
+    fields through `_setattr_hook`, so they start without results and their children adopt them.
+    """
+    encoded = declared._encoded
+    if encoded is None:
+        encoded = {}
+        object.__setattr__(declared, "_encoded", encoded)
+    try:
+        return encoded[key]
+    except KeyError:
+        result = encoded[key] = encode()
+        return result
+    except TypeError:
+        # unhashable arguments
+        return encode()
+
+
+def _mask_key(include, exclude):
+    # type: (Optional[Iterable[str]], Optional[Iterable[str]]) -> Tuple[Optional[FrozenSet[str]], ...]
+    return (None if include is None else frozenset(include), None if exclude is None else frozenset(exclude))
+
+
+def _reduce(self):
+    # type: (Declared) -> Tuple[Any, ...]
+    """the slow path of `Declared.__reduce__`, for missing fields and attributes out of fields"""
+    cls = self.__class__
+    values = tuple([getattr(self, name, MISSING) for name in cls.fields])
+    args = (cls, cls.fields, values, getattr(self, "_is_empty", False))
+    state = {
+        k: v
+        for k, v in getattr(self, "__dict__", {}).items()
+        if k not in cls.fields and k != "_is_empty" and k not in _OPTION_ATTRS
+    }
+    return (_rebuild, args, state) if state else (_rebuild, args)
+
+
+def _compile_reduce(cls):
+    # type: (Type[Declared]) -> Callable[[Declared], Tuple[Any, ...]]
+    body = []
+    if cls.__dictoffset__:
+        # more attributes than fields and `_is_empty`
+        body.extend([f"if len(self.__dict__) > {len(cls.fields) + 1}:", "  return slow(self)"])
+    body.extend(
+        [
+            "try:",
+            f"  values = ({''.join(f'self.{name}, ' for name in cls.fields)})",
+            "  is_empty = self._is_empty",
+            "except AttributeError:",
+            "  return slow(self)",
+            "return rebuild, (cls, fields, values, is_empty)",
+        ]
+    )
+    locals_ = {"cls": cls, "fields": cls.fields, "rebuild": _rebuild, "slow": _reduce}
+    return create_fn(f"__reduce_{cls.__name__}", ["self"], body, locals=locals_)
+
+
+def _rebuild(cls, schema, values, is_empty=False):
+    # type: (Type[_DT], Tuple[str, ...], Tuple[Any, ...], bool) -> _DT
+    """create an instance from values in the order of `schema` without validation, it unpickles
+    instances, see `Declared.__reduce__`. values are matched by names if `schema` differs from the
+    fields of class, unknown names are dropped, missing fields get their defaults or None.
+    """
+    if schema != cls.fields:
+        kvs = dict(zip(schema, values))
+        values = tuple(
+            kvs[plan.name] if plan.name in kvs else plan.make_default() if plan.make_default else None
+            for plan in cls.meta["plan"]
+        )
+
+    meta = cls.meta
+    try:
+        rebuild = meta["rebuild"]
+    except KeyError:
+        rebuild = meta["rebuild"] = _compile_rebuild(cls)
+    self = rebuild(values)
+    self._is_empty = is_empty
+    return self
+
+
+def _compile_rebuild(cls):
+    # type: (Type[_DT]) -> Callable[[Tuple[Any, ...]], _DT]
+    body = ["self = new(cls)"]
+    if cls.fields:
+        body.append(f"{', '.join(f'self.{name}' for name in cls.fields)}, = values")
+    body.append("return self")
+    return create_fn(f"__rebuild_{cls.__name__}", ["values"], body, locals={"cls": cls, "new": cls.__new__})
+
+
+def fields(class_or_instance: Union[Type[_DT], _DT]) -> Tuple[Var[Any, Any], ...]:
     """Return a tuple describing the fields of this declared class.
     Accepts a declared class or an instance of one. Tuple elements are of
     type Field.
     """
-    # Might it be worth caching this, per class?
+    # the tuple is built once by `BaseDeclared`, sorted by insertion order,
+    # so the order of the tuple is as the fields were defined.
+    try:
+        return class_or_instance.meta["fields"]
+    except (AttributeError, KeyError):
+        raise TypeError("must be called with a declared type or instance")
+
+
+def field_plan(class_or_instance: Union[Type[_DT], _DT]) -> Tuple[variables.FieldPlan, ...]:
+    """Return the precomputed field plans of this declared class, in the same order as `fields`.
+    Marshals use it to dispatch field values without inspecting variables on every call.
+    """
     try:
-        fields = getattr(class_or_instance, "fields")
-        meta = getattr(class_or_instance, "meta")
-        meta_vars = meta["vars"]
-    except AttributeError or KeyError:
+        return class_or_instance.meta["plan"]
+    except (AttributeError, KeyError):
         raise TypeError("must be called with a declared type or instance")
 
-    # Exclude pseudo-fields.  Note that fields is sorted by insertion
-    # order, so the order of the tuple is as the fields were defined.
-    out = []
-    for f in fields:
-        var = meta_vars[f]
-        out.append(var)
-    return tuple(out)
+
+_Projection = Dict[str, Optional[FrozenSet[str]]]
+_PATH = re.compile(r"(\w+)(\[\*\])?(?:\.(.+))?")
+
+
+def _projection(cls: Type[_DT], only: FrozenSet[str]) -> _Projection:
+    """Parse field paths into a map of selected field names to the paths selected inside them,
+    None selects the whole field. Paths are attribute names joined by dots, items of vec and kv
+    fields are selected by `[*]`, e.g. `id`, `customer.name` and `items[*].sku`.
+
+    Decoders with projection build selected fields only and set others to MISSING, they assign
+    fields directly so `__init__` and `__post_init__` are not called. The result is cached per
+    class and path set.
+    """
+    cache = cls.meta.setdefault("projections", {})
+    try:
+        return cache[only]
+    except KeyError:
+        pass
+
+    plans = {plan.name: plan for plan in field_plan(cls)}
+    tree: Dict[str, Optional[set]] = {}
+    for path in only:
+        match = _PATH.fullmatch(path)
+        if not match:
+            raise ValueError(f"invalid field path `{path}`")
+        name, items, rest = match.groups()
+        plan = plans.get(name)
+        if plan is None:
+            raise ValueError(f"`{cls.__name__}` has no field `{name}`")
+        if (items or rest) and bool(items) != (plan.kind in (Kind.vec, Kind.kv)):
+            raise ValueError(f"field path `{path}` must select items of vec and kv fields only by `[*]`")
+
+        if rest is None:
+            tree[name] = None
+            continue
+        target = plan.items[-1] if items else plan
+        if target.kind is not Kind.declared:
+            raise ValueError(f"field path `{path}` selects fields of `{target.type_!r}`")
+        _projection(target.type_, frozenset([rest]))
+        if name not in tree:
+            tree[name] = {rest}
+        elif tree[name] is not None:
+            tree[name].add(rest)  # type: ignore
+
+    result = cache[only] = {name: None if sub is None else frozenset(sub) for name, sub in tree.items()}
+    return result
+
+
+def _build_projected(cls, kwargs, projection, validate=True):
+    # type: (Type[_DT], Dict[str, Any], _Projection, bool) -> _DT
+    self = cls.__new__(cls)
+    for plan in cls.meta["plan"]:
+        if plan.name not in projection:
+            setattr(self, plan.name, MISSING)
+            continue
+
+        value = kwargs.get(plan.name, MISSING)
+        if value is MISSING:
+            value = plan.make_default() if plan.make_default else None
+        if validate:
+            self._setattr(plan.var, value)
+        else:
+            setattr(self, plan.name, value)
+    self._is_empty = False
+    return self
+
+
+_SubMask = Tuple[Optional[FrozenSet[str]], Optional[FrozenSet[str]]]
+_Mask = Dict[str, _SubMask]
+
+
+def _masked_items(value, skip_none_field, include, exclude):
+    # type: (Any, bool, Optional[Iterable[str]], Optional[Iterable[str]]) -> Any
+    """convert declared items of a vec or kv value into masked dicts"""
+
+    def convert(item: Any) -> Any:
+        if isinstance(item, Declared):
+            return item.to_dict(skip_none_field, include=include, exclude=exclude)
+        return item
+
+    if isinstance(value, dict):
+        return {k: convert(v) for k, v in value.items()}
+    return [convert(item) for item in value]
+
+
+def _mask(cls, include=None, exclude=None):
+    # type: (Type[_DT], Optional[Iterable[str]], Optional[Iterable[str]]) -> _Mask
+    """Map names of fields to serialize to the (include, exclude) paths inside them. Paths are the
+    same as `_projection`, `include` keeps listed fields only and `exclude` omits listed fields.
+    The result is cached per class and path sets.
+    """
+    key = (
+        None if include is None else frozenset(include),
+        None if exclude is None else frozenset(exclude),
+    )
+    cache = cls.meta.setdefault("masks", {})
+    try:
+        return cache[key]
+    except KeyError:
+        pass
+
+    included = None if key[0] is None else _projection(cls, key[0])
+    excluded = {} if key[1] is None else _projection(cls, key[1])
+    mask: _Mask = {}
+    for plan in field_plan(cls):
+        name = plan.name
+        if included is not None and name not in included:
+            continue
+        if name in excluded and excluded[name] is None:
+            continue
+        mask[name] = (None if included is None else included[name], excluded.get(name))
+
+    cache[key] = mask
+    return mask
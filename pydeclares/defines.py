@@ -8,5 +8,22 @@ class _MISSING_TYPE:
     def __str__(self):
         return "MISSING"
 
+    def __reduce__(self):
+        # keep it a singleton across pickling
+        return "MISSING"
+
 
 MISSING = _MISSING_TYPE()
+
+
+class RawJson(str):
+    """undecoded json text of a sub-document, it is written back verbatim by json marshal
+
+    >>> class Envelope(Declared):
+    >>>     id = var(int)
+    >>>     payload = var(RawJson)
+
+    the text is not checked when it is created directly, `var(RawJson)` checks str values assigned to it.
+    """
+
+    __slots__ = ()
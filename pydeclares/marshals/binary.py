@@ -0,0 +1,505 @@
+"""a compact binary format for internal traffic, both sides must have the same declared classes.
+
+a document is a 4 bytes schema fingerprint followed by the encoded object. an object is a presence
+bitmap of its fields followed by values of fields which are not None, in the order of `fields()`,
+there are no keys. integers are zigzag varints, floats are little endian doubles, strings and bytes
+are prefixed by their length, vec and kv values are prefixed by their size and a presence bitmap of
+items. values of `object` fields and serializer representations are written with a type tag.
+"""
+
+import struct
+import zlib
+from typing import Any, Callable, Dict, List, Tuple, Type, TypeVar, Union
+
+from pydeclares import declares, variables
+from pydeclares.defines import RawJson
+from pydeclares.marshals.exceptions import MarshalError
+from pydeclares.utils import create_fn
+from pydeclares.variables import Kind
+
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+_Writer = Callable[[Any, bytearray], None]
+_Reader = Callable[[bytes, int], Tuple[Any, int]]
+
+_double = struct.Struct("<d")
+_complex = struct.Struct("<dd")
+
+_TAG_NONE, _TAG_FALSE, _TAG_TRUE, _TAG_INT, _TAG_FLOAT, _TAG_STR, _TAG_BYTES, _TAG_LIST, _TAG_DICT = range(9)
+
+
+def marshal(declared: "declares.Declared") -> bytes:
+    cls = declared.__class__
+    out = bytearray(fingerprint(cls))
+    _get_encoder(cls)(declared, out)
+    return bytes(out)
+
+
+def unmarshal(typ: Type[_DT], buf: Union[bytes, bytearray, memoryview]) -> _DT:
+    """decode a document written by `marshal`, values are assigned without validation as
+    `Declared.construct` does. `MarshalError` is raised when the document was written with
+    another schema, or it is truncated.
+    """
+    if buf.__class__ is not bytes:
+        buf = bytes(buf)
+    if buf[:4] != fingerprint(typ):
+        raise MarshalError(f"schema fingerprint mismatch, the data was not written by `{typ.__name__}`")
+    try:
+        obj, pos = _get_decoder(typ)(buf, 4)
+    except (IndexError, ValueError, struct.error) as e:
+        raise MarshalError(f"truncated or corrupted data of `{typ.__name__}`") from e
+    if pos > len(buf):
+        raise MarshalError(f"truncated or corrupted data of `{typ.__name__}`")
+    elif pos < len(buf):
+        raise MarshalError(f"extra data after `{typ.__name__}` at position {pos}")
+    return obj
+
+
+def fingerprint(typ: Type["declares.Declared"]) -> bytes:
+    """4 bytes checksum of field names and their encoding layouts, nested classes included"""
+    meta = typ.meta
+    try:
+        return meta["binary_fingerprint"]
+    except KeyError:
+        digest = meta["binary_fingerprint"] = zlib.crc32(_describe(typ).encode()).to_bytes(4, "little")
+        return digest
+
+
+def _describe(typ):
+    # type: (Type[declares.Declared]) -> str
+    return "(" + ",".join(f"{p.name}={_describe_plan(p)}" for p in _plans(typ)) + ")"
+
+
+def _describe_plan(plan):
+    # type: (variables.FieldPlan) -> str
+    if plan.kind is Kind.declared:
+        return _describe(plan.type_)
+    elif plan.kind is Kind.vec:
+        return f"[{_describe_item(plan, 0)}]"
+    elif plan.kind is Kind.kv:
+        return f"{{{_describe_item(plan, 0)}:{_describe_item(plan, 1)}}}"
+    return _scalar_codes.get(plan.type_, "o") if plan.kind in (Kind.scalar, Kind.raw) else "o"
+
+
+def _describe_item(plan, index):
+    # type: (variables.FieldPlan, int) -> str
+    item = plan.items[index]
+    if plan.var.serializer and item.kind is not Kind.declared:
+        return "o"
+    return _describe_plan(item)
+
+
+def _plans(typ):
+    # type: (Type[declares.Declared]) -> List[variables.FieldPlan]
+    return [p for p in declares.field_plan(typ) if not p.var.ignore_serialize]
+
+
+def _bitmap_size(n: int) -> int:
+    return (n + 7) >> 3
+
+
+def _get_encoder(marshalable):
+    # type: (Type[declares.Declared]) -> _Writer
+    meta = marshalable.meta
+    try:
+        return meta["binary_encoder"]
+    except KeyError:
+        encoder = meta["binary_encoder"] = _compile_encoder(marshalable)
+        return encoder
+
+
+def _get_decoder(marshalable):
+    # type: (Type[declares.Declared]) -> _Reader
+    meta = marshalable.meta
+    try:
+        return meta["binary_decoder"]
+    except KeyError:
+        decoder = meta["binary_decoder"] = _compile_decoder(marshalable)
+        return decoder
+
+
+def _compile_encoder(marshalable):
+    # type: (Type[declares.Declared]) -> _Writer
+    """generate an encode function for one declared class, which reserves the presence bitmap,
+    appends values of present fields and fills the bitmap at last. small integers and short
+    strings are written inline.
+    """
+    plans = _plans(marshalable)
+    size = _bitmap_size(len(plans))
+    locals_: Dict[str, Any] = {"_write_uvarint": _write_uvarint}
+    body = ["append = out.append"]
+    if size:
+        body.extend(["start = len(out)", f"out += {bytes(size)!r}", "bits = 0"])
+    for i, plan in enumerate(plans):
+        locals_[f"_w{i}"] = _writer(plan)
+        body.extend([f"value = self.{plan.name}", "if value is not None:", f"  bits |= {1 << i}"])
+        body.extend(f"  {line}" for line in _encode_lines(i, plan))
+    if size:
+        body.append(f"out[start:start + {size}] = bits.to_bytes({size}, 'little')")
+    return create_fn(f"__encode_{marshalable.__name__}", ["self", "out"], body, locals=locals_)
+
+
+def _encode_lines(i, plan):
+    # type: (int, variables.FieldPlan) -> List[str]
+    if plan.kind is Kind.scalar and plan.type_ is int:
+        return [
+            "if value.__class__ is int and 0 <= value < 64:",
+            "  append(value << 1)",
+            "else:",
+            f"  _w{i}(value, out)",
+        ]
+    elif plan.kind is Kind.scalar and plan.type_ is str:
+        return [
+            "value = value.encode('utf-8')",
+            "n = len(value)",
+            "if n < 128:",
+            "  append(n)",
+            "else:",
+            "  _write_uvarint(n, out)",
+            "out += value",
+        ]
+    return [f"_w{i}(value, out)"]
+
+
+def _compile_decoder(marshalable):
+    # type: (Type[declares.Declared]) -> _Reader
+    """generate a decode function for one declared class, it assigns fields like `Declared.construct`
+    and returns the object with the position after it. fields which are not serialized get their
+    defaults or None.
+
+    `buf` must be bytes. reading out of a short buffer either raises IndexError or returns a
+    position beyond its end, callers check the position at last.
+    """
+    plans = _plans(marshalable)
+    size = _bitmap_size(len(plans))
+    locals_: Dict[str, Any] = {"cls": marshalable, "new": marshalable.__new__, "_unpack_double": _double.unpack_from}
+    body = ["self = new(cls)"]
+    if size:
+        body.extend([f"bits = int.from_bytes(buf[pos:pos + {size}], 'little')", f"pos += {size}"])
+    for i, plan in enumerate(plans):
+        locals_[f"_r{i}"] = _reader(plan)
+        body.append(f"if bits & {1 << i}:")
+        body.extend(f"  {line}" for line in _decode_lines(i, plan, f"self.{plan.name}"))
+        body.extend(["else:", f"  self.{plan.name} = None"])
+    for i, plan in enumerate(declares.field_plan(marshalable)):
+        if plan.var.ignore_serialize:
+            locals_[f"_d{i}"] = plan.make_default
+            body.append(f"self.{plan.name} = {f'_d{i}()' if plan.make_default else 'None'}")
+    body.extend(["self._is_empty = False", "return self, pos"])
+    return create_fn(f"__decode_{marshalable.__name__}", ["buf", "pos"], body, locals=locals_)
+
+
+def _decode_lines(i, plan, target):
+    # type: (int, variables.FieldPlan, str) -> List[str]
+    if plan.kind is Kind.scalar and plan.type_ is int:
+        return [
+            "n = buf[pos]",
+            "if n < 128:",
+            f"  {target} = (n >> 1) ^ -(n & 1)",
+            "  pos += 1",
+            "else:",
+            f"  {target}, pos = _r{i}(buf, pos)",
+        ]
+    elif plan.kind is Kind.scalar and plan.type_ is str:
+        return [
+            "n = buf[pos]",
+            "if n < 128:",
+            "  end = pos + 1 + n",
+            f"  {target} = buf[pos + 1:end].decode('utf-8')",
+            "  pos = end",
+            "else:",
+            f"  {target}, pos = _r{i}(buf, pos)",
+        ]
+    elif plan.kind is Kind.scalar and plan.type_ is float:
+        return [f"{target}, = _unpack_double(buf, pos)", "pos += 8"]
+    return [f"{target}, pos = _r{i}(buf, pos)"]
+
+
+def _write_uvarint(n: int, out: bytearray) -> None:
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_uvarint(buf: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _write_int(value: int, out: bytearray) -> None:
+    _write_uvarint(value << 1 if value >= 0 else (-value << 1) - 1, out)
+
+
+def _read_int(buf: bytes, pos: int) -> Tuple[int, int]:
+    n, pos = _read_uvarint(buf, pos)
+    return (n >> 1) ^ -(n & 1), pos
+
+
+def _write_bool(value: bool, out: bytearray) -> None:
+    out.append(1 if value else 0)
+
+
+def _read_bool(buf: bytes, pos: int) -> Tuple[bool, int]:
+    return buf[pos] != 0, pos + 1
+
+
+def _write_float(value: float, out: bytearray) -> None:
+    out += _double.pack(value)
+
+
+def _read_float(buf: bytes, pos: int) -> Tuple[float, int]:
+    return _double.unpack_from(buf, pos)[0], pos + 8
+
+
+def _write_complex(value: complex, out: bytearray) -> None:
+    out += _complex.pack(value.real, value.imag)
+
+
+def _read_complex(buf: bytes, pos: int) -> Tuple[complex, int]:
+    return complex(*_complex.unpack_from(buf, pos)), pos + 16
+
+
+def _write_str(value: str, out: bytearray) -> None:
+    data = value.encode("utf-8")
+    _write_uvarint(len(data), out)
+    out += data
+
+
+def _read_str(buf: bytes, pos: int) -> Tuple[str, int]:
+    n, pos = _read_uvarint(buf, pos)
+    end = pos + n
+    return buf[pos:end].decode("utf-8"), end
+
+
+def _write_bytes(value: bytes, out: bytearray) -> None:
+    _write_uvarint(len(value), out)
+    out += value
+
+
+def _read_bytes(buf: bytes, pos: int) -> Tuple[bytes, int]:
+    n, pos = _read_uvarint(buf, pos)
+    end = pos + n
+    return buf[pos:end], end
+
+
+def _read_raw(buf: bytes, pos: int) -> Tuple[RawJson, int]:
+    value, pos = _read_str(buf, pos)
+    return RawJson(value), pos
+
+
+def _write_any(value: Any, out: bytearray) -> None:
+    """write a json like value with a type tag"""
+    cls = value.__class__
+    if value is None:
+        out.append(_TAG_NONE)
+    elif value is True or value is False:
+        out.append(_TAG_TRUE if value else _TAG_FALSE)
+    elif issubclass(cls, int):
+        out.append(_TAG_INT)
+        _write_int(value, out)
+    elif issubclass(cls, float):
+        out.append(_TAG_FLOAT)
+        _write_float(value, out)
+    elif issubclass(cls, str):
+        out.append(_TAG_STR)
+        _write_str(value, out)
+    elif issubclass(cls, (bytes, bytearray)):
+        out.append(_TAG_BYTES)
+        _write_bytes(value, out)
+    elif issubclass(cls, (list, tuple)):
+        out.append(_TAG_LIST)
+        _write_uvarint(len(value), out)
+        for item in value:
+            _write_any(item, out)
+    elif issubclass(cls, dict):
+        out.append(_TAG_DICT)
+        _write_uvarint(len(value), out)
+        for k, v in value.items():
+            _write_any(k, out)
+            _write_any(v, out)
+    else:
+        raise MarshalError(f"can't marshal value of `{cls.__name__}`")
+
+
+def _read_any(buf: bytes, pos: int) -> Tuple[Any, int]:
+    tag = buf[pos]
+    pos += 1
+    if tag == _TAG_NONE:
+        return None, pos
+    elif tag == _TAG_FALSE or tag == _TAG_TRUE:
+        return tag == _TAG_TRUE, pos
+    elif tag == _TAG_INT:
+        return _read_int(buf, pos)
+    elif tag == _TAG_FLOAT:
+        return _read_float(buf, pos)
+    elif tag == _TAG_STR:
+        return _read_str(buf, pos)
+    elif tag == _TAG_BYTES:
+        return _read_bytes(buf, pos)
+    elif tag == _TAG_LIST:
+        n, pos = _read_uvarint(buf, pos)
+        items = []
+        for _ in range(n):
+            item, pos = _read_any(buf, pos)
+            items.append(item)
+        return items, pos
+    elif tag == _TAG_DICT:
+        n, pos = _read_uvarint(buf, pos)
+        kvs = {}
+        for _ in range(n):
+            k, pos = _read_any(buf, pos)
+            kvs[k], pos = _read_any(buf, pos)
+        return kvs, pos
+    raise ValueError(f"unknown type tag {tag}")
+
+
+_scalar_codes = {int: "i", bool: "?", float: "f", complex: "c", str: "s", bytes: "y", RawJson: "r"}
+_scalar_writers = {
+    int: _write_int,
+    bool: _write_bool,
+    float: _write_float,
+    complex: _write_complex,
+    str: _write_str,
+    bytes: _write_bytes,
+    RawJson: _write_str,
+}  # type: Dict[type, _Writer]
+_scalar_readers = {
+    int: _read_int,
+    bool: _read_bool,
+    float: _read_float,
+    complex: _read_complex,
+    str: _read_str,
+    bytes: _read_bytes,
+    RawJson: _read_raw,
+}  # type: Dict[type, _Reader]
+
+
+def _serialized_writer(serializer: "variables._Serializer[Any, Any]") -> _Writer:
+    to_representation = serializer.to_representation
+
+    def write(value: Any, out: bytearray) -> None:
+        _write_any(to_representation(value), out)
+
+    return write
+
+
+def _serialized_reader(serializer: "variables._Serializer[Any, Any]") -> _Reader:
+    to_internal_value = serializer.to_internal_value
+
+    def read(buf: bytes, pos: int) -> Tuple[Any, int]:
+        value, pos = _read_any(buf, pos)
+        return (None if value is None else to_internal_value(value)), pos
+
+    return read
+
+
+def _item_plan(plan, index):
+    # type: (variables.FieldPlan, int) -> Tuple[variables.FieldPlan, Any]
+    """items of vec and kv are converted by the serializer of container like json marshal does"""
+    item = plan.items[index]
+    serializer = plan.var.serializer if item.kind is not Kind.declared else None
+    return item, serializer
+
+
+def _writer(plan, serializer=None):
+    # type: (variables.FieldPlan, Any) -> _Writer
+    """return a function that appends a not None value of `plan`"""
+    if serializer:
+        return _serialized_writer(serializer)
+    elif plan.kind is Kind.declared:
+        return _get_encoder(plan.type_)
+    elif plan.kind is Kind.vec:
+        write_item = _writer(*_item_plan(plan, 0))
+
+        def write_vec(value: Any, out: bytearray) -> None:
+            n = len(value)
+            _write_uvarint(n, out)
+            start = len(out)
+            size = _bitmap_size(n)
+            out += bytes(size)
+            bits = 0
+            for i, item in enumerate(value):
+                if item is not None:
+                    bits |= 1 << i
+                    write_item(item, out)
+            out[start : start + size] = bits.to_bytes(size, "little")
+
+        return write_vec
+    elif plan.kind is Kind.kv:
+        write_key = _writer(*_item_plan(plan, 0))
+        write_value = _writer(*_item_plan(plan, 1))
+
+        def write_kv(value: Any, out: bytearray) -> None:
+            n = len(value)
+            _write_uvarint(n, out)
+            start = len(out)
+            size = _bitmap_size(n)
+            out += bytes(size)
+            bits = 0
+            for i, (k, v) in enumerate(value.items()):
+                if k is None:
+                    raise MarshalError(f"keys of property `{plan.name}` can't be None")
+                write_key(k, out)
+                if v is not None:
+                    bits |= 1 << i
+                    write_value(v, out)
+            out[start : start + size] = bits.to_bytes(size, "little")
+
+        return write_kv
+    elif plan.kind in (Kind.enum, Kind.serializer):
+        return _serialized_writer(plan.var.serializer)
+    return _scalar_writers.get(plan.type_, _write_any)
+
+
+def _reader(plan, serializer=None):
+    # type: (variables.FieldPlan, Any) -> _Reader
+    """return a function that reads a not None value of `plan`"""
+    if serializer:
+        return _serialized_reader(serializer)
+    elif plan.kind is Kind.declared:
+        return _get_decoder(plan.type_)
+    elif plan.kind is Kind.vec:
+        read_item = _reader(*_item_plan(plan, 0))
+
+        def read_vec(buf: bytes, pos: int) -> Tuple[Any, int]:
+            n, pos = _read_uvarint(buf, pos)
+            size = _bitmap_size(n)
+            bits = int.from_bytes(buf[pos : pos + size], "little")
+            pos += size
+            items: List[Any] = [None] * n
+            for i in range(n):
+                if bits >> i & 1:
+                    items[i], pos = read_item(buf, pos)
+            return items, pos
+
+        return read_vec
+    elif plan.kind is Kind.kv:
+        read_key = _reader(*_item_plan(plan, 0))
+        read_value = _reader(*_item_plan(plan, 1))
+
+        def read_kv(buf: bytes, pos: int) -> Tuple[Any, int]:
+            n, pos = _read_uvarint(buf, pos)
+            size = _bitmap_size(n)
+            bits = int.from_bytes(buf[pos : pos + size], "little")
+            pos += size
+            kvs = {}
+            for i in range(n):
+                k, pos = read_key(buf, pos)
+                if bits >> i & 1:
+                    kvs[k], pos = read_value(buf, pos)
+                else:
+                    kvs[k] = None
+            return kvs, pos
+
+        return read_kv
+    elif plan.kind in (Kind.enum, Kind.serializer):
+        return _serialized_reader(plan.var.serializer)
+    return _scalar_readers.get(plan.type_, _read_any)
@@ -1,2 +1,8 @@
 class MarshalError(Exception):
     ...
+
+
+class LazyDecodeError(MarshalError, AttributeError):
+    """a field kept by a lazy decoder can't be decoded, it is an `AttributeError` as well, so `hasattr`
+    and `getattr` with a default take the field as missing. the original error is its `__cause__`.
+    """
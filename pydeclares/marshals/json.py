@@ -1,12 +1,34 @@
+import codecs
+import io
 import json
+import multiprocessing
+import re
 from collections import UserDict, UserList
-from typing import Any, Dict, List, Type, TypeVar, Union, overload
+from functools import partial
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    overload,
+)
 
-from pydeclares import declares, variables
-from pydeclares.defines import MISSING, Json, JsonData
+from pydeclares import columnar, declares, variables
+from pydeclares.defines import MISSING, Json, JsonData, RawJson
+from pydeclares.exceptions import FieldRequiredError
 from pydeclares.marshals.exceptions import MarshalError
-from pydeclares.typing import Protocol, runtime_checkable
-from pydeclares.utils import issubclass_safe
+from pydeclares.typing import Literal, Protocol, runtime_checkable
+from pydeclares.utils import create_fn, free_threaded, is_binary_file, issubclass_safe, pool_imap
+from pydeclares.variables import Kind
 
 _T = TypeVar("_T")
 _K = TypeVar("_K")
@@ -22,7 +44,7 @@ class _Marshalable(Protocol):
 class Vec(List[_T], UserList):
     def __init__(self, vec: "variables.vec"):
         self.vec = vec
-        self.item_var = variables.compatible_var(vec.item_type)
+        self.item_var = vec.item_var
 
     def _unmarshal_item(self, item: Json, options: "Options"):
         v = _unmarshal_field(self.vec.item_type, self.item_var, item, options)
@@ -31,6 +53,11 @@ class Vec(List[_T], UserList):
         return v
 
     def marshal(self, options: "Options") -> str:
+        if not options.json_dumps:
+            buf: List[str] = []
+            _value_encoder(self.vec, List)(self, options, buf)
+            return "".join(buf)
+
         return json.dumps(
             [_marshal_field(self.vec.item_type, self.vec, i, options) for i in self],
             **options.json_dumps,
@@ -40,8 +67,8 @@ class Vec(List[_T], UserList):
 class KV(Dict[_K, _V], UserDict):
     def __init__(self, kv: "variables.kv"):
         self.kv = kv
-        self.k_var = variables.compatible_var(kv.k_type)
-        self.v_var = variables.compatible_var(kv.v_type)
+        self.k_var = kv.k_var
+        self.v_var = kv.v_var
 
     def _unmarshal_k_v(self, k: Json, v: Json, options: "Options"):
         k_ = _unmarshal_field(self.kv.k_type, self.k_var, k, options)
@@ -53,6 +80,11 @@ class KV(Dict[_K, _V], UserDict):
         return (k_, v_)
 
     def marshal(self, options: "Options"):
+        if not options.json_dumps:
+            buf: List[str] = []
+            _value_encoder(self.kv, Dict)(self, options, buf)
+            return "".join(buf)
+
         return json.dumps(
             {
                 _marshal_field(self.kv.k_type, self.kv, k, options): _marshal_field(self.kv.v_type, self.kv, v, options)
@@ -63,10 +95,14 @@ class KV(Dict[_K, _V], UserDict):
 
 
 class Options:
-    def __init__(self, skip_none_field=False, json_loads={}, json_dumps={}):
+    def __init__(self, skip_none_field=False, json_loads={}, json_dumps={}, trusted=False, lazy=False):
         self.skip_none_field = skip_none_field
         self.json_loads = json_loads
         self.json_dumps = json_dumps
+        # decode without required checking and casting, see `Declared.construct`
+        self.trusted = trusted
+        # keep nested objects and arrays as parsed data until the field is accessed
+        self.lazy = lazy
 
 
 _DT = TypeVar("_DT", bound="declares.Declared")
@@ -76,8 +112,8 @@ _default_options = Options()
 
 
 @overload
-def unmarshal(typ, buf, options=...):
-    # type: (Type[_DT], JsonData, Options) -> _DT
+def unmarshal(typ, buf, options=..., only=...):
+    # type: (Type[_DT], JsonData, Options, Optional[Iterable[str]]) -> _DT
     ...
 
 
@@ -87,59 +123,729 @@ def unmarshal(typ, buf, options=...):
     ...
 
 
+@overload
+def unmarshal(typ, buf, options=..., *, columnar):
+    # type: (variables.vec[_DT], JsonData, Options, Literal[True]) -> columnar.DeclaredArray[_DT]
+    ...
+
+
 @overload
 def unmarshal(typ, buf, options=...):
     # type: (variables.kv[_K, _V], JsonData, Options) -> KV[_K, _V]
     ...
 
 
-def unmarshal(typ, buf: JsonData, options: Options = _default_options):
+def unmarshal(typ, buf: JsonData, options: Options = _default_options, only=None, columnar=False):
+    """`only` is a collection of field paths such as `customer.name` and `items[*].sku`, fields out
+    of them are not decoded and set to MISSING, see `declares._projection`.
+
+    `columnar` decodes a vec of declared objects into a `DeclaredArray`, field values are appended
+    to columns without building objects.
+    """
+    data = _loads(typ, buf, options)
+    if only is not None:
+        return _unmarshal_projected(typ, data, options, frozenset(only))
+    elif columnar:
+        return _unmarshal_columnar(typ, data, options)
+    return _unmarshal_data(typ, data, options)
+
+
+def _unmarshal_columnar(typ, data, options):
+    # type: (variables.vec, Json, Options) -> columnar.DeclaredArray
+    if not isinstance(typ, variables.vec) or not issubclass_safe(typ.item_type, declares.Declared):
+        raise MarshalError(f"only vec of declared class can be unmarshaled into columns, not {typ}")
+    assert isinstance(data, list)
+    array = columnar.DeclaredArray(typ.item_type)
+    _get_columns_decoder(typ.item_type, options.trusted)(data, options, array._appends)
+    array._length = len(data)
+    return array
+
+
+def _raw_fields(marshalable, seen=()):
+    # type: (Type[declares.Declared], Tuple[type, ...]) -> Dict[str, Any]
+    """map field names of fields which hold `RawJson` values to their `_plan_spec`, the json text of
+    those values are sliced verbatim. it is empty when the class has no `RawJson` values.
+    """
+    meta = marshalable.meta
+    if "json_raw_fields" in meta:
+        return meta["json_raw_fields"]
+
+    spec: Dict[str, Any] = {}
+    for plan in declares.field_plan(marshalable):
+        nested = _plan_spec(plan, (*seen, marshalable))
+        if nested is not MISSING:
+            spec[plan.field_name] = nested
+
+    if not seen:
+        meta["json_raw_fields"] = spec
+    return spec
+
+
+class _Each:
+    """spec of all items of an array, or all members of an object"""
+
+    __slots__ = ("item",)
+
+    def __init__(self, item: Any):
+        self.item = item
+
+    def get(self, key: str, default: Any) -> Any:
+        return self.item
+
+
+def _plan_spec(plan, seen):
+    # type: (variables.FieldPlan, Tuple[type, ...]) -> Any
+    """None for a `RawJson` value, a `_raw_fields` mapping for a declared value, `_Each` for a vec or
+    kv, or MISSING if there is no `RawJson` value inside.
+    """
+    if plan.kind is Kind.raw:
+        return None
+    elif plan.kind is Kind.declared:
+        if plan.type_ in seen:
+            return MISSING
+        return _raw_fields(plan.type_, seen) or MISSING
+    elif plan.kind is Kind.vec or plan.kind is Kind.kv:
+        item = _plan_spec(plan.items[-1], seen)
+        return MISSING if item is MISSING else _Each(item)
+    return MISSING
+
+
+def _loads(typ, buf, options):
+    # type: (Any, JsonData, Options) -> Json
+    """parse json text like `json.loads`, but keep the text of `RawJson` values of `typ` as they are"""
+    scanner = _raw_scanner(typ, options.json_loads)
+    if scanner is None:
+        return json.loads(buf, **options.json_loads)
+    return scanner.loads(buf)
+
+
+def _raw_scanner(typ, json_loads):
+    # type: (Any, Dict[str, Any]) -> Optional[_RawScanner]
+    """return a scanner for a declared class or a variable which holds `RawJson` values, or None"""
+    if issubclass_safe(typ, declares.Declared):
+        spec = _raw_fields(typ)
+        if not spec:
+            return None
+        if not json_loads:
+            meta = typ.meta
+            try:
+                return meta["json_raw_scanner"]
+            except KeyError:
+                scanner = meta["json_raw_scanner"] = _RawScanner(spec, json.JSONDecoder())
+                return scanner
+    elif isinstance(typ, variables.Var):
+        spec = _plan_spec(variables.make_plan(typ), ())
+        if spec is MISSING:
+            return None
+    else:
+        return None
+
+    decoder = _json_decoder(json_loads)
+    if not hasattr(decoder, "scan_once"):
+        # a decoder which parses text by itself
+        return None
+    return _RawScanner(spec, decoder)
+
+
+def _json_decoder(json_loads):
+    # type: (Dict[str, Any]) -> json.JSONDecoder
+    """build a decoder from keyword arguments of `json.loads`, whose `cls` picks the decoder class"""
+    loads = dict(json_loads)
+    return (loads.pop("cls", None) or json.JSONDecoder)(**loads)
+
+
+_scanstring = json.decoder.scanstring  # type: ignore
+
+
+class _RawScanner:
+    """parse json text with the scanner of `decoder`, the text of values in `spec` are sliced as
+    `RawJson`, objects and arrays on the way to them are parsed here, see `_plan_spec`.
+    """
+
+    def __init__(self, spec, decoder):
+        # type: (Any, json.JSONDecoder) -> None
+        self.spec = spec
+        self.scan_once = decoder.scan_once
+        self.strict = decoder.strict
+        self.object_hook = decoder.object_hook
+        self.object_pairs_hook = decoder.object_pairs_hook
+
+    def loads(self, buf):
+        # type: (JsonData) -> Json
+        if isinstance(buf, (bytes, bytearray)):
+            buf = buf.decode(json.detect_encoding(buf), "surrogatepass")
+        idx = _WHITESPACE.match(buf, 0).end()  # type: ignore
+        data, end = self.raw_decode(buf, idx)
+        end = _WHITESPACE.match(buf, end).end()  # type: ignore
+        if end != len(buf):
+            raise json.JSONDecodeError("Extra data", buf, end)
+        return data
+
+    def raw_decode(self, s, idx):
+        # type: (str, int) -> Tuple[Json, int]
+        return self._value(s, idx, self.spec)
+
+    def _value(self, s, idx, spec):
+        # type: (str, int, Any) -> Tuple[Json, int]
+        if spec is not None and s.startswith("{", idx):
+            return self._object(s, idx, spec)
+        elif spec.__class__ is _Each and s.startswith("[", idx):
+            return self._array(s, idx, spec.item)
+
+        try:
+            value, end = self.scan_once(s, idx)
+        except StopIteration as err:
+            raise json.JSONDecodeError("Expecting value", s, err.value) from None
+        if spec is None and value is not None:
+            value = RawJson(s[idx:end])
+        return value, end
+
+    def _object(self, s, idx, spec):
+        # type: (str, int, Any) -> Tuple[Json, int]
+        pairs: List[Tuple[str, Json]] = []
+        idx = _WHITESPACE.match(s, idx + 1).end()  # type: ignore
+        if s.startswith("}", idx):
+            return self._build(pairs), idx + 1
+
+        while True:
+            if not s.startswith('"', idx):
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", s, idx)
+            key, idx = _scanstring(s, idx + 1, self.strict)
+            idx = _WHITESPACE.match(s, idx).end()  # type: ignore
+            if not s.startswith(":", idx):
+                raise json.JSONDecodeError("Expecting ':' delimiter", s, idx)
+            idx = _WHITESPACE.match(s, idx + 1).end()  # type: ignore
+
+            nested = spec.get(key, MISSING)
+            if nested is MISSING:
+                try:
+                    value, end = self.scan_once(s, idx)
+                except StopIteration as err:
+                    raise json.JSONDecodeError("Expecting value", s, err.value) from None
+            else:
+                value, end = self._value(s, idx, nested)
+            pairs.append((key, value))
+
+            idx = _WHITESPACE.match(s, end).end()  # type: ignore
+            if s.startswith("}", idx):
+                return self._build(pairs), idx + 1
+            if not s.startswith(",", idx):
+                raise json.JSONDecodeError("Expecting ',' delimiter", s, idx)
+            idx = _WHITESPACE.match(s, idx + 1).end()  # type: ignore
+
+    def _build(self, pairs):
+        # type: (List[Tuple[str, Json]]) -> Any
+        if self.object_pairs_hook is not None:
+            return self.object_pairs_hook(pairs)
+        obj = dict(pairs)
+        return obj if self.object_hook is None else self.object_hook(obj)
+
+    def _array(self, s, idx, item):
+        # type: (str, int, Any) -> Tuple[List[Json], int]
+        values: List[Json] = []
+        idx = _WHITESPACE.match(s, idx + 1).end()  # type: ignore
+        if s.startswith("]", idx):
+            return values, idx + 1
+
+        while True:
+            value, idx = self._value(s, idx, item)
+            values.append(value)
+            idx = _WHITESPACE.match(s, idx).end()  # type: ignore
+            if s.startswith("]", idx):
+                return values, idx + 1
+            if not s.startswith(",", idx):
+                raise json.JSONDecodeError("Expecting ',' delimiter", s, idx)
+            idx = _WHITESPACE.match(s, idx + 1).end()  # type: ignore
+
+
+def _unmarshal_data(typ, data, options):
+    # type: (Any, Json, Options) -> Any
+    """unmarshal data which has been parsed by json decoder"""
     if isinstance(typ, variables.vec):
-        li = json.loads(buf, **options.json_loads)
-        assert isinstance(li, List)
+        assert isinstance(data, List)
         vec = Vec(typ)  # type: ignore
         vec.extend(
             map(
                 lambda item: vec._unmarshal_item(item, options),
-                li,
+                data,
             )
         )
         return vec
     elif isinstance(typ, variables.kv):
-        mapping = json.loads(buf, **options.json_loads)
-        assert isinstance(mapping, Dict)
+        assert isinstance(data, Dict)
         kv = KV(typ)  # type: ignore
         kv.update(
             dict(
                 map(
                     lambda tup: kv._unmarshal_k_v(tup[0], tup[1], options),
-                    mapping.items(),
+                    data.items(),
                 )
             )
         )
         return kv
 
-    return _unmarshal(typ, json.loads(buf, **options.json_loads), options)
+    return _unmarshal(typ, data, options)
+
+
+@overload
+def unmarshal_many(typ, buffers, options=..., workers=..., chunksize=...):
+    # type: (Type[_DT], Iterable[JsonData], Options, Optional[int], int) -> Iterator[_DT]
+    ...
+
+
+@overload
+def unmarshal_many(typ, buffers, options=..., workers=..., chunksize=...):
+    # type: (variables.vec[_T], Iterable[JsonData], Options, Optional[int], int) -> Iterator[Vec[_T]]
+    ...
+
+
+@overload
+def unmarshal_many(typ, buffers, options=..., workers=..., chunksize=...):
+    # type: (variables.kv[_K, _V], Iterable[JsonData], Options, Optional[int], int) -> Iterator[KV[_K, _V]]
+    ...
+
+
+def unmarshal_many(typ, buffers, options=_default_options, workers=None, chunksize=256):
+    """decode many independent json documents in a process pool of `workers`, yield results in the
+    order of `buffers`. documents are sent to workers by chunks of `chunksize`, every worker compiles
+    decoders of `typ` once when it starts. `typ` must be importable by workers, i.e. defined at
+    module level.
+
+    >>> persons = list(json.unmarshal_many(Person, lines, workers=8))
+    """
+    return pool_imap(_unmarshal_chunk, buffers, workers, chunksize, _init_worker, (typ, options))
+
+
+_worker = (None, _default_options)  # type: Tuple[Any, Options]
+
+
+def _init_worker(typ, options):
+    # type: (Any, Options) -> None
+    global _worker
+    _worker = (typ, options)
+    if isinstance(typ, variables.vec):
+        typ = typ.item_type
+    elif isinstance(typ, variables.kv):
+        typ = typ.v_type
+    _warm(typ, options, set())
+
+
+def _warm(typ, options, seen):
+    # type: (Any, Options, set) -> None
+    """compile decoders of a declared class and its nested declared classes"""
+    if not issubclass_safe(typ, declares.Declared) or typ in seen:
+        return
+    seen.add(typ)
+    _get_decoder(typ, options.trusted, options.lazy)
+    for plan in declares.field_plan(typ):
+        for p in (plan, *plan.items):
+            _warm(p.type_, options, seen)
+
+
+def _unmarshal_chunk(buffers):
+    # type: (List[JsonData]) -> List[Any]
+    typ, options = _worker
+    return [unmarshal(typ, buf, options) for buf in buffers]
+
+
+@overload
+def iter_unmarshal(typ, fp, chunk_size=..., options=...):
+    # type: (Type[_DT], IO[Any], int, Options) -> Iterator[_DT]
+    ...
+
+
+@overload
+def iter_unmarshal(typ, fp, chunk_size=..., options=...):
+    # type: (variables.vec[_T], IO[Any], int, Options) -> Iterator[_T]
+    ...
+
+
+def iter_unmarshal(typ, fp, chunk_size=65536, options=_default_options):
+    """decode a json array from a text or binary file object incrementally and yield its items one by one,
+    `typ` is a vec or the declared class of array items. the file is read by chunks of `chunk_size`,
+    so memory is bounded by the size of a single item instead of the whole array. `MarshalError` is
+    raised for a malformed item as soon as it has been read.
+
+    >>> with open("persons.json", "rb") as fp:
+    >>>     for person in json.iter_unmarshal(Person, fp):
+    >>>         ...
+    """
+    vec = Vec(typ if isinstance(typ, variables.vec) else variables.vec(typ))
+    decoder = _raw_scanner(vec.item_var, options.json_loads) or _json_decoder(options.json_loads)
+    for item in _ArrayReader(fp, chunk_size, decoder):
+        yield vec._unmarshal_item(item, options)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# strings, a quote which starts an unterminated string, brackets and commas
+_STRUCTURE = re.compile(r'"(?:[^"\\]|\\.)*"|"|[\[\]{},]', re.S)
+
+
+class _ArrayReader:
+    """scan items of a json array from a file object, only the unconsumed part of file is buffered"""
+
+    def __init__(self, fp, chunk_size, decoder):
+        # type: (IO[Any], int, Union[json.JSONDecoder, _RawScanner]) -> None
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = decoder
+        self.text_decoder: Optional[codecs.IncrementalDecoder] = None
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        # type: (int) -> bool
+        """read at least `size` characters more into buffer, return False at the end of file"""
+        if self.eof:
+            return False
+
+        chunk = self.fp.read(size)
+        self.eof = not chunk
+        if isinstance(chunk, (bytes, bytearray)):
+            if self.text_decoder is None:
+                # encoding detection needs the first four bytes
+                while 0 < len(chunk) < 4:
+                    more = self.fp.read(4 - len(chunk))
+                    if not more:
+                        break
+                    chunk += more
+                self.text_decoder = codecs.getincrementaldecoder(json.detect_encoding(chunk))("surrogatepass")
+            chunk = self.text_decoder.decode(chunk, self.eof)
+        self.buf = self.buf[self.pos :] + chunk
+        self.pos = 0
+        return not self.eof
+
+    def _next_char(self):
+        # type: () -> str
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()  # type: ignore
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk_size):
+                return ""
+
+    def _decode_value(self):
+        # type: () -> Any
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as e:
+                if self._is_complete():
+                    # more data won't help, stop before the rest of file is buffered
+                    raise MarshalError(f"invalid array item at char {self.pos}: {e}") from e
+                # the value may be truncated by chunk, grow buffer geometrically to keep re-scanning linear
+                if self._fill(max(self.chunk_size, len(self.buf) - self.pos)):
+                    continue
+                raise
+
+            # number and literal at the end of buffer may be continued in next chunk
+            if end == len(self.buf) and self._fill(self.chunk_size):
+                continue
+
+            self.pos = end
+            return obj
+
+    def _is_complete(self):
+        # type: () -> bool
+        """whether the buffer holds the whole item at `pos`, that is, brackets are balanced and the
+        item is followed by a delimiter, regardless of whether it is valid json
+        """
+        depth = 0
+        for m in _STRUCTURE.finditer(self.buf, self.pos):
+            token = m.group()
+            if token == '"':
+                # an unterminated string
+                return False
+            elif token[0] == '"':
+                if depth == 0:
+                    return True
+            elif token in "[{":
+                depth += 1
+            elif token in "]}":
+                depth -= 1
+                if depth <= 0:
+                    return True
+            elif depth == 0:
+                return True
+        return False
+
+    def __iter__(self):
+        # type: () -> Iterator[Any]
+        if self._next_char() != "[":
+            raise json.JSONDecodeError("Expecting '['", self.buf, self.pos)
+        self.pos += 1
+
+        if self._next_char() == "]":
+            self.pos += 1
+        else:
+            while True:
+                yield self._decode_value()
+                char = self._next_char()
+                self.pos += 1
+                if char == "]":
+                    break
+                elif char != ",":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", self.buf, self.pos - 1)
+                self._next_char()
+
+        if self._next_char():
+            raise json.JSONDecodeError("Extra data", self.buf, self.pos)
+
+
+_Decoder = Callable[[Dict[str, Json], Options], "declares.Declared"]
+_ColumnsDecoder = Callable[[List[Json], Options, Tuple[Callable[[Any], None], ...]], None]
 
 
 def _unmarshal(marshalable, data: Json, options: Options):
     # type: (Type[declares.Declared], Json, Options) -> declares.Declared
-    assert isinstance(data, Dict)
-    if not data:
-        return marshalable()
+    assert isinstance(data, dict)
+    return _get_decoder(marshalable, options.trusted, options.lazy)(data, options)
+
+
+def _get_decoder(marshalable, trusted=False, lazy=False):
+    # type: (Type[declares.Declared], bool, bool) -> Callable[[Dict[str, Json], Options], declares.Declared]
+    key = f"json{'_trusted' if trusted else ''}{'_lazy' if lazy else ''}_decoder"
+    meta = marshalable.meta
+    try:
+        return meta[key]
+    except KeyError:
+        decoder = meta[key] = _compile_decoder(marshalable, trusted, lazy)
+        return decoder
+
+
+def _get_columns_decoder(marshalable, trusted=False):
+    # type: (Type[declares.Declared], bool) -> _ColumnsDecoder
+    key = "json_trusted_columns_decoder" if trusted else "json_columns_decoder"
+    meta = marshalable.meta
+    try:
+        return meta[key]
+    except KeyError:
+        decoder = meta[key] = _compile_columns_decoder(marshalable, trusted)
+        return decoder
+
+
+def _compile_columns_decoder(marshalable, trusted=False):
+    # type: (Type[declares.Declared], bool) -> _ColumnsDecoder
+    """generate a function that decodes a list of json objects and appends their field values to
+    columns by `appends`, the append functions of fields in order. fields are checked and casted
+    as `_compile_decoder` does, but no objects are built. classes which customize initialization
+    are decoded into objects first.
+    """
+    plans = declares.field_plan(marshalable)
+    appends = [f"_a{i}" for i in range(len(plans))]
+    locals_: Dict[str, Any] = {
+        "cls": marshalable,
+        "MISSING": MISSING,
+        "MarshalError": MarshalError,
+        "FieldRequiredError": FieldRequiredError,
+        "_unmarshal": _unmarshal,
+    }
+    body = [f"{', '.join(appends)}, = appends" if plans else "pass", "for data in rows:"]
+    body.extend(["  if data is None:", "    raise MarshalError('items of columns can not be null')"])
+    direct = trusted or (
+        marshalable.__init__ is declares.Declared.__init__
+        and marshalable.__post_init__ is declares.Declared.__post_init__
+        and all(p.var.init for p in plans)
+    )
+    if not direct:
+        body.append("  self = _unmarshal(cls, data, options)")
+        body.extend(f"  {append}(self.{plan.name})" for append, plan in zip(appends, plans))
+    else:
+        body.append("  get = data.get")
+    for i, plan in enumerate(plans if direct else ()):
+        locals_[f"_t{i}"] = plan.type_
+        lines = [f"value = get({plan.field_name!r}, MISSING)", "if value is MISSING:"]
+        if plan.make_default is None:
+            lines.append("  value = None")
+        else:
+            locals_[f"_d{i}"] = plan.make_default
+            lines.append(f"  value = _d{i}()")
+        lines.extend(_decode_field_lines(i, plan, locals_, True, trusted))
+        lines.append(f"_a{i}(value)")
+        body.extend(f"  {line}" for line in lines)
+    return create_fn(f"__decode_columns_{marshalable.__name__}", ["rows", "options", "appends"], body, locals=locals_)
+
 
-    init_kwargs = {}
-    for field in declares.fields(marshalable):
-        field_value = data.get(field.field_name, MISSING)
-        if field_value is MISSING:
-            field_value = field.make_default()
+def _unmarshal_projected(marshalable, data, options, only):
+    # type: (Type[declares.Declared], Json, Options, FrozenSet[str]) -> declares.Declared
+    assert isinstance(data, dict)
+    decoders = marshalable.meta.setdefault("json_projected_decoders", {})
+    key = (only, options.trusted)
+    try:
+        decoder = decoders[key]
+    except KeyError:
+        projection = declares._projection(marshalable, only)
+        decoder = decoders[key] = _compile_decoder(marshalable, options.trusted, projection=projection)
+    return decoder(data, options)
 
-        if not field.type_checking(field_value):
-            field_value = _unmarshal_field(field.type_, field, field_value, options)
 
-        init_kwargs[field.name] = field_value
+def _projected(only):
+    # type: (FrozenSet[str]) -> Callable[[Type[declares.Declared], Json, Options], declares.Declared]
+    return lambda marshalable, data, options: _unmarshal_projected(marshalable, data, options, only)
 
-    return marshalable(**init_kwargs)
+
+def _decode_field(marshalable, name, value, options):
+    # type: (Type[declares.Declared], str, Json, Options) -> Any
+    """decode the json value of one field with the field plan, for values kept by lazy decoding,
+    see `Declared.__getattr__`, and values of patches, see `apply_merge_patch`.
+    """
+    key = (name, options.trusted)
+    decoders = marshalable.meta.setdefault("json_field_decoders", {})
+    try:
+        decoder = decoders[key]
+    except KeyError:
+        plan = next(p for p in declares.field_plan(marshalable) if p.name == name)
+        locals_ = {"_t0": plan.type_, "FieldRequiredError": FieldRequiredError, "_unmarshal": _unmarshal}
+        body = [*_decode_field_lines(0, plan, locals_, True, options.trusted), "return value"]
+        decoder = decoders[key] = create_fn(f"__decode_{name}", ["value", "options"], body, locals=locals_)
+    return decoder(value, options)
+
+
+def _compile_decoder(marshalable, trusted=False, lazy=False, projection=None):
+    # type: (Type[declares.Declared], bool, bool, Optional[declares._Projection]) -> _Decoder
+    """generate a decode function for one declared class.
+
+    the generated function merges field checking of `_unmarshal_field` and `Declared.__init__`,
+    so every value is checked and casted only once. it still calls `marshalable(**kwargs)` when
+    the class customizes initialization, which keeps `__init__` and `init=False` semantic unchanged.
+
+    a trusted decoder builds nested objects and applies serializers only, it assigns fields
+    like `Declared.construct` does.
+
+    a lazy decoder puts json objects and arrays of nested fields into `self._lazy` instead of
+    decoding them, `Declared.__getattr__` decodes them on first access. lazy decoding is ignored
+    when the class has to be initialized by `marshalable(**kwargs)`, or it is slotted without `lazy=True`.
+
+    a projected decoder decodes fields in `projection` only and sets others to MISSING.
+    """
+    plans = declares.field_plan(marshalable)
+    direct = (
+        trusted
+        or projection is not None
+        or (marshalable.__init__ is declares.Declared.__init__ and all(p.var.init for p in plans))
+    )
+    # instances of slotted classes have no `_lazy` slot unless they are declared with `lazy=True`
+    lazy = lazy and direct and projection is None and bool(marshalable.__dictoffset__ or "lazy" in marshalable.meta)
+    locals_: Dict[str, Any] = {
+        "cls": marshalable,
+        "new": marshalable.__new__,
+        "MISSING": MISSING,
+        "FieldRequiredError": FieldRequiredError,
+        "_unmarshal": _unmarshal,
+    }
+    body = ["if not data:", "  return cls()"] if projection is None else []
+    body.extend(["get = data.get", "self = new(cls)" if direct else "kwargs = {}"])
+    if lazy:
+        body.append("lazy = {}")
+    for i, plan in enumerate(plans):
+        unmarshal = "_unmarshal"
+        if projection is not None:
+            if plan.name not in projection:
+                body.append(f"self.{plan.name} = MISSING")
+                continue
+            if projection[plan.name] is not None:
+                locals_[f"_u{i}"] = _projected(projection[plan.name])  # type: ignore
+                unmarshal = f"_u{i}"
+
+        locals_[f"_t{i}"] = plan.type_
+        body.append(f"value = get({plan.field_name!r}, MISSING)")
+        lines = ["if value is MISSING:"]
+        if plan.make_default is None:
+            lines.append("  value = None")
+        else:
+            locals_[f"_d{i}"] = plan.make_default
+            lines.append(f"  value = _d{i}()")
+        lines.extend(_decode_field_lines(i, plan, locals_, direct, trusted, unmarshal))
+        lines.append(f"self.{plan.name} = value" if direct else f"kwargs[{plan.name!r}] = value")
+        if lazy and plan.kind in (Kind.declared, Kind.vec, Kind.kv):
+            body.extend(["if value.__class__ is dict or value.__class__ is list:", f"  lazy[{plan.name!r}] = value"])
+            body.append("else:")
+            body.extend(f"  {line}" for line in lines)
+        else:
+            body.extend(lines)
+
+    if not direct:
+        body.append("return cls(**kwargs)")
+    else:
+        if lazy:
+            body.extend(["if lazy:", "  self._lazy = (lazy, options)"])
+        if not trusted and projection is None and marshalable.__post_init__ is not declares.Declared.__post_init__:
+            body.append("self.__post_init__()")
+        body.extend(["self._is_empty = False", "return self"])
+
+    return create_fn(f"__decode_{marshalable.__name__}", ["data", "options"], body, locals=locals_)
+
+
+def _decode_field_lines(i, plan, locals_, direct, trusted=False, unmarshal="_unmarshal"):
+    # type: (int, variables.FieldPlan, Dict[str, Any], bool, bool, str) -> List[str]
+    field = plan.var
+    if plan.kind is Kind.vec:
+        locals_[f"_k{i}"] = field.type_checking
+        check = f"_k{i}(value)"
+        # `vec.type_checking` walks the whole list, trusted data is converted without it
+        lines = ["if value is not None:" if trusted else f"if value is not None and not {check}:"]
+        if plan.items[0].kind is Kind.declared:
+            locals_[f"_it{i}"] = plan.items[0].type_
+            lines.append(f"  assert isinstance(value, list), 'field `{field.name}` must be an array'")
+            lines.append(f"  value = [None if x is None else {unmarshal}(_it{i}, x, options) for x in value]")
+            check = ""
+        elif field.serializer:
+            locals_[f"_s{i}"] = field.serializer.to_internal_value
+            lines.append(f"  assert isinstance(value, list), 'field `{field.name}` must be an array'")
+            lines.append(f"  value = [None if x is None else _s{i}(x) for x in value]")
+        else:
+            lines = []
+    elif plan.kind is Kind.kv:
+        locals_[f"_k{i}"] = field.type_checking
+        check = f"_k{i}(value)"
+        lines = []
+        if plan.items[1].kind is Kind.declared:
+            locals_[f"_vt{i}"] = plan.items[1].type_
+            lines.append("if value is not None:")
+            lines.append(f"  assert isinstance(value, dict), 'field `{field.name}` must be an object'")
+            lines.append(
+                f"  value = {{k: x if x is None or isinstance(x, _vt{i}) else {unmarshal}(_vt{i}, x, options)"
+                " for k, x in value.items()}"
+            )
+    elif plan.kind is Kind.declared:
+        lines = [
+            f"if value is not None and not isinstance(value, _t{i}):",
+            f"  value = {unmarshal}(_t{i}, value, options)",
+        ]
+        check = ""
+    elif plan.kind is Kind.raw:
+        # values which were not sliced from json text have been parsed already
+        locals_.update({"_RawJson": RawJson, "_dumps": _default_encoder.encode})
+        lines = ["if value is not None and value.__class__ is not _RawJson:", "  value = _RawJson(_dumps(value))"]
+        check = ""
+    else:
+        if isinstance(plan.type_, type):
+            check = f"isinstance(value, _t{i})"
+        else:
+            locals_[f"_k{i}"] = field.type_checking
+            check = f"_k{i}(value)"
+        lines = []
+        if field.serializer:
+            locals_[f"_s{i}"] = field.serializer.to_internal_value
+            lines.extend([f"if value is not None and not {check}:", f"  value = _s{i}(value)"])
+
+    if not direct or trusted:
+        return lines
+
+    # checking and casting which are done by `Declared._setattr` before
+    locals_[f"_c{i}"] = field.cast_it
+    if field.required:
+        locals_[f"_e{i}"] = (
+            f"field `{field.name}` is required. if you couldn't know whether it is existed or not, "
+            f"set a default value or default factory function to this field for erase this error."
+        )
+        lines.extend(["if value is None:", f"  raise FieldRequiredError(_e{i})"])
+        if check:
+            lines.extend([f"elif not {check}:", f"  value = _c{i}(value)"])
+    elif check:
+        lines.extend([f"if value is not None and not {check}:", f"  value = _c{i}(value)"])
+    return lines
 
 
 def _unmarshal_field(typ, field, value, options: Options):
@@ -167,41 +873,771 @@ def _unmarshal_field(typ, field, value, options: Options):
 def marshal(
     unmarshalable_or_declared: Union[_Marshalable, "declares.Declared"],
     options: Options = _default_options,
+    include: Optional[Iterable[str]] = None,
+    exclude: Optional[Iterable[str]] = None,
 ) -> str:
+    """`include` and `exclude` are field paths of a declared object to serialize or omit,
+    such as `customer.name` and `items[*].sku`, see `declares._mask`.
+    """
     if isinstance(unmarshalable_or_declared, declares.Declared):
-        data = _marshal_declared(unmarshalable_or_declared, options)
+        masked = include is not None or exclude is not None
+        if not options.json_dumps:
+            buf: List[str] = []
+            if masked:
+                _get_masked_encoder(unmarshalable_or_declared.__class__, (include, exclude))(
+                    unmarshalable_or_declared, options, buf
+                )
+            else:
+                _marshal_into(unmarshalable_or_declared, options, buf)
+            return "".join(buf)
+
+        mask = declares._mask(unmarshalable_or_declared.__class__, include, exclude) if masked else None
+        data = _marshal_declared(unmarshalable_or_declared, options, mask)
         return json.dumps(data, **options.json_dumps)
     else:
         return unmarshalable_or_declared.marshal(options)
 
 
-def _marshal_declared(declared: "declares.Declared", options: Options) -> Dict[str, Json]:
+def marshal_changes(declared, options=_default_options, paths=None):
+    # type: (declares.Declared, Options, Optional[Iterable[str]]) -> str
+    """encode fields of `paths` only as a partial object, which can be applied as a RFC 7396 merge
+    patch. paths are the same as `Declared.changed_fields` which is taken by default, nested objects
+    in paths such as `customer.email` are encoded partially as well.
+    """
+    tree = _path_tree(declared.changed_fields() if paths is None else paths)
+    return json.dumps(_changes_data(declared, tree, options), **options.json_dumps)
+
+
+def marshal_patch(declared, options=_default_options, paths=None):
+    # type: (declares.Declared, Options, Optional[Iterable[str]]) -> str
+    """encode fields of `paths` as RFC 6902 operations, see `marshal_changes`. every field is an
+    "add" operation, which replaces the member if it exists, or a "remove" operation when it is None
+    and `skip_none_field` is set.
+    """
+    tree = _path_tree(declared.changed_fields() if paths is None else paths)
+    ops: List[Dict[str, Any]] = []
+    _patch_ops(declared, tree, options, "", ops)
+    return json.dumps(ops, **options.json_dumps)
+
+
+_PathTree = Dict[str, Optional[Dict[str, Any]]]
+
+
+def _path_tree(paths):
+    # type: (Iterable[str]) -> _PathTree
+    """map `a.b` and `a.c` to {"a": {"b": None, "c": None}}, None means the whole field"""
+    tree: _PathTree = {}
+    for path in sorted(paths, key=len):
+        node: Optional[Dict[str, Any]] = tree
+        names = path.split(".")
+        for name in names[:-1]:
+            node = node.setdefault(name, {})  # type: ignore
+            if node is None:
+                break
+        else:
+            node[names[-1]] = None  # type: ignore
+    return tree
+
+
+def _changes_data(declared, tree, options):
+    # type: (declares.Declared, _PathTree, Options) -> Dict[str, Json]
+    data = {}
+    for plan in declares.field_plan(declared):
+        if plan.name not in tree or plan.var.ignore_serialize:
+            continue
+        value = getattr(declared, plan.name)
+        sub = tree[plan.name]
+        if sub is not None and isinstance(value, declares.Declared):
+            data[plan.field_name] = _changes_data(value, sub, options)
+            continue
+        value = _marshal_field(plan.type_, plan.var, value, options)
+        if value is None and options.skip_none_field:
+            continue
+        data[plan.field_name] = value
+    return data
+
+
+def _patch_ops(declared, tree, options, pointer, ops):
+    # type: (declares.Declared, _PathTree, Options, str, List[Dict[str, Any]]) -> None
+    for plan in declares.field_plan(declared):
+        if plan.name not in tree or plan.var.ignore_serialize:
+            continue
+        path = f"{pointer}/{plan.field_name.replace('~', '~0').replace('/', '~1')}"
+        value = getattr(declared, plan.name)
+        sub = tree[plan.name]
+        if sub is not None and isinstance(value, declares.Declared):
+            _patch_ops(value, sub, options, path, ops)
+            continue
+        value = _marshal_field(plan.type_, plan.var, value, options)
+        if value is None and options.skip_none_field:
+            ops.append({"op": "remove", "path": path})
+        else:
+            ops.append({"op": "add", "path": path, "value": value})
+
+
+def apply_merge_patch(declared, patch, options=_default_options):
+    # type: (declares.Declared, Union[JsonData, Dict[str, Json]], Options) -> None
+    """apply a RFC 7396 merge patch to `declared` in place. members of the patch are decoded with
+    the field plan and assigned field by field, objects are merged into nested declared objects and
+    kv fields, null removes a member, which sets an optional field to None. unknown members are
+    ignored as decoding does.
+    """
+    if isinstance(patch, (str, bytes, bytearray)):
+        patch = json.loads(patch, **options.json_loads)
+    if not isinstance(patch, dict):
+        raise MarshalError("merge patch must be an object")
+    _merge(declared, patch, options)
+
+
+def _merge(declared, patch, options):
+    # type: (declares.Declared, Dict[str, Json], Options) -> None
+    plans = _field_name_plans(declared.__class__)
+    for key, value in patch.items():
+        plan = plans.get(key)
+        if plan is None:
+            continue
+        _check_merge_value(plan, key, value)
+        # objects are merged into current values, anything else replaces them
+        current = getattr(declared, plan.name) if value.__class__ is dict else None
+        if plan.kind is Kind.declared and isinstance(current, declares.Declared):
+            _merge(current, value, options)  # type: ignore
+        elif plan.kind is Kind.kv and isinstance(current, dict):
+            _merge_kv(declared, plan, current, value, options)  # type: ignore
+        else:
+            setattr(declared, plan.name, _decode_field(declared.__class__, plan.name, value, options))
+
+
+def _merge_kv(declared, plan, current, patch, options):
+    # type: (declares.Declared, variables.FieldPlan, Dict[Any, Any], Dict[str, Json], Options) -> None
+    items = {}
+    for k, v in patch.items():
+        key = _decode_key(plan, k, options)
+        if v is None:
+            current.pop(key, None)
+        elif v.__class__ is dict and isinstance(current.get(key), declares.Declared):
+            _merge(current[key], v, options)  # type: ignore
+        else:
+            items[k] = v
+    current.update(_decode_field(declared.__class__, plan.name, items, options))
+    # assign it again, which reports the change to tracking and caching
+    setattr(declared, plan.name, current)
+
+
+_MERGE_SHAPES = {Kind.declared: dict, Kind.kv: dict, Kind.vec: list}
+
+
+def _check_merge_value(plan, path, value):
+    # type: (variables.FieldPlan, str, Json) -> None
+    """declared and kv fields take objects, vec fields take arrays, null removes any of them.
+    items of vec and kv are checked as well.
+    """
+    shape = _MERGE_SHAPES.get(plan.kind)
+    if shape is None or value is None:
+        return
+    if value.__class__ is not shape:
+        expect = "an object" if shape is dict else "an array"
+        raise MarshalError(f"merge patch of `{path}` must be {expect} or null, not {type(value).__name__}")
+    if plan.kind is Kind.vec:
+        for i, item in enumerate(value):  # type: ignore
+            _check_merge_value(plan.items[-1], f"{path}/{i}", item)
+    elif plan.kind is Kind.kv:
+        for k, item in value.items():  # type: ignore
+            _check_merge_value(plan.items[-1], f"{path}/{k}", item)
+
+
+def apply_patch(declared, ops, options=_default_options):
+    # type: (declares.Declared, Union[JsonData, List[Dict[str, Json]]], Options) -> None
+    """apply RFC 6902 operations to `declared` in place. pointers address fields by their json names,
+    items of vec fields by indexes and items of kv fields by keys. values are decoded with the field
+    plan, `move` and `copy` encode the source value and decode it at the target. items of kv
+    fields are replaced as a whole.
+
+    operations are applied in order, `MarshalError` is raised for an invalid operation or a failed
+    `test`, operations before it stay applied. removing a field sets it to None.
+    """
+    if isinstance(ops, (str, bytes, bytearray)):
+        ops = json.loads(ops, **options.json_loads)
+    if not isinstance(ops, list):
+        raise MarshalError("json patch must be an array of operations")
+
+    for op in ops:
+        try:
+            name, path = op["op"], op["path"]
+        except (KeyError, TypeError) as e:
+            raise MarshalError(f"invalid json patch operation {op!r}") from e
+        apply = _PATCH_OPERATIONS.get(name) if isinstance(name, str) else None
+        if apply is None:
+            raise MarshalError(f"unknown json patch operation `{name}`")
+        apply(declared, path, op, options)
+
+
+def _operand(op, member):
+    # type: (Dict[str, Json], str) -> Json
+    try:
+        return op[member]
+    except KeyError:
+        raise MarshalError(f"invalid json patch operation {op!r}") from None
+
+
+def _patch_add(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    value = _operand(op, "value")
+    _resolve(declared, path, options).add(value, options)
+
+
+def _patch_remove(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    _resolve(declared, path, options).remove(options)
+
+
+def _patch_replace(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    value = _operand(op, "value")
+    _resolve(declared, path, options).replace(value, options)
+
+
+def _patch_test(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    value = _operand(op, "value")
+    if _resolve(declared, path, options).encode(options) != value:
+        raise MarshalError(f"test of `{path}` failed")
+
+
+def _patch_copy(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    source = _operand(op, "from")
+    target = _resolve(declared, path, options)
+    target.add(_resolve(declared, source, options).encode(options), options)
+
+
+def _patch_move(declared, path, op, options):
+    # type: (declares.Declared, str, Dict[str, Json], Options) -> None
+    source = _operand(op, "from")
+    if path.startswith(f"{source}/"):
+        raise MarshalError(f"can't move `{source}` into itself")
+    # the target must be valid before the source is removed
+    _resolve(declared, path, options)
+    origin = _resolve(declared, source, options)
+    value = origin.encode(options)
+    origin.remove(options)
+    # indexes of the target may be moved by the removal, so it is resolved again
+    _resolve(declared, path, options).add(value, options)
+
+
+_PATCH_OPERATIONS = {
+    "add": _patch_add,
+    "remove": _patch_remove,
+    "replace": _patch_replace,
+    "test": _patch_test,
+    "copy": _patch_copy,
+    "move": _patch_move,
+}  # type: Dict[str, Callable[[declares.Declared, str, Dict[str, Json], Options], None]]
+
+
+def _field_name_plans(marshalable):
+    # type: (Type[declares.Declared]) -> Dict[str, variables.FieldPlan]
+    meta = marshalable.meta
+    try:
+        return meta["json_field_names"]
+    except KeyError:
+        plans = meta["json_field_names"] = {plan.field_name: plan for plan in declares.field_plan(marshalable)}
+        return plans
+
+
+def _decode_key(plan, key, options):
+    # type: (variables.FieldPlan, str, Options) -> Any
+    field = plan.var
+    k = _unmarshal_field(field.k_type, field.k_var, key, options)
+    if not field.k_var.type_checking(k):
+        k = field.k_var.cast_it(k)
+    return k
+
+
+class _Target:
+    """a location of a json pointer, which is field `plan` of `owner`, or the item at `key` of it.
+    `token` is the json key of a kv item.
+    """
+
+    def __init__(self, owner, plan, key=MISSING, token=""):
+        # type: (declares.Declared, variables.FieldPlan, Any, str) -> None
+        self.owner = owner
+        self.plan = plan
+        self.key = key
+        self.token = token
+
+    def get(self) -> Any:
+        value = getattr(self.owner, self.plan.name)
+        if self.key is MISSING:
+            return value
+        try:
+            return value[self.key]
+        except (IndexError, KeyError):
+            raise MarshalError(f"`{self.plan.name}` has no item {self.key!r}") from None
+
+    def encode(self, options: Options) -> Json:
+        plan = self.plan
+        value = self.get()
+        if self.key is MISSING:
+            return _marshal_field(plan.type_, plan.var, value, options)
+        elif plan.kind is Kind.vec:
+            return _marshal_field(plan.type_, plan.var, [value], options)[0]  # type: ignore
+        return next(iter(_marshal_field(plan.type_, plan.var, {self.key: value}, options).values()))  # type: ignore
+
+    def _container(self) -> Any:
+        value = getattr(self.owner, self.plan.name)
+        if value is None:
+            raise MarshalError(f"`{self.plan.name}` is None")
+        return value
+
+    def _decode(self, value: Json, options: Options) -> Any:
+        cls, name = self.owner.__class__, self.plan.name
+        if self.key is MISSING:
+            return _decode_field(cls, name, value, options)
+        elif self.plan.kind is Kind.vec:
+            return _decode_field(cls, name, [value], options)[0]
+        return next(iter(_decode_field(cls, name, {self.token: value}, options).values()))
+
+    def _assign(self, container: Any) -> None:
+        # assign the container again, which reports the change to tracking and caching
+        setattr(self.owner, self.plan.name, container)
+
+    def add(self, value: Json, options: Options) -> None:
+        if self.key is MISSING:
+            setattr(self.owner, self.plan.name, self._decode(value, options))
+            return
+        container = self._container()
+        if self.plan.kind is Kind.vec:
+            if self.key > len(container):
+                raise MarshalError(f"`{self.plan.name}` has no item {self.key!r}")
+            container.insert(self.key, self._decode(value, options))
+        else:
+            container[self.key] = self._decode(value, options)
+        self._assign(container)
+
+    def replace(self, value: Json, options: Options) -> None:
+        # the location must exist, unlike `add`
+        self.get()
+        if self.key is MISSING or self.plan.kind is Kind.kv:
+            self.add(value, options)
+            return
+        container = self._container()
+        container[self.key] = self._decode(value, options)
+        self._assign(container)
+
+    def remove(self, options: Options) -> None:
+        if self.key is MISSING:
+            # removing a field decodes None, which is refused by required fields
+            setattr(self.owner, self.plan.name, self._decode(None, options))
+            return
+        self.get()
+        container = self._container()
+        del container[self.key]
+        self._assign(container)
+
+
+def _resolve(declared, pointer, options):
+    # type: (declares.Declared, str, Options) -> _Target
+    if not pointer.startswith("/"):
+        raise MarshalError(f"invalid json pointer `{pointer}`")
+    target: Optional[_Target] = None
+    for token in pointer[1:].split("/"):
+        token = token.replace("~1", "/").replace("~0", "~")
+        value = declared if target is None else target.get()
+        if isinstance(value, declares.Declared):
+            plan = _field_name_plans(value.__class__).get(token)
+            if plan is None:
+                raise MarshalError(f"`{value.__class__.__name__}` has no field `{token}` of `{pointer}`")
+            target = _Target(value, plan)
+        elif target is not None and target.key is MISSING and target.plan.kind is Kind.vec and value is not None:
+            if token == "-":
+                index = len(value)
+            elif token.isdigit() and (token == "0" or not token.startswith("0")):
+                index = int(token)
+            else:
+                raise MarshalError(f"invalid array index `{token}` of `{pointer}`")
+            target = _Target(target.owner, target.plan, index)
+        elif target is not None and target.key is MISSING and target.plan.kind is Kind.kv and value is not None:
+            target = _Target(target.owner, target.plan, _decode_key(target.plan, token, options), token)
+        else:
+            raise MarshalError(f"`{pointer}` doesn't point to a field or an item")
+    assert target is not None
+    return target
+
+
+def marshal_parallel(value, options=_default_options, workers=None, chunksize=4096, fp=None):
+    # type: (Vec[Any], Options, Optional[int], int, Optional[IO[Any]]) -> Optional[str]
+    """encode a large vec into one json array by shards of `chunksize` items in a pool of `workers`.
+    the array is written into a text or binary file object shard by shard if `fp` is given,
+    otherwise it is returned. the output is as same as `marshal(value, options)`, but it can't be
+    indented.
+
+    shards are encoded in threads on free-threaded python, otherwise in processes. forked worker
+    processes inherit `value` and only get offsets of shards, where fork is not available `value`
+    is pickled to every worker once. a vec of at most one shard is encoded in the calling thread.
+
+    >>> with open("export.json", "w") as fp:
+    >>>     json.marshal_parallel(orders, workers=8, fp=fp)
+    """
+    if options.json_dumps.get("indent") is not None:
+        raise ValueError("parallel encoded json array can't be indented")
+
+    if len(value) <= chunksize:
+        shards = _marshal_chunk(value, value.vec, options)  # type: Iterable[str]
+    elif free_threaded():
+        encode_chunk = partial(_marshal_chunk, spec=value.vec, options=options)
+        shards = pool_imap(encode_chunk, value, workers, chunksize, threads=True)
+    else:
+        fork = "fork" in multiprocessing.get_all_start_methods()
+        shards = pool_imap(
+            _marshal_shards,
+            range(0, len(value), chunksize),
+            workers,
+            1,
+            _init_encode_worker,
+            (value, chunksize, options),
+            mp_context=multiprocessing.get_context("fork") if fork else None,
+        )
+
+    out = io.StringIO() if fp is None else fp
+    write = out.write
+    if fp is not None and is_binary_file(fp):
+        write = lambda s: fp.write(s.encode("utf-8"))  # noqa: E731
+    separator = (options.json_dumps.get("separators") or (", ", ": "))[0]
+    write("[")
+    first = True
+    for shard in shards:
+        if not shard:
+            continue
+        if not first:
+            write(separator)
+        first = False
+        write(shard)
+    write("]")
+    return out.getvalue() if fp is None else None  # type: ignore
+
+
+_encode_worker = (None, 0, _default_options)  # type: Tuple[Any, int, Options]
+
+
+def _init_encode_worker(value, chunksize, options):
+    # type: (Vec[Any], int, Options) -> None
+    global _encode_worker
+    _encode_worker = (value, chunksize, options)
+
+
+def _marshal_shards(starts):
+    # type: (List[int]) -> List[str]
+    value, chunksize, options = _encode_worker
+    return [shard for start in starts for shard in _marshal_chunk(value[start : start + chunksize], value.vec, options)]
+
+
+def _marshal_chunk(items, spec, options):
+    # type: (List[Any], variables.vec, Options) -> List[str]
+    """encode items into a shard of json array, items are separated but not bracketed"""
+    if options.json_dumps:
+        separator = (options.json_dumps.get("separators") or (", ", ": "))[0]
+        shard = separator.join(
+            json.dumps(_marshal_field(spec.item_type, spec, item, options), **options.json_dumps) for item in items
+        )
+        return [shard]
+
+    buf: List[str] = []
+    encode = _value_encoder(spec, spec.item_type)
+    for item in items:
+        if buf:
+            buf.append(", ")
+        encode(item, options, buf)
+    return ["".join(buf)]
+
+
+# encoders below write json text into a buffer directly, their output is as same as `json.dumps`
+# with default arguments, so they are only used when `Options.json_dumps` is empty.
+_default_encoder = json.JSONEncoder()
+_encode_str = json.encoder.encode_basestring_ascii  # type: ignore
+_Encoder = Callable[[Any, Options, List[str]], None]
+
+
+def _encode_float(o: float) -> str:
+    if o != o:
+        return "NaN"
+    elif o == json.encoder.INFINITY:  # type: ignore
+        return "Infinity"
+    elif o == -json.encoder.INFINITY:  # type: ignore
+        return "-Infinity"
+    return float.__repr__(o)
+
+
+def _scalar_encoder(field, typ):
+    # type: (variables.Var, type) -> Callable[[Any], str]
+    """return a function that encodes a not None scalar value of `field`, as same as `_marshal_field`"""
+
+    def encode(value: Any) -> str:
+        cls = value.__class__
+        if cls is str:
+            return _encode_str(value)
+        elif cls is RawJson:
+            return value
+        elif cls is int:
+            return int.__repr__(value)
+        elif cls is float:
+            return _encode_float(value)
+        elif value is True:
+            return "true"
+        elif value is False:
+            return "false"
+        elif value is None:
+            return "null"
+        elif not isinstance(value, Json.__args__):  # type: ignore
+            raise MarshalError(f"can't marshal property `{field.name}` which are `{typ!r}`")
+        return _default_encoder.encode(value)
+
+    return encode
+
+
+def _key_encoder(field, typ):
+    # type: (variables.Var, type) -> Callable[[Any], str]
+    encode = _scalar_encoder(field, typ)
+    serializer = field.serializer
+
+    def encode_key(key: Any) -> str:
+        if key is not None and serializer:
+            key = serializer.to_representation(key)
+        if isinstance(key, str):
+            return _encode_str(key)
+        elif key is None or isinstance(key, (int, float)):
+            return f'"{encode(key)}"'
+        raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+    return encode_key
+
+
+def _value_encoder(field, typ, mask=None):
+    # type: (variables.Var, type, Optional[declares._SubMask]) -> _Encoder
+    """return a function that appends the json text of a value of `typ` into buffer,
+    `field` is the variable which holds this value. `mask` is applied to declared objects in it.
+    """
+    if issubclass_safe(typ, declares.Declared):
+        return _declared_encoder(mask)
+    elif typ is List and isinstance(field, variables.vec):
+        return _vec_encoder(field, mask)
+    elif typ is Dict and isinstance(field, variables.kv):
+        return _kv_encoder(field, mask)
+    return _scalar_value_encoder(field, typ)
+
+
+def _declared_encoder(mask):
+    # type: (Optional[declares._SubMask]) -> _Encoder
+    if mask is None:
+        return _marshal_into
+
+    def encode_declared(value: Any, options: Options, buf: List[str]):
+        if value is None:
+            buf.append("null")
+        else:
+            _get_masked_encoder(value.__class__, mask)(value, options, buf)  # type: ignore
+
+    return encode_declared
+
+
+def _vec_encoder(field, mask):
+    # type: (variables.vec, Optional[declares._SubMask]) -> _Encoder
+    encode_item = _value_encoder(field, field.item_type, mask)
+
+    def encode_vec(value: Any, options: Options, buf: List[str]):
+        if value is None:
+            buf.append("null")
+            return
+
+        buf.append("[")
+        first = True
+        for item in value:
+            if first:
+                first = False
+            else:
+                buf.append(", ")
+            encode_item(item, options, buf)
+        buf.append("]")
+
+    return encode_vec
+
+
+def _kv_encoder(field, mask):
+    # type: (variables.kv, Optional[declares._SubMask]) -> _Encoder
+    encode_key = _key_encoder(field, field.k_type)
+    encode_value = _value_encoder(field, field.v_type, mask)
+
+    def encode_kv(value: Any, options: Options, buf: List[str]):
+        if value is None:
+            buf.append("null")
+            return
+
+        buf.append("{")
+        first = True
+        for k, v in value.items():
+            if first:
+                first = False
+            else:
+                buf.append(", ")
+            buf.append(encode_key(k))
+            buf.append(": ")
+            encode_value(v, options, buf)
+        buf.append("}")
+
+    return encode_kv
+
+
+def _scalar_value_encoder(field, typ):
+    # type: (variables.Var, type) -> _Encoder
+    encode = _scalar_encoder(field, typ)
+    serializer = field.serializer
+
+    def encode_scalar(value: Any, options: Options, buf: List[str]):
+        if value is not None and serializer:
+            value = serializer.to_representation(value)
+        buf.append("null" if value is None else encode(value))
+
+    return encode_scalar
+
+
+def _marshal_into(declared: Any, options: Options, buf: List[str]) -> None:
+    if declared is None:
+        buf.append("null")
+        return
+
+    _get_encoder(declared.__class__)(declared, options, buf)
+
+
+def _get_masked_encoder(marshalable, mask):
+    # type: (Type[declares.Declared], Tuple[Optional[Iterable[str]], Optional[Iterable[str]]]) -> _Encoder
+    include, exclude = mask
+    key = (
+        None if include is None else frozenset(include),
+        None if exclude is None else frozenset(exclude),
+    )
+    encoders = marshalable.meta.setdefault("json_masked_encoders", {})
+    try:
+        return encoders[key]
+    except KeyError:
+        encoder = encoders[key] = _compile_encoder(marshalable, declares._mask(marshalable, *key))
+        return encoder
+
+
+def _get_encoder(marshalable):
+    # type: (Type[declares.Declared]) -> _Encoder
+    meta = marshalable.meta
+    try:
+        return meta["json_encoder"]
+    except KeyError:
+        encoder = meta["json_encoder"] = _compile_encoder(marshalable)
+        return encoder
+
+
+def _compile_encoder(marshalable, mask=None):
+    # type: (Type[declares.Declared], Optional[declares._Mask]) -> _Encoder
+    """generate an encode function for one declared class, which appends precomputed `"field_name": `
+    fragments and field values into buffer without building an intermediate dict.
+
+    nested fields which are still kept by a lazy decoder and have not been assigned are written
+    from their parsed data directly, unless `skip_none_field` has to drop nulls inside them.
+
+    a masked encoder writes fields in `mask` only, and applies their nested masks to nested objects.
+    """
+    locals_: Dict[str, Any] = {"_encode_str": _encode_str, "_dumps": _default_encoder.encode, "_unset": _unset}
+    body = ["append = buf.append", "skip_none = options.skip_none_field", "append('{')", "start = len(buf)"]
+    plans = declares.field_plan(marshalable)
+    if any(p.kind in (Kind.declared, Kind.vec, Kind.kv) for p in plans):
+        body.extend(["raw = self._lazy", "raw = raw[0] if raw is not None and not skip_none else None"])
+    for i, plan in enumerate(plans):
+        field = plan.var
+        if field.ignore_serialize or (mask is not None and plan.name not in mask):
+            continue
+
+        sub = None if mask is None or mask[plan.name] == (None, None) else mask[plan.name]
+        key = f", {_encode_str(plan.field_name)}: "
+        lines = [f"value = self.{plan.name}"]
+        if plan.kind in (Kind.declared, Kind.vec, Kind.kv):
+            locals_[f"_e{i}"] = _value_encoder(field, plan.type_, sub)
+            encode = [f"_e{i}(value, options, buf)"]
+        elif plan.kind is Kind.raw:
+            encode = ["append(value)"]
+        else:
+            if field.serializer:
+                locals_[f"_s{i}"] = field.serializer.to_representation
+                lines.extend(["if value is not None:", f"  value = _s{i}(value)"])
+            locals_[f"_j{i}"] = _scalar_encoder(field, plan.type_)
+            encode = [f"append(_encode_str(value) if value.__class__ is str else _j{i}(value))"]
+
+        lines.extend(
+            [
+                "if value is None:",
+                "  if not skip_none:",
+                f"    append({key + 'null'!r})",
+                "else:",
+                f"  append({key!r})",
+                *(f"  {line}" for line in encode),
+            ]
+        )
+        if plan.kind in (Kind.declared, Kind.vec, Kind.kv) and sub is None:
+            body.extend(
+                [
+                    f"if raw and {plan.name!r} in raw and _unset(self, {plan.name!r}):",
+                    f"  append({key!r})",
+                    f"  append(_dumps(raw[{plan.name!r}]))",
+                    "else:",
+                    *(f"  {line}" for line in lines),
+                ]
+            )
+        else:
+            body.extend(lines)
+
+    # strip the leading separator of first field
+    body.extend(["if len(buf) > start:", "  buf[start] = buf[start][2:]", "append('}')"])
+    return create_fn(f"__encode_{marshalable.__name__}", ["self", "options", "buf"], body, locals=locals_)
+
+
+def _unset(declared, name):
+    # type: (declares.Declared, str) -> bool
+    """whether a field has not been assigned, without triggering lazy decoding"""
+    try:
+        object.__getattribute__(declared, name)
+    except AttributeError:
+        return True
+    return False
+
+
+def _marshal_declared(declared, options, mask=None):
+    # type: (declares.Declared, Options, Optional[declares._Mask]) -> Dict[str, Json]
     kv = {}
-    for field in declares.fields(declared):
-        if field.ignore_serialize:
+    for plan in declares.field_plan(declared):
+        field = plan.var
+        if field.ignore_serialize or (mask is not None and plan.name not in mask):
             continue
 
-        value = _marshal_field(field.type_, field, getattr(declared, field.name), options)
+        sub = None if mask is None or mask[plan.name] == (None, None) else mask[plan.name]
+        value = _marshal_field(plan.type_, field, getattr(declared, plan.name), options, sub)
         if value is None and options.skip_none_field:
             continue
 
-        kv[field.field_name] = value
+        kv[plan.field_name] = value
     return kv
 
 
-def _marshal_field(typ, field, value, options):
+def _marshal_field(typ, field, value, options, mask=None):
     if value is None:
         return None
     elif issubclass_safe(typ, declares.Declared):
-        return _marshal_declared(value, options)
+        return _marshal_declared(value, options, mask and declares._mask(value.__class__, *mask))
     elif issubclass_safe(typ, List):
-        return [_marshal_field(field.item_type, field, v, options) for v in value]
+        return [_marshal_field(field.item_type, field, v, options, mask) for v in value]
     elif issubclass_safe(typ, Dict):
         return {
-            _marshal_field(field.k_type, field, k, options): _marshal_field(field.v_type, field, v, options)
+            _marshal_field(field.k_type, field, k, options): _marshal_field(field.v_type, field, v, options, mask)
             for k, v in value.items()
         }
 
+    elif isinstance(value, RawJson):
+        return json.loads(value)
+
     if field.serializer:
         value = field.serializer.to_representation(value)
 
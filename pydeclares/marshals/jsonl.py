@@ -0,0 +1,79 @@
+"""JSON Lines (NDJSON) support, one json document per line.
+
+>>> with open("events.jsonl", "w") as fp:
+>>>     jsonl.dump_many(events, fp)
+
+>>> with open("events.jsonl") as fp:
+>>>     for event in jsonl.iter_load(Event, fp):
+>>>         ...
+"""
+from typing import IO, Any, Iterable, Iterator, List, Type, TypeVar, Union, overload
+
+from pydeclares import declares, variables
+from pydeclares.marshals import json as json_marshal
+from pydeclares.utils import is_binary_file
+
+_T = TypeVar("_T")
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+Options = json_marshal.Options
+_default_options = Options()
+
+
+def dump_many(marshalables, fp, options=_default_options, batch_size=1024):
+    # type: (Iterable[Union[json_marshal._Marshalable, declares.Declared]], IO[Any], Options, int) -> int
+    """write one json document per line into a text or binary file object, return the number of lines.
+    lines are buffered and written by batches of `batch_size`.
+    """
+    if options.json_dumps.get("indent") is not None:
+        raise ValueError("json lines can't be indented")
+
+    binary = is_binary_file(fp)
+    buf: List[str] = []
+    count = 0
+    for marshalable in marshalables:
+        if not options.json_dumps and isinstance(marshalable, declares.Declared):
+            json_marshal._marshal_into(marshalable, options, buf)
+        else:
+            buf.append(json_marshal.marshal(marshalable, options))
+        buf.append("\n")
+        count += 1
+        if count % batch_size == 0:
+            _write(fp, buf, binary)
+            buf = []
+
+    if buf:
+        _write(fp, buf, binary)
+    return count
+
+
+@overload
+def iter_load(typ, fp, options=...):
+    # type: (Type[_DT], IO[Any], Options) -> Iterator[_DT]
+    ...
+
+
+@overload
+def iter_load(typ, fp, options=...):
+    # type: (variables.vec[_T], IO[Any], Options) -> Iterator[json_marshal.Vec[_T]]
+    ...
+
+
+def iter_load(typ, fp, options=_default_options):
+    """read a text or binary file object line by line and yield one unmarshaled object per line,
+    blank lines are skipped.
+    """
+    scanner = json_marshal._raw_scanner(typ, options.json_loads)
+    decode = json_marshal._json_decoder(options.json_loads).decode if scanner is None else scanner.loads
+    for line in fp:
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        yield json_marshal._unmarshal_data(typ, decode(line), options)
+
+
+def _write(fp, buf, binary):
+    # type: (IO[Any], List[str], bool) -> None
+    data = "".join(buf)
+    fp.write(data.encode("utf-8") if binary else data)
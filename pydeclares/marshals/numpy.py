@@ -0,0 +1,137 @@
+"""conversions between declared objects and numpy structured arrays, numpy is only required by this module.
+
+`int`, `float`, `complex` and `bool` fields become int64, float64, complex128 and bool columns,
+`bytes` fields with a declared size become fixed-width bytes columns, other fields are kept as
+objects. None values are NaN in float and complex columns, they can't be held by int and bool columns.
+"""
+
+from array import array
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Type, TypeVar, Union
+
+import numpy as np
+
+from pydeclares import declares, variables
+from pydeclares.columnar import DeclaredArray
+from pydeclares.marshals.exceptions import MarshalError
+from pydeclares.variables import Kind
+
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+
+def dtype(cls: Type["declares.Declared"]) -> np.dtype:
+    """return the structured dtype of a declared class"""
+    meta = cls.meta
+    try:
+        return meta["numpy_dtype"]
+    except KeyError:
+        dt = meta["numpy_dtype"] = np.dtype([(plan.name, _field_dtype(plan)) for plan in declares.field_plan(cls)])
+        return dt
+
+
+def _field_dtype(plan: variables.FieldPlan) -> Any:
+    field = plan.var
+    if plan.kind is Kind.scalar:
+        if isinstance(field, variables.Int):
+            return np.int64
+        elif isinstance(field, variables.Float):
+            return np.float64
+        elif isinstance(field, variables.Complex):
+            return np.complex128
+        elif isinstance(field, variables.Bytes) and field.size is not None:
+            return f"S{field.size}"
+        elif plan.type_ is bool:
+            return np.bool_
+    return object
+
+
+def to_numpy(values, cls=None, fixed_width=False):
+    # type: (Union[Sequence[_DT], DeclaredArray[_DT]], Optional[Type[_DT]], bool) -> np.ndarray
+    """convert declared objects into a structured array, column by column. `values` is a sequence of
+    declared objects such as a decoded vec, or a `DeclaredArray` whose numeric columns are copied
+    without any python loop. `cls` is required when `values` is an empty sequence.
+
+    if `fixed_width` is True, str and bytes columns which are kept as objects are converted to
+    fixed-width columns of their longest value, unless they have None values.
+    """
+    if isinstance(values, DeclaredArray):
+        cls = values.cls
+    elif cls is None:
+        if not values:
+            raise TypeError("cls is required to convert an empty sequence")
+        cls = values[0].__class__
+
+    dt = dtype(cls)
+    columns: Dict[str, np.ndarray] = {}
+    for plan in declares.field_plan(cls):
+        name = plan.name
+        field_dtype = dt.fields[name][0]
+        if isinstance(values, DeclaredArray) and isinstance(values._columns[name], array):
+            nulls = values._nulls.get(name)
+            if nulls and field_dtype.kind != "f":
+                raise MarshalError(f"field `{name}` has None values which {field_dtype} can't hold")
+            col = np.array(values._columns[name], dtype=field_dtype)
+            if nulls:
+                col[list(nulls)] = np.nan
+        elif isinstance(values, DeclaredArray):
+            col = _column(values._columns[name], field_dtype, name)  # type: ignore
+        else:
+            col = _column(list(map(attrgetter(name), values)), field_dtype, name)
+        if fixed_width and field_dtype.kind == "O" and plan.kind is Kind.scalar and plan.type_ in (str, bytes):
+            fixed = np.array(col.tolist())
+            if fixed.dtype.kind in "US":
+                col = fixed
+        columns[name] = col
+
+    out = np.empty(len(values), dtype=[(name, col.dtype) for name, col in columns.items()])
+    for name, col in columns.items():
+        out[name] = col
+    return out
+
+
+def _column(values: List[Any], field_dtype: np.dtype, name: str) -> np.ndarray:
+    if field_dtype.kind == "O":
+        # assign items one by one, otherwise nested lists are taken as dimensions
+        col = np.empty(len(values), dtype=object)
+        col[:] = values
+        return col
+    elif field_dtype.kind in "bi" and None in values:
+        raise MarshalError(f"field `{name}` has None values which {field_dtype} can't hold")
+    try:
+        return np.array(values, dtype=field_dtype)
+    except TypeError as e:
+        raise MarshalError(f"field `{name}` has values which {field_dtype} can't hold: {e}") from e
+
+
+def from_numpy(cls: Type[_DT], ndarray: np.ndarray, columnar: bool = False) -> Union[List[_DT], DeclaredArray[_DT]]:
+    """convert a structured array into declared objects, or a `DeclaredArray` if `columnar` is True.
+    columns are matched with fields by names, missing fields get their defaults or None and values are
+    assigned without validation as `Declared.construct` does. NaN values of optional float and complex
+    fields become None.
+    """
+    names = ndarray.dtype.names
+    if names is None:
+        raise TypeError("ndarray must be a structured array")
+
+    plans = {plan.name: plan for plan in declares.field_plan(cls)}
+    columns: Dict[str, Iterable[Any]] = {}
+    for name in names:
+        plan = plans.get(name)
+        if plan is None:
+            continue
+        col = ndarray[name]
+        values = col.tolist()
+        if not plan.var.required and col.dtype.kind in "fc" and np.isnan(col).any():
+            values = [None if v != v else v for v in values]
+        columns[name] = values
+
+    if columnar:
+        declared_array = DeclaredArray(cls)
+        declared_array.extend_columns(columns)  # type: ignore
+        return declared_array
+
+    if not columns:
+        return [cls.construct() for _ in range(len(ndarray))]
+    schema = tuple(columns)
+    rebuild = declares._rebuild
+    return [rebuild(cls, schema, row) for row in zip(*columns.values())]
@@ -0,0 +1,340 @@
+"""fixed layout records for declared classes whose fields are all `int`, `float`, `complex`, `bool`
+or `bytes` with a declared size, such as `var(bytes, size=16)`.
+
+a record is packed by a precompiled `struct.Struct`: a presence mask of optional fields if there
+are any, then fields in the order of `fields()`. integers are signed 64 bits, floats are doubles,
+complex numbers are two doubles, bytes must have exactly their size, all are little endian.
+"""
+
+import mmap
+import os
+import struct
+import zlib
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+    overload,
+)
+
+from pydeclares import declares, variables
+from pydeclares.marshals.exceptions import MarshalError
+from pydeclares.utils import create_fn
+from pydeclares.variables import Kind
+
+_DT = TypeVar("_DT", bound="declares.Declared")
+
+_MAGIC = b"PDRF"
+_HEADER_SIZE = 8
+_MASK_FORMATS = ((8, "B"), (16, "H"), (32, "I"), (64, "Q"))
+
+_Buffer = Union[bytes, bytearray, memoryview, mmap.mmap]
+
+
+class RecordLayout:
+    """struct layout of one declared class, see `layout`"""
+
+    def __init__(self, cls: Type["declares.Declared"]):
+        self.cls = cls
+        plans = [p for p in declares.field_plan(cls) if not p.var.ignore_serialize]
+        optional = [p.name for p in plans if not p.var.required]
+        mask_format = next((f for n, f in _MASK_FORMATS if len(optional) <= n), None) if optional else ""
+        if mask_format is None:
+            raise TypeError(f"`{cls.__name__}` has more than 64 optional fields")
+
+        formats = [_field_format(cls, p) for p in plans]
+        self.struct = struct.Struct("<" + mask_format + "".join(formats))
+        self.size = self.struct.size
+        fingerprint = f"{self.struct.format}:{','.join(p.name for p in plans)}"
+        self.header = _MAGIC + zlib.crc32(fingerprint.encode()).to_bytes(4, "little")
+
+        # name -> (struct of the field, offset in record, bit in presence mask)
+        self.fields: Dict[str, Tuple[struct.Struct, int, int]] = {}
+        offset = struct.calcsize("<" + mask_format)
+        for plan, format in zip(plans, formats):
+            bit = 1 << optional.index(plan.name) if plan.name in optional else 0
+            self.fields[plan.name] = (struct.Struct("<" + format), offset, bit)
+            offset += struct.calcsize("<" + format)
+        self._mask = struct.Struct("<" + mask_format) if optional else None
+
+        self._pack = _compile_pack(cls, plans, optional, self.struct)
+        self._unpack = _compile_unpack(cls, plans, optional, self.struct)
+
+    def pack(self, obj: "declares.Declared") -> bytes:
+        try:
+            return self._pack(obj)
+        except struct.error as e:
+            raise MarshalError(f"can't pack `{self.cls.__name__}` into record: {e}") from e
+
+    def unpack(self, buf: _Buffer, offset: int = 0) -> Any:
+        """build an instance from the record at `offset`, without validation as `Declared.construct`"""
+        return self._unpack(buf, offset)
+
+    def get(self, buf: _Buffer, offset: int, name: str) -> Any:
+        """unpack one field from the record at `offset`"""
+        st, field_offset, bit = self.fields[name]
+        if bit and not self._mask.unpack_from(buf, offset)[0] & bit:  # type: ignore
+            return None
+        value = st.unpack_from(buf, offset + field_offset)
+        return complex(*value) if len(value) == 2 else value[0]
+
+
+def layout(cls: Type["declares.Declared"]) -> RecordLayout:
+    """return the record layout of a declared class, TypeError is raised when a field has no fixed size"""
+    meta = cls.meta
+    try:
+        return meta["record_layout"]
+    except KeyError:
+        record_layout = meta["record_layout"] = RecordLayout(cls)
+        return record_layout
+
+
+def _field_format(cls, plan):
+    # type: (Type[declares.Declared], variables.FieldPlan) -> str
+    field = plan.var
+    if plan.kind is Kind.scalar:
+        if isinstance(field, variables.Int):
+            return "q"
+        elif isinstance(field, variables.Float):
+            return "d"
+        elif isinstance(field, variables.Complex):
+            return "dd"
+        elif isinstance(field, variables.Bytes) and field.size is not None:
+            return f"{field.size}s"
+        elif plan.type_ is bool:
+            return "?"
+    raise TypeError(f"field `{plan.name}` of `{cls.__name__}` has no fixed size layout")
+
+
+def _compile_pack(cls, plans, optional, st):
+    # type: (Type[declares.Declared], List[variables.FieldPlan], List[str], struct.Struct) -> Callable[[Any], bytes]
+    locals_: Dict[str, Any] = {"pack": st.pack, "MarshalError": MarshalError}
+    body = ["mask = 0"] if optional else []
+    args = ["mask"] if optional else []
+    for i, plan in enumerate(plans):
+        field = plan.var
+        body.append(f"v{i} = self.{plan.name}")
+        if isinstance(field, variables.Bytes):
+            # shorter values would be padded with zeros and could not be told apart on unpack
+            body.extend(
+                [
+                    f"if v{i} is not None and len(v{i}) != {field.size}:",
+                    f"  raise MarshalError('field `{plan.name}` is not {field.size} bytes')",
+                ]
+            )
+        if plan.name in optional:
+            zero = "b''" if isinstance(field, variables.Bytes) else "0"
+            body.extend(
+                [f"if v{i} is None:", f"  v{i} = {zero}", "else:", f"  mask |= {1 << optional.index(plan.name)}"]
+            )
+        if isinstance(field, variables.Complex):
+            body.append(f"v{i} = complex(v{i})")
+            args.extend([f"v{i}.real", f"v{i}.imag"])
+        else:
+            args.append(f"v{i}")
+    body.append(f"return pack({', '.join(args)})")
+    return create_fn(f"__pack_{cls.__name__}", ["self"], body, locals=locals_)
+
+
+def _compile_unpack(cls, plans, optional, st):
+    # type: (Type[declares.Declared], List[variables.FieldPlan], List[str], struct.Struct) -> Callable[..., Any]
+    locals_: Dict[str, Any] = {"cls": cls, "new": cls.__new__, "unpack_from": st.unpack_from}
+    names = ["mask"] if optional else []
+    lines = []
+    for i, plan in enumerate(plans):
+        if isinstance(plan.var, variables.Complex):
+            names.extend([f"v{i}", f"v{i}_"])
+            value = f"complex(v{i}, v{i}_)"
+        else:
+            names.append(f"v{i}")
+            value = f"v{i}"
+        if plan.name in optional:
+            value = f"{value} if mask & {1 << optional.index(plan.name)} else None"
+        lines.append(f"self.{plan.name} = {value}")
+    for i, plan in enumerate(declares.field_plan(cls)):
+        if plan.var.ignore_serialize:
+            locals_[f"_d{i}"] = plan.make_default
+            lines.append(f"self.{plan.name} = {f'_d{i}()' if plan.make_default else 'None'}")
+
+    body = [f"{', '.join(names)}, = unpack_from(buf, offset)"] if names else []
+    body.extend(["self = new(cls)", *lines, "self._is_empty = False", "return self"])
+    return create_fn(f"__unpack_{cls.__name__}", ["buf", "offset"], body, locals=locals_)
+
+
+class RecordView:
+    """read-only view of one record, fields are unpacked from the buffer on every access.
+    it is valid as long as the buffer is, call `materialize` to get a declared instance.
+    """
+
+    __slots__ = ("_layout", "_buf", "_offset")
+
+    def __init__(self, layout: RecordLayout, buf: _Buffer, offset: int):
+        self._layout = layout
+        self._buf = buf
+        self._offset = offset
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in self._layout.fields:
+            raise AttributeError(f"{self._layout.cls.__name__!r} record has no attribute {name!r}")
+        return self._layout.get(self._buf, self._offset, name)
+
+    def materialize(self) -> Any:
+        return self._layout.unpack(self._buf, self._offset)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, RecordView):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __repr__(self):
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._layout.fields)
+        return f"{self._layout.cls.__name__}View({args})"
+
+
+class RecordFile(Generic[_DT]):
+    """an append-only file of fixed layout records, which is memory mapped for random access.
+
+    >>> with RecordFile(Sample, "samples.rec") as records:
+    >>>     records.append(sample)
+    >>>     last = records[-1]
+    >>>     window = records[1000:2000]
+
+    indexing returns declared instances, or `RecordView`s if `views` is True. slices return
+    `RecordSlice`s which unpack records on access. the file starts with a header carrying the
+    layout fingerprint, `MarshalError` is raised when it is opened with another layout.
+    """
+
+    def __init__(self, cls: Type[_DT], path: Union[str, "os.PathLike[str]"], views: bool = False):
+        self.cls = cls
+        self.layout = layout(cls)
+        self.views = views
+        self._fp = open(path, "a+b")
+        self._mmap = None  # type: Optional[mmap.mmap]
+        # every mapping which has been made, old ones may be still read by views
+        self._mmaps = []  # type: List[mmap.mmap]
+        try:
+            self._size = self._fp.seek(0, os.SEEK_END)
+            if self._size == 0:
+                self._fp.write(self.layout.header)
+                self._size = _HEADER_SIZE
+            else:
+                self._fp.seek(0)
+                if self._fp.read(_HEADER_SIZE) != self.layout.header:
+                    raise MarshalError(f"`{path}` is not a record file of `{cls.__name__}`")
+                if (self._size - _HEADER_SIZE) % self.layout.size:
+                    raise MarshalError(f"`{path}` ends with a partial record")
+        except BaseException:
+            self._fp.close()
+            raise
+
+    def __len__(self) -> int:
+        return (self._size - _HEADER_SIZE) // self.layout.size
+
+    def append(self, obj: _DT) -> None:
+        self._fp.write(self.layout.pack(obj))
+        self._size += self.layout.size
+
+    def extend(self, objs: Iterable[_DT]) -> None:
+        pack = self.layout.pack
+        data = b"".join([pack(obj) for obj in objs])
+        self._fp.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        self._fp.flush()
+
+    def _buffer(self) -> mmap.mmap:
+        mm = self._mmap
+        if mm is None or len(mm) < self._size:
+            # map again to see appended records, views keep old mappings alive
+            self._fp.flush()
+            mm = self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmaps.append(mm)
+        return mm
+
+    def _get(self, index: int) -> Any:
+        offset = _HEADER_SIZE + index * self.layout.size
+        if self.views:
+            return RecordView(self.layout, self._buffer(), offset)
+        return self.layout.unpack(self._buffer(), offset)
+
+    @overload
+    def __getitem__(self, index: int) -> _DT:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "RecordSlice[_DT]":
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return RecordSlice(self, range(len(self))[index])
+
+        n = len(self)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("record index out of range")
+        return self._get(index)
+
+    def __iter__(self) -> Iterator[_DT]:
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def close(self) -> None:
+        """close the file and its mappings, views and slices of records can't be read after it"""
+        for mm in self._mmaps:
+            mm.close()
+        self._mmaps.clear()
+        self._mmap = None
+        self._fp.close()
+
+    def __enter__(self) -> "RecordFile[_DT]":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __repr__(self):
+        return f"RecordFile({self.cls.__name__}, {self._fp.name!r}, records={len(self)})"
+
+
+class RecordSlice(Generic[_DT]):
+    """a lazy slice of a record file, records are unpacked when they are accessed"""
+
+    def __init__(self, file: RecordFile[_DT], indices: range):
+        self.file = file
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @overload
+    def __getitem__(self, index: int) -> _DT:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "RecordSlice[_DT]":
+        ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return RecordSlice(self.file, self.indices[index])
+        return self.file._get(self.indices[index])
+
+    def __iter__(self) -> Iterator[_DT]:
+        get = self.file._get
+        for i in self.indices:
+            yield get(i)
+
+    def __repr__(self):
+        return f"RecordSlice({self.file!r}, {self.indices!r})"
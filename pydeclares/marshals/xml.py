@@ -1,12 +1,15 @@
+import re
 from collections import UserList
-from typing import Any, Dict, List, Optional, Type, TypeVar, Union, overload
+from typing import IO, Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Type, TypeVar, Union, overload
 from xml.etree import ElementTree as ET
 
 from pydeclares import declares, variables
+from pydeclares.columnar import DeclaredArray
 from pydeclares.defines import MISSING
 from pydeclares.marshals.exceptions import MarshalError
-from pydeclares.typing import Protocol, runtime_checkable
-from pydeclares.utils import isinstance_safe, issubclass_safe
+from pydeclares.typing import Literal, Protocol, runtime_checkable
+from pydeclares.utils import issubclass_safe, pool_imap, xml_prettify
+from pydeclares.variables import Kind
 
 _Literal = Union[str, int, float, bool, None]
 _T = TypeVar("_T")
@@ -18,7 +21,11 @@ class Vec(List[_T], UserList):
         # type: (str, variables.vec) -> None
         self.vec = vec
         self.tag = tag
-        self.item_var = variables.compatible_var(vec.item_type, field_name=vec.field_name)
+        self.item_var = vec.item_var
+
+    def dump_parts(self, options):
+        # type: (Options) -> _Parts
+        return {}, None, [(_tag_name(item.__class__), item) for item in self]
 
     def marshal(self, options):
         # type: (Options) -> ET.Element
@@ -45,8 +52,8 @@ _default_options = Options()
 
 
 @overload
-def unmarshal(marshalable, elem, options=...):
-    # type: (Type[_DT], ET.Element, Options) -> _DT
+def unmarshal(marshalable, elem, options=..., only=...):
+    # type: (Type[_DT], ET.Element, Options, Optional[Iterable[str]]) -> _DT
     ...
 
 
@@ -56,81 +63,264 @@ def unmarshal(marshalable, elem, options=...):
     ...
 
 
-def unmarshal(marshalable, elem, options=_default_options):
-    # type: (Union[variables.vec, Type[declares.Declared]], ET.Element, Options) -> Union[Vec, declares.Declared]
+@overload
+def unmarshal(marshalable, elem, options=..., *, columnar):
+    # type: (variables.vec[_DT], ET.Element, Options, Literal[True]) -> DeclaredArray[_DT]
+    ...
+
+
+def unmarshal(marshalable, elem, options=_default_options, only=None, columnar=False):
+    # type: (Union[variables.vec, Type[declares.Declared]], ET.Element, Options, Optional[Iterable[str]], bool) -> Any
+    """`only` is a collection of field paths of declared class, see `declares._projection`.
+    `columnar` decodes a vec of declared objects into a `DeclaredArray`, every item is decoded
+    and appended to columns one by one.
+    """
     if isinstance(marshalable, variables.vec):
         assert marshalable.field_name
+        tag = marshalable.field_name
+        subs = [sub for sub in elem if sub.tag == tag] if _PLAIN_TAG.fullmatch(tag) else elem.findall(tag)
+        items = (unmarshal(marshalable.item_type, sub, options) for sub in subs)
+        if columnar:
+            if not issubclass_safe(marshalable.item_type, declares.Declared):
+                raise MarshalError(f"only vec of declared class can be unmarshaled into columns, not {marshalable}")
+            return DeclaredArray(marshalable.item_type, items)
         vec = Vec(elem.tag, marshalable)
-        subs = elem.findall(marshalable.field_name)
-        vec.extend(unmarshal(marshalable.item_type, sub, options) for sub in subs)
+        vec.extend(items)
         return vec
     elif issubclass_safe(marshalable, declares.Declared):
-        return _unmarshal_declared(marshalable, elem, options)
+        projection = None if only is None else declares._projection(marshalable, frozenset(only))
+        return _unmarshal_declared(marshalable, elem, options, projection)
 
     raise MarshalError(f"type {marshalable} is not unmarshalable")
 
 
-def _unmarshal_declared(typ, elem, options):
-    # type: (Type[_DT], ET.Element, Options) -> _DT
-    init_kwargs: Dict[str, Any] = {}
-    field_value: Any
-    for field in declares.fields(typ):
-        if field.as_xml_attr:
-            field_value = elem.get(field.field_name, MISSING)
-            if field_value is None or field_value == "":
-                field_value = MISSING
-        elif field.as_xml_text:
-            field_value = elem.text
-            if field_value is None or field_value == "":
-                field_value = MISSING
-        elif isinstance(field, variables.vec):
-            subs = elem.findall(field.field_name)
-            field_value = [unmarshal(field.item_type, sub, options) for sub in subs]
-        elif issubclass_safe(field.type_, declares.Declared):
-            sub = elem.find(field.field_name)
-            if sub is not None:
-                field_value = unmarshal(field.type_, sub, options)
-            else:
-                field_value = MISSING
-        else:
-            field_value = getattr(elem.find(field.field_name), "text", MISSING)
-            if field_value is None:
-                field_value = MISSING
+@overload
+def iter_unmarshal(marshalable, source, tag=..., options=...):
+    # type: (Type[_DT], Union[str, IO[Any]], Optional[str], Options) -> Iterator[_DT]
+    ...
+
+
+@overload
+def iter_unmarshal(marshalable, source, tag=..., options=...):
+    # type: (variables.vec[_T], Union[str, IO[Any]], Optional[str], Options) -> Iterator[_T]
+    ...
+
+
+def iter_unmarshal(marshalable, source, tag=None, options=_default_options):
+    """parse xml from a file name or file object incrementally by `ET.iterparse`, yield every element
+    named `tag` as an instance of `marshalable`. completed elements are cleared and detached from
+    their parent once they are decoded or skipped, so memory stays flat no matter how large the
+    document is.
+
+    `tag` defaults to the xml tag name of declared class, or the field name of vec, ValueError is
+    raised if it is empty.
+
+    >>> for country in xml.iter_unmarshal(Country, "countries.xml"):
+    >>>     ...
+    """
+    if isinstance(marshalable, variables.vec):
+        typ = marshalable.item_type
+        tag = tag or marshalable.field_name
+    else:
+        typ = marshalable
+        tag = tag or _tag_name(marshalable)
+    if not tag:
+        raise ValueError(f"no tag to match items of {marshalable!r}, pass `tag` or declare the field name of vec")
+    return _iter_unmarshal(typ, source, tag, options)
+
+
+def _iter_unmarshal(typ, source, tag, options):
+    # type: (Any, Union[str, IO[Any]], str, Options) -> Iterator[Any]
+    stack: List[ET.Element] = []
+    matched_depth = -1
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if matched_depth < 0 and elem.tag == tag:
+                matched_depth = len(stack)
+            stack.append(elem)
+            continue
+
+        stack.pop()
+        if matched_depth == len(stack):
+            matched_depth = -1
+            yield _unmarshal_declared(typ, elem, options)
+        elif matched_depth >= 0:
+            # a descendant of the matched element, which is decoded with it
+            continue
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def unmarshal_many(marshalable, sources, options=_default_options, workers=None, chunksize=256):
+    # type: (Any, Iterable[Union[str, bytes]], Options, Optional[int], int) -> Iterator[Any]
+    """parse and decode many independent xml documents in a process pool of `workers`, yield results
+    in the order of `sources`. see `json.unmarshal_many`.
+    """
+    return pool_imap(_unmarshal_chunk, sources, workers, chunksize, _init_worker, (marshalable, options))
+
+
+_worker = (None, _default_options)  # type: Tuple[Any, Options]
+
+
+def _init_worker(marshalable, options):
+    # type: (Any, Options) -> None
+    global _worker
+    _worker = (marshalable, options)
+    _warm(marshalable.item_type if isinstance(marshalable, variables.vec) else marshalable, set())
+
+
+def _warm(typ, seen):
+    # type: (Any, set) -> None
+    """build child tags of a declared class and its nested declared classes"""
+    if not issubclass_safe(typ, declares.Declared) or typ in seen:
+        return
+    seen.add(typ)
+    typ.meta.setdefault("xml_child_tags", _child_tags(typ))
+    for plan in declares.field_plan(typ):
+        for p in (plan, *plan.items):
+            _warm(p.type_, seen)
+
+
+def _unmarshal_chunk(sources):
+    # type: (List[Union[str, bytes]]) -> List[Any]
+    marshalable, options = _worker
+    return [unmarshal(marshalable, ET.fromstring(source), options) for source in sources]
 
-        if field_value != MISSING:
-            if field.serializer:
-                field_value = field.serializer.to_internal_value(field_value)
-            init_kwargs[field.name] = field_value
 
+def _tag_name(typ):
+    # type: (Type[declares.Declared]) -> str
+    return typ.__xml_tag_name__ if typ.__xml_tag_name__ else typ.__name__.lower()
+
+
+_Children = Dict[str, List[ET.Element]]
+
+
+def _unmarshal_declared(typ, elem, options, projection=None):
+    # type: (Type[_DT], ET.Element, Options, Optional[declares._Projection]) -> _DT
+    child_tags, children = _group_children(typ, elem)
+    init_kwargs: Dict[str, Any] = {}
+    for plan in declares.field_plan(typ):
+        nested = None
+        if projection is not None:
+            if plan.name not in projection:
+                continue
+            paths = projection[plan.name]
+            if paths is not None:
+                nested = declares._projection(plan.items[-1].type_ if plan.items else plan.type_, paths)
+
+        field_value = _unmarshal_field_value(plan, elem, child_tags, children, options, nested)
+        if field_value is not MISSING:
+            if plan.var.serializer:
+                field_value = plan.var.serializer.to_internal_value(field_value)
+            init_kwargs[plan.name] = field_value
+
+    if projection is not None:
+        return declares._build_projected(typ, init_kwargs, projection)
     return typ(**init_kwargs)
 
 
-def marshal(marshalable_or_declared, options=_default_options):
-    # type: (Union[_Marshalable, declares.Declared], Options) -> ET.Element
+def _group_children(typ, elem):
+    # type: (Type[declares.Declared], ET.Element) -> Tuple[FrozenSet[str], _Children]
+    """walk children once and group them by tag, instead of searching children for every field.
+    only tags of `_child_tags` are grouped, they are returned as well.
+    """
+    meta = typ.meta
+    try:
+        child_tags = meta["xml_child_tags"]
+    except KeyError:
+        child_tags = meta["xml_child_tags"] = _child_tags(typ)
+
+    children: _Children = {}
+    for child in elem:
+        tag = child.tag
+        if tag in child_tags:
+            subs = children.get(tag)
+            if subs is None:
+                children[tag] = [child]
+            else:
+                subs.append(child)
+    return child_tags, children
+
+
+def _unmarshal_field_value(plan, elem, child_tags, children, options, nested):
+    # type: (variables.FieldPlan, ET.Element, FrozenSet[str], _Children, Options, Optional[declares._Projection]) -> Any
+    """return the value of field `plan` in `elem` before its serializer is applied, or MISSING"""
+    field = plan.var
+    if field.as_xml_attr or field.as_xml_text:
+        field_value = elem.get(plan.field_name) if field.as_xml_attr else elem.text
+        return MISSING if field_value is None or field_value == "" else field_value
+
+    if plan.field_name in child_tags:
+        subs = children.get(plan.field_name, [])
+    elif plan.kind is Kind.vec:
+        # a path expression
+        subs = elem.findall(plan.field_name)
+    else:
+        sub = elem.find(plan.field_name)
+        subs = [] if sub is None else [sub]
+
+    if plan.kind is Kind.vec:
+        item = plan.items[0]
+        if item.kind is Kind.declared:
+            return [_unmarshal_declared(item.type_, sub, options, nested) for sub in subs]
+        return [unmarshal(item.type_, sub, options) for sub in subs]
+    elif not subs:
+        return MISSING
+    elif plan.kind is Kind.declared:
+        return _unmarshal_declared(plan.type_, subs[0], options, nested)
+    return MISSING if subs[0].text is None else subs[0].text
+
+
+_PLAIN_TAG = re.compile(r"(\{[^}]*\})?[^/\[\]()@!=\s*]+")
+
+
+def _child_tags(typ):
+    # type: (Type[declares.Declared]) -> FrozenSet[str]
+    """field names of child elements which can be matched by tag directly, path expressions
+    such as `a/b` are left to `ET.Element.find`.
+    """
+    return frozenset(
+        plan.field_name
+        for plan in declares.field_plan(typ)
+        if not plan.var.as_xml_attr
+        and not plan.var.as_xml_text
+        and plan.field_name not in (".", "..")
+        and _PLAIN_TAG.fullmatch(plan.field_name)
+    )
+
+
+def marshal(marshalable_or_declared, options=_default_options, include=None, exclude=None):
+    # type: (Union[_Marshalable, declares.Declared], Options, Optional[Iterable[str]], Optional[Iterable[str]]) -> Any
+    """`include` and `exclude` are field paths of a declared object to serialize or omit, see `declares._mask`"""
     if isinstance(marshalable_or_declared, declares.Declared):
-        return _marshal_declared(marshalable_or_declared, options)
+        masked = include is not None or exclude is not None
+        mask = declares._mask(marshalable_or_declared.__class__, include, exclude) if masked else None
+        return _marshal_declared(marshalable_or_declared, options, mask)
     else:
         return marshalable_or_declared.marshal(options)
 
 
-def _marshal_declared(declared, options):
-    # type: (declares.Declared, Options) -> ET.Element
-    elem = ET.Element(declared.__xml_tag_name__ if declared.__xml_tag_name__ else declared.__class__.__name__.lower())
-    for field in declares.fields(declared):
-        if field.ignore_serialize:
+def _marshal_declared(declared, options, mask=None):
+    # type: (declares.Declared, Options, Optional[declares._Mask]) -> ET.Element
+    elem = ET.Element(_tag_name(declared.__class__))
+    for plan in declares.field_plan(declared):
+        field = plan.var
+        if field.ignore_serialize or (mask is not None and plan.name not in mask):
             continue
 
+        sub = None if mask is None or mask[plan.name] == (None, None) else mask[plan.name]
         if field.as_xml_attr:
-            attr = getattr(declared, field.name)
+            attr = getattr(declared, plan.name)
             if attr is None:
                 if options.skip_none_field:
                     continue
 
                 attr = ""
 
-            elem.set(field.field_name, _marshal_text_field(field, attr))
+            elem.set(plan.field_name, _marshal_text_field(field, attr))
         elif field.as_xml_text:
-            text = getattr(declared, field.name)
+            text = getattr(declared, plan.name)
             if text is None:
                 if options.skip_none_field:
                     continue
@@ -138,17 +328,17 @@ def _marshal_declared(declared, options):
                 text = ""
 
             elem.text = _marshal_text_field(field, text)
-        elif isinstance_safe(field, variables.vec):
-            li = getattr(declared, field.name)
-            elem.extend(_marshal_field(field, i, options) for i in li)
+        elif plan.kind is Kind.vec:
+            li = getattr(declared, plan.name)
+            elem.extend(_marshal_field(field, i, options, sub) for i in li)
         else:
-            val = getattr(declared, field.name)
+            val = getattr(declared, plan.name)
             if val is None:
                 if not options.skip_none_field:
-                    sub = ET.Element(field.field_name)
+                    sub = ET.Element(plan.field_name)
                     elem.append(sub)
             else:
-                elem.append(_marshal_field(field, val, options))
+                elem.append(_marshal_field(field, val, options, sub))
 
     return elem
 
@@ -164,10 +354,10 @@ def _marshal_text_field(field, value):
     raise MarshalError(f"can't marshal property `{field.name}` which are `{field.type_!r}`")
 
 
-def _marshal_field(field, value, options):
-    # type: (variables.Var, declares.Declared, Options) -> ET.Element
+def _marshal_field(field, value, options, mask=None):
+    # type: (variables.Var, declares.Declared, Options, Optional[declares._SubMask]) -> ET.Element
     if isinstance(value, declares.Declared):
-        elem = _marshal_declared(value, options)
+        elem = _marshal_declared(value, options, mask and declares._mask(value.__class__, *mask))
         elem.tag = field.field_name
         return elem
     else:
@@ -175,3 +365,189 @@ def _marshal_field(field, value, options):
         elem = ET.Element(field.field_name)
         elem.text = text
         return elem
+
+
+# parts of one element: attributes, text and children as (tag, declared instance or text or None)
+_Parts = Tuple[Dict[str, str], Optional[str], List[Tuple[str, Any]]]
+
+
+def dump(marshalable_or_declared, fp, options=_default_options, encoding=None, xml_declaration=None):
+    # type: (Union[Vec, declares.Declared], IO[Any], Options, Optional[str], Optional[bool]) -> None
+    """serialize into a file object in one pass, without building an element tree.
+
+    the output is as same as `ET.ElementTree.write` on the element returned by `marshal`, pretty
+    printed like `xml_prettify` when `options.indent` is set. `encoding` and `xml_declaration` have
+    the same meaning as `ET.ElementTree.write`, bytes are written unless `encoding` is "unicode".
+    qualified names like `{uri}tag` need namespace prefixes of the whole tree, so they are written
+    by `ET.ElementTree.write` instead.
+    """
+    if _has_qualified_names(marshalable_or_declared):
+        elem = marshal(marshalable_or_declared, options)
+        if options.indent is not None:
+            xml_prettify(elem, options.indent, "\n")
+        ET.ElementTree(elem).write(fp, encoding, xml_declaration)
+        return
+
+    encoding = encoding or "us-ascii"
+    writer = _Writer(fp, None if encoding == "unicode" else encoding, options)
+    if xml_declaration or (xml_declaration is None and encoding.lower() not in ("utf-8", "us-ascii", "unicode")):
+        writer.write(f"<?xml version='1.0' encoding='{encoding}'?>\n")
+
+    if isinstance(marshalable_or_declared, declares.Declared):
+        writer.element(_tag_name(marshalable_or_declared.__class__), marshalable_or_declared, 0)
+    else:
+        writer.element(marshalable_or_declared.tag, marshalable_or_declared, 0)
+    writer.flush()
+
+
+def _has_qualified_names(marshalable_or_declared):
+    # type: (Union[Vec, declares.Declared]) -> bool
+    if isinstance(marshalable_or_declared, declares.Declared):
+        return _qualified(marshalable_or_declared.__class__)
+    return "{" in marshalable_or_declared.tag or any(
+        _qualified(cls) for cls in {item.__class__ for item in marshalable_or_declared}
+    )
+
+
+def _qualified(typ, seen=frozenset()):
+    # type: (Type[declares.Declared], FrozenSet[type]) -> bool
+    """whether tags or attribute names of `typ` or nested classes are qualified names"""
+    meta = typ.meta
+    try:
+        return meta["xml_qualified"]
+    except KeyError:
+        pass
+
+    seen = seen | {typ}
+    qualified = "{" in _tag_name(typ)
+    for plan in declares.field_plan(typ):
+        if qualified:
+            break
+        qualified = "{" in plan.field_name or any(
+            p.kind is Kind.declared and p.type_ not in seen and _qualified(p.type_, seen) for p in (plan, *plan.items)
+        )
+    if len(seen) == 1:
+        # results inside a reference cycle depend on where it was entered
+        meta["xml_qualified"] = qualified
+    return qualified
+
+
+class _Writer:
+    def __init__(self, fp, encoding, options):
+        # type: (IO[Any], Optional[str], Options) -> None
+        self.fp = fp
+        self.encoding = encoding
+        self.options = options
+        self.buf: List[str] = []
+        self.write = self.buf.append
+
+    def flush(self):
+        # type: () -> None
+        data = "".join(self.buf)
+        self.buf.clear()
+        self.fp.write(data if self.encoding is None else data.encode(self.encoding, "xmlcharrefreplace"))
+
+    def element(self, tag, value, level):
+        # type: (str, Any, int) -> None
+        if isinstance(value, Vec):
+            attrs, text, children = value.dump_parts(self.options)
+        elif isinstance(value, declares.Declared):
+            attrs, text, children = _parts(value, self.options)
+        else:
+            attrs, text, children = {}, value, []
+
+        indent = self.options.indent
+        if indent is not None and children:
+            if text is None or text.isspace():
+                text = "\n" + indent * (level + 1)
+            else:
+                text = "\n" + indent * (level + 1) + text.strip() + "\n" + indent * (level + 1)
+
+        write = self.write
+        write("<" + tag)
+        for k, v in attrs.items():
+            write(f' {k}="{_escape_attrib(v)}"')
+
+        if text or children:
+            write(">")
+            if text:
+                write(_escape_cdata(text))
+            last = len(children) - 1
+            for i, (child_tag, child) in enumerate(children):
+                self.element(child_tag, child, level + 1)
+                if indent is not None:
+                    write("\n" + indent * (level + 1 if i < last else level))
+            write("</" + tag + ">")
+        else:
+            write(" />")
+
+        if len(self.buf) > 4096:
+            self.flush()
+
+
+def _parts(declared, options):
+    # type: (declares.Declared, Options) -> _Parts
+    """the same contents as `_marshal_declared` produces"""
+    attrs: Dict[str, str] = {}
+    text: Optional[str] = None
+    children: List[Tuple[str, Any]] = []
+    for plan in declares.field_plan(declared):
+        field = plan.var
+        if field.ignore_serialize:
+            continue
+
+        value = getattr(declared, plan.name)
+        if field.as_xml_attr or field.as_xml_text:
+            if value is None:
+                if options.skip_none_field:
+                    continue
+
+                value = ""
+
+            if field.as_xml_attr:
+                attrs[plan.field_name] = _marshal_text_field(field, value)
+            else:
+                text = _marshal_text_field(field, value)
+        elif plan.kind is Kind.vec:
+            children.extend(
+                (plan.field_name, i if isinstance(i, declares.Declared) else _marshal_text_field(field, i))
+                for i in value
+            )
+        elif value is None:
+            if not options.skip_none_field:
+                children.append((plan.field_name, None))
+        else:
+            children.append(
+                (
+                    plan.field_name,
+                    value if isinstance(value, declares.Declared) else _marshal_text_field(field, value),
+                )
+            )
+
+    return attrs, text, children
+
+
+def _escape_cdata(text):
+    # type: (str) -> str
+    if "&" in text:
+        text = text.replace("&", "&amp;")
+    if "<" in text:
+        text = text.replace("<", "&lt;")
+    if ">" in text:
+        text = text.replace(">", "&gt;")
+    return text
+
+
+def _escape_attrib(text):
+    # type: (str) -> str
+    """escape an attribute value as same as `ET.ElementTree.write`"""
+    text = _escape_cdata(text)
+    if '"' in text:
+        text = text.replace('"', "&quot;")
+    if "\r" in text:
+        text = text.replace("\r", "&#13;")
+    if "\n" in text:
+        text = text.replace("\n", "&#10;")
+    if "\t" in text:
+        text = text.replace("\t", "&#09;")
+    return text
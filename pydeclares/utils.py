@@ -1,6 +1,12 @@
 import inspect
+import io
+import os
 import re
-from typing import Any, Tuple, Union, overload
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import IO, Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar, Union, overload
 from xml.etree.ElementTree import Element
 
 
@@ -45,6 +51,73 @@ def is_new_type(type_: type):
     return inspect.isfunction(type_) and hasattr(type_, "__supertype__")
 
 
+def create_fn(name, args, body, globals=None, locals=None):
+    # type: (str, List[str], List[str], Optional[Dict[str, Any]], Optional[Dict[str, Any]]) -> Callable[..., Any]
+    """compile a function from source lines, `locals` are bound as closure variables of the new function.
+    it is a simplified version of `dataclasses._create_fn`.
+    """
+    locals = locals or {}
+    txt = f"def {name}({', '.join(args)}):\n" + "\n".join(f"  {line}" for line in body)
+    txt = "\n".join(f" {line}" for line in txt.splitlines())
+    txt = f"def __create_fn__({', '.join(locals.keys())}):\n{txt}\n return {name}"
+    ns: Dict[str, Any] = {}
+    exec(txt, globals or {}, ns)
+    return ns["__create_fn__"](**locals)
+
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+def pool_imap(
+    fn: Callable[[List[_T]], List[_R]],
+    items: Iterable[_T],
+    workers: Optional[int] = None,
+    chunksize: int = 256,
+    initializer: Optional[Callable[..., Any]] = None,
+    initargs: Tuple[Any, ...] = (),
+    threads: bool = False,
+    mp_context: Optional[Any] = None,
+) -> Iterator[_R]:
+    """map `fn` over chunks of `items` in a process pool, or a thread pool if `threads` is True,
+    and yield results in order. chunks are submitted lazily, at most two chunks per worker are in
+    flight, so `items` can be an unbounded iterator. `fn` takes a list of items and returns a list
+    of results. `mp_context` is the multiprocessing context of process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    iterator = iter(items)
+    pending: Deque[Future] = deque()
+    if threads:
+        executor = ThreadPoolExecutor(workers, initializer=initializer, initargs=initargs)  # type: Any
+    else:
+        executor = ProcessPoolExecutor(workers, mp_context, initializer, initargs)
+    with executor:
+        try:
+            while True:
+                chunk = list(islice(iterator, chunksize))
+                if chunk:
+                    pending.append(executor.submit(fn, chunk))
+                if pending and (not chunk or len(pending) >= workers * 2):
+                    yield from pending.popleft().result()
+                elif not chunk:
+                    return
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def free_threaded() -> bool:
+    """whether the interpreter runs without GIL, threads run python code in parallel then"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def is_binary_file(fp: IO[Any]) -> bool:
+    if isinstance(fp, io.TextIOBase):
+        return False
+    return "b" in getattr(fp, "mode", "b")
+
+
 def xml_prettify(element: Element, indent: str, newline: str = "\n", level: int = 0) -> None:
     """
     :params element:
@@ -58,9 +131,9 @@ def xml_prettify(element: Element, indent: str, newline: str = "\n", level: int
             element.text = newline + indent * (level + 1)
         else:
             element.text = newline + indent * (level + 1) + element.text.strip() + newline + indent * (level + 1)
-    temp = list(element)
-    for subelement in list(element):
-        if temp.index(subelement) < (len(temp) - 1):  # 如果不是list的最后一个元素，说明下一个行是同级别元素的起始，缩进应一致
+    last = len(element) - 1
+    for i, subelement in enumerate(element):
+        if i < last:  # 如果不是list的最后一个元素，说明下一个行是同级别元素的起始，缩进应一致
             subelement.tail = newline + indent * (level + 1)
         else:  # 如果是list的最后一个元素， 说明下一行是母元素的结束，缩进应该少一个
             subelement.tail = newline + indent * level
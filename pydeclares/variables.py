@@ -1,3 +1,4 @@
+import json
 from abc import abstractmethod
 from enum import Enum
 from functools import lru_cache
@@ -9,12 +10,14 @@ from typing import (
     Iterable,
     List,
     Mapping,
+    NamedTuple,
     Optional,
     SupportsBytes,
     SupportsComplex,
     SupportsFloat,
     SupportsInt,
     Text,
+    Tuple,
     Type,
     TypeVar,
     Union,
@@ -22,6 +25,7 @@ from typing import (
 )
 
 from pydeclares import declares
+from pydeclares.defines import RawJson
 from pydeclares.typing import Literal, Protocol, runtime_checkable
 from pydeclares.utils import NamingStyle, isinstance_safe, issubclass_safe
 
@@ -197,6 +201,11 @@ class Complex(Var[complex, SupportsComplex]):
 
 
 class Bytes(Var[bytes, SupportsBytes]):
+    def __init__(self, *args: Any, size: Optional[int] = None, **kwargs: Any):
+        """`size` declares a fixed length, which is required by fixed layout records"""
+        self.size = size
+        super().__init__(*args, **kwargs)
+
     @property
     def type_(self):
         return bytes
@@ -219,6 +228,25 @@ class String(Var[str, SupportsStr]):
         return str(obj)
 
 
+class Raw(Var[RawJson, Any]):
+    """json text of a sub-document, str and bytes are taken as json text which must be valid,
+    other objects are encoded
+    """
+
+    @property
+    def type_(self):
+        return RawJson
+
+    def cast_it(self, obj: Any) -> RawJson:
+        if isinstance(obj, (bytes, bytearray)):
+            obj = obj.decode(json.detect_encoding(obj))
+        elif not isinstance(obj, str):
+            return RawJson(json.dumps(obj))
+        # the text is written verbatim, so it has to be checked here
+        json.loads(obj)
+        return RawJson(obj)
+
+
 class var(Var[_GT, Union[Castable[_GT], _GT]]):
     @overload
     def __init__(
@@ -287,6 +315,8 @@ class kv(Var[Mapping[_K, _V], Castable[Mapping[_K, _V]]]):
     ):
         self.k_type = k_type
         self.v_type = v_type
+        self.k_var = compatible_var(k_type)
+        self.v_var = compatible_var(v_type)
         super().__init__(*args, **kwargs)
 
     @property
@@ -325,6 +355,7 @@ class vec(Var[List[_GT], Castable[Iterable[_GT]]]):
         **kwargs: Any,
     ):
         self.item_type = type_
+        self.item_var = compatible_var(type_)
         super().__init__(*args, **kwargs)
 
     @property
@@ -341,8 +372,8 @@ class vec(Var[List[_GT], Castable[Iterable[_GT]]]):
         if isinstance(obj, Castable):
             return list(obj.cast())
         else:
-            v = compatible_var(self.item_type)
-            return [v.cast_it(i) for i in obj]
+            cast_it = self.item_var.cast_it
+            return [cast_it(i) for i in obj]
 
 
 @overload
@@ -422,7 +453,60 @@ def compatible_var(type_: Type[Any], *args: Any, **kwargs: Any) -> Var[Any, Any]
         return Complex(*args, **kwargs)
     elif type_ is bytes:
         return Bytes(*args, **kwargs)
+    elif type_ is RawJson:
+        return Raw(*args, **kwargs)
     elif issubclass_safe(type_, Enum):
         kwargs.setdefault("serializer", _EnumSerializer(type_))
 
     return var(type_, *args, **kwargs)
+
+
+class Kind(Enum):
+    """how marshals handle values of one field"""
+
+    scalar = "scalar"
+    declared = "declared"
+    vec = "vec"
+    kv = "kv"
+    enum = "enum"
+    serializer = "serializer"
+    raw = "raw"
+
+
+class FieldPlan(NamedTuple):
+    """precomputed information of one field, it is built once when a declared class is created.
+
+    `items` are plans of resolved item variables, one for `vec` and two (key and value) for `kv`.
+    `make_default` is None when the field has neither default nor default factory.
+    """
+
+    var: Var[Any, Any]
+    name: str
+    field_name: str
+    kind: Kind
+    type_: Any
+    items: Tuple["FieldPlan", ...]
+    make_default: Optional[Callable[[], Any]]
+
+
+def make_plan(var: Var[Any, Any]) -> FieldPlan:
+    items: Tuple[FieldPlan, ...] = ()
+    if isinstance(var, vec):
+        kind = Kind.vec
+        items = (make_plan(var.item_var),)
+    elif isinstance(var, kv):
+        kind = Kind.kv
+        items = (make_plan(var.k_var), make_plan(var.v_var))
+    elif isinstance(var, Raw):
+        kind = Kind.raw
+    elif issubclass_safe(var.type_, declares.Declared):
+        kind = Kind.declared
+    elif issubclass_safe(var.type_, Enum) and var.serializer is _EnumSerializer(var.type_):
+        kind = Kind.enum
+    elif var.serializer:
+        kind = Kind.serializer
+    else:
+        kind = Kind.scalar
+
+    make_default = None if var.default is None and var.default_factory is None else var.make_default
+    return FieldPlan(var, var.name, var.field_name, kind, var.type_, items, make_default)
@@ -18,6 +18,9 @@ setuptools.setup(
     install_requires=[
         'typing_extensions>=3.7.2;python_version<"3.7"'
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     python_requires='>=3.5',
     classifiers=[
         "Programming Language :: Python :: 3",
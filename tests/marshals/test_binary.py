@@ -0,0 +1,84 @@
+import enum
+
+import pytest
+
+from pydeclares import Declared, RawJson, kv, var, vec
+from pydeclares.marshals import binary, json
+from pydeclares.marshals.exceptions import MarshalError
+
+
+class Color(enum.Enum):
+    red = "red"
+    blue = "blue"
+
+
+class Item(Declared):
+    sku = var(str)
+    qty = var(int)
+    price = var(float, required=False)
+
+
+class Order(Declared):
+    id = var(int)
+    flag = var(bool)
+    note = var(str, required=False)
+    blob = var(bytes, required=False)
+    z = var(complex, required=False)
+    color = var(Color, required=False)
+    items = vec(Item)
+    tags = kv(str, int, required=False)
+    extra = var(dict, required=False)
+    raw = var(RawJson, required=False)
+    cache = var(str, required=False, ignore_serialize=True, default="x")
+
+
+def test_round_trip():
+    # items of vec can be None, which is only allowed without validation
+    order = Order.construct(
+        id=-(2**70),
+        flag=True,
+        note="中文",
+        blob=b"\x00\xff",
+        z=1 + 2j,
+        color=Color.blue,
+        items=[Item("a", 1, 1.5), None, Item("b", 300, None)],
+        tags={"x": 1, "y": None},
+        extra={"k": [1, 2.5, None, True, "s"]},
+        raw=RawJson('{"a": 1}'),
+        cache="y",
+    )
+    data = binary.marshal(order)
+    out = binary.unmarshal(Order, data)
+    assert out.cache == "x"
+    out.cache = "y"
+    assert out == order
+    assert out.raw.__class__ is RawJson
+
+    order = Order(id=1, flag=False, items=[])
+    assert binary.unmarshal(Order, binary.marshal(order)) == order
+    assert len(binary.marshal(order)) < len(json.marshal(order))
+
+
+def test_fingerprint():
+    class A(Declared):
+        p0 = var(int)
+
+    class B(Declared):
+        p0 = var(str)
+
+    class C(Declared):
+        p0 = var(int)
+
+    assert binary.fingerprint(A) == binary.fingerprint(C)
+    assert binary.fingerprint(A) != binary.fingerprint(B)
+    with pytest.raises(MarshalError):
+        binary.unmarshal(B, binary.marshal(A(1)))
+    assert binary.unmarshal(C, binary.marshal(A(1))).p0 == 1
+
+
+def test_corrupted():
+    data = binary.marshal(Item("abc", 1, 2.0))
+    with pytest.raises(MarshalError):
+        binary.unmarshal(Item, data[:-1])
+    with pytest.raises(MarshalError):
+        binary.unmarshal(Item, data + b"\x00")
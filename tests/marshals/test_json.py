@@ -7,7 +7,7 @@ import pytest
 from pydeclares import Declared, var
 from pydeclares.exceptions import FieldRequiredError
 from pydeclares.marshals import json
-from pydeclares.marshals.exceptions import MarshalError
+from pydeclares.marshals.exceptions import LazyDecodeError, MarshalError
 from pydeclares.variables import kv, vec
 
 _T = TypeVar("_T", bound=Any)
@@ -332,3 +332,285 @@ def test_default_value():
 
     out = unmarshal(Struct, '{}')
     assert out.p0 == ""
+
+
+def test_unmarshal_compiled_decoder_cached():
+    class Struct(Declared):
+        p0 = var(int)
+
+    assert "json_decoder" not in Struct.meta
+    unmarshal(Struct, '{"p0": 1}')
+    decoder = Struct.meta["json_decoder"]
+    assert unmarshal(Struct, '{"p0": "2"}').p0 == 2
+    assert Struct.meta["json_decoder"] is decoder
+
+
+def test_unmarshal_custom_initialize():
+    class Struct(Declared):
+        p0 = var(int)
+        p1 = var(int, init=False)
+
+        def __post_init__(self, **omits):
+            self.p1 = self.p0 + 1
+
+    out = unmarshal(Struct, '{"p0": "1"}')
+    assert out.p0 == 1
+    assert out.p1 == 2
+
+
+def test_unmarshal_vec_composition_field():
+    class Inner(Declared):
+        p0 = var(int)
+
+    class Struct(Declared):
+        p0 = vec(Inner)
+        p1 = kv(str, Inner)
+
+    _str = '{"p0": [{"p0": 1}, {"p0": 2}], "p1": {"a": {"p0": 3}}}'
+    out = unmarshal(Struct, _str)
+    assert out.p0 == [Inner(1), Inner(2)]
+    assert out.p1 == {"a": Inner(3)}
+    assert marshal(out) == _str
+
+
+def test_marshal_compiled_encoder_same_as_dumps():
+    import json as std_json
+
+    class Fruit(Enum):
+        Apple = 0
+
+    class Inner(Declared):
+        p0 = var(float)
+        p1 = var(str, required=False)
+
+    class Struct(Declared):
+        p0 = var(str)
+        p1 = vec(Inner)
+        p2 = kv(int, Inner)
+        p3 = var(Fruit)
+        p4 = var(list)
+        p5 = var(bool)
+        p6 = var(Inner, required=False)
+
+    out = Struct('"é', [Inner(float("inf"), None)], {1: Inner(1.5, "a")}, Fruit.Apple, [1, None], True, None)
+    for options in (json.Options(), json.Options(True)):
+        assert marshal(out, options) == std_json.dumps(json._marshal_declared(out, options))
+    assert "json_encoder" in Struct.meta
+
+
+def test_marshal_with_dumps_options():
+    class Struct(Declared):
+        p0 = var(int)
+        p1 = var(str)
+
+    out = Struct(1, "a")
+    assert marshal(out, json.Options(json_dumps={"separators": (",", ":")})) == '{"p0":1,"p1":"a"}'
+
+
+def test_iter_unmarshal():
+    import io
+    import json as std_json
+
+    class Struct(Declared):
+        p0 = var(int)
+        p1 = var(str)
+
+    _str = '[{"p0": 1, "p1": "\\u00e9"}, {"p0": 22, "p1": "b"}, {"p0": 333, "p1": "c"}]'
+    expect = [Struct(1, "é"), Struct(22, "b"), Struct(333, "c")]
+    for chunk_size in (1, 5, 1024):
+        assert list(json.iter_unmarshal(Struct, io.StringIO(_str), chunk_size)) == expect
+        assert list(json.iter_unmarshal(vec(Struct), io.BytesIO(_str.encode("utf-16")), chunk_size)) == expect
+
+    assert list(json.iter_unmarshal(vec(int), io.StringIO(" [1, 22,333 ] "), chunk_size=1)) == [1, 22, 333]
+    assert list(json.iter_unmarshal(vec(int), io.StringIO("[]"))) == []
+
+    class Decoder(std_json.JSONDecoder):
+        def __init__(self, **kw):
+            super().__init__(parse_float=lambda s: float(s) + 1, **kw)
+
+    options = json.Options(json_loads={"cls": Decoder})
+    assert list(json.iter_unmarshal(vec(float), io.StringIO("[1.5, 2.5]"), options=options)) == [2.5, 3.5]
+
+
+def test_iter_unmarshal_invalid():
+    import io
+    import json as std_json
+
+    for _str in ("{}", "[1 2]", "[1,", "[1] 2"):
+        with pytest.raises(std_json.JSONDecodeError):
+            list(json.iter_unmarshal(vec(int), io.StringIO(_str), chunk_size=2))
+
+    # a malformed item fails without buffering the rest of file
+    for item in ("foo", '{"a": 1 x}', '["a" "b"]', "{]"):
+        fp = io.StringIO(f"[1, {item}, " + ", ".join(["1"] * 100000) + "]")
+        with pytest.raises(MarshalError):
+            list(json.iter_unmarshal(vec(int), fp, chunk_size=16))
+        assert fp.tell() < 64
+
+
+def test_unmarshal_trusted():
+    class Item(Declared):
+        p0 = var(int)
+
+    class Struct(Declared):
+        p0 = var(int)
+        p1 = var(str, required=False)
+        p2 = vec(Item)
+
+    options = json.Options(trusted=True)
+    out = json.unmarshal(Struct, '{"p0": "1", "p2": [{"p0": 2}]}', options)
+    assert out.p0 == "1"
+    assert out.p1 is None
+    assert out.p2 == [Item(2)]
+    assert json.unmarshal(Struct, '{"p0": null, "p2": []}', options).p0 is None
+    with pytest.raises(FieldRequiredError):
+        json.unmarshal(Struct, '{"p0": null, "p2": []}')
+
+
+def test_unmarshal_lazy():
+    import copy
+
+    class Item(Declared):
+        p0 = var(int)
+
+    class Struct(Declared):
+        p0 = var(int)
+        p1 = vec(Item)
+        p2 = var(Item, required=False)
+        p3 = kv(str, Item)
+
+    class Slotted(Struct, slots=True, lazy=True):
+        pass
+
+    class Eager(Struct, slots=True):
+        pass
+
+    assert "_lazy" in Slotted.__slots__ and "_lazy" not in Eager.__slots__
+    _str = '{"p0": 1, "p1": [{"p0": "2"}], "p2": {"p0": 3, "x": null}, "p3": {"a": {"p0": 4}}}'
+    assert json.unmarshal(Eager, _str, json.Options(lazy=True)) == Eager(1, [Item(2)], Item(3), {"a": Item(4)})
+    for typ in (Struct, Slotted):
+        out = json.unmarshal(typ, _str, json.Options(lazy=True))
+        assert out._lazy is not None
+        # untouched fields are written back as they are
+        assert json.marshal(out) == _str
+        assert out.p1 == [Item(2)]
+        assert json.marshal(out) == '{"p0": 1, "p1": [{"p0": 2}], "p2": {"p0": 3, "x": null}, "p3": {"a": {"p0": 4}}}'
+        out.p2 = None
+        assert json.marshal(out, json.Options(True)) == '{"p0": 1, "p1": [{"p0": 2}], "p3": {"a": {"p0": 4}}}'
+        assert out == typ(1, [Item(2)], None, {"a": Item(4)})
+
+    # fields are still readable on both sides of a copy
+    out = json.unmarshal(Struct, _str, json.Options(lazy=True))
+    copied = copy.copy(out)
+    assert copied.p1 == [Item(2)] and out.p1 == [Item(2)]
+    assert copy.deepcopy(out) == out
+
+    out = json.unmarshal(Struct, '{"p0": 1, "p1": [{}], "p3": {}}', json.Options(lazy=True))
+    assert not hasattr(out, "p1")
+    with pytest.raises(LazyDecodeError) as e:
+        out.p1
+    assert isinstance(e.value.__cause__, FieldRequiredError)
+    with pytest.raises(AttributeError):
+        out.p4
+
+
+def test_raw_json():
+    import io
+    from collections import OrderedDict
+
+    from pydeclares import Codec, RawJson
+    from pydeclares.marshals import jsonl
+
+    class Header(Declared):
+        id = var(int)
+        payload = var(RawJson)
+
+    class Envelope(Declared):
+        header = var(Header)
+        payload = var(RawJson, required=False)
+        others = vec(Header)
+        extra = kv(str, RawJson, required=False)
+
+    _str = (
+        '{"header": {"id": 1, "payload": [1,  2]}, "payload": {"a" : "\\u4e2d"}, '
+        '"others": [{"id": 2, "payload": [3,  4]}], "extra": {"k": {"b" : 1}}}'
+    )
+    out = json.unmarshal(Envelope, _str)
+    assert out.header.payload == "[1,  2]"
+    assert out.payload == '{"a" : "\\u4e2d"}'
+    assert isinstance(out.payload, RawJson)
+    # raw json inside vec and kv items are kept verbatim as well
+    assert out.others[0].payload == "[3,  4]"
+    assert out.extra == {"k": '{"b" : 1}'}
+    assert json.marshal(out) == _str
+    assert json.marshal(out, json.Options(json_dumps={"indent": None})) == (
+        '{"header": {"id": 1, "payload": [1, 2]}, "payload": {"a": "\\u4e2d"}, '
+        '"others": [{"id": 2, "payload": [3, 4]}], "extra": {"k": {"b": 1}}}'
+    )
+    # every entry point keeps raw json the same way
+    assert Codec(Envelope).decode(_str.encode()) == out
+    assert Envelope.from_json(_str, object_pairs_hook=OrderedDict) == out
+    assert list(jsonl.iter_load(Envelope, io.StringIO(_str + "\n" + _str))) == [out, out]
+    assert list(json.iter_unmarshal(Envelope, io.StringIO(f"[{_str}]"), chunk_size=7)) == [out]
+    assert json.unmarshal(vec(RawJson), "[1, {\"a\" : 2}]") == ["1", '{"a" : 2}']
+
+    out = json.unmarshal(Envelope, '{"header": {"id": 1, "payload": 1}, "payload": null, "others": []}')
+    assert out.payload is None
+    assert Header(1, {"a": 1}).payload == '{"a": 1}'
+    assert Header(1, "[1]").payload == "[1]"
+    with pytest.raises(ValueError):
+        Header(1, "not json")
+    with pytest.raises(ValueError):
+        json.unmarshal(Envelope, '{"header": {"id": 1, "payload": [1,]}, "others": []}')
+    with pytest.raises(ValueError):
+        json.unmarshal(Envelope, '{"header": {"id": 1, "payload": 1}, "others": []} 1')
+
+
+class PoolItem(Declared):
+    p0 = var(int)
+
+
+class PoolStruct(Declared):
+    p0 = var(int)
+    p1 = vec(PoolItem)
+
+
+def test_unmarshal_many():
+    docs = [f'{{"p0": {i}, "p1": [{{"p0": {i}}}]}}' for i in range(50)]
+    expect = [PoolStruct(i, [PoolItem(i)]) for i in range(50)]
+    assert list(json.unmarshal_many(PoolStruct, iter(docs), workers=2, chunksize=7)) == expect
+    assert list(json.unmarshal_many(vec(PoolItem), ["[]", '[{"p0": 1}]'], workers=1)) == [[], [PoolItem(1)]]
+    assert list(json.unmarshal_many(PoolStruct, [], workers=1)) == []
+
+
+def test_marshal_parallel(monkeypatch):
+    import io
+    import multiprocessing
+
+    v = json.Vec(vec(PoolItem))
+    v.extend(PoolItem(i) for i in range(30))
+    # shards are encoded in forked processes with the GIL
+    monkeypatch.setattr(json, "free_threaded", lambda: False)
+    assert json.marshal_parallel(v, workers=2, chunksize=4) == json.marshal(v)
+    assert json.marshal_parallel(v, json.Options(json_dumps={"separators": (",", ":")}), 2, 4) == (
+        json.marshal(v, json.Options(json_dumps={"separators": (",", ":")}))
+    )
+    fp = io.BytesIO()
+    json.marshal_parallel(v, workers=1, chunksize=16, fp=fp)
+    assert fp.getvalue() == json.marshal(v).encode()
+    with pytest.raises(ValueError):
+        json.marshal_parallel(v, json.Options(json_dumps={"indent": 2}))
+
+    # a single shard is encoded without pool
+    monkeypatch.setattr(json, "pool_imap", None)
+    assert json.marshal_parallel(v, workers=2) == json.marshal(v)
+    assert json.marshal_parallel(json.Vec(vec(PoolItem)), workers=1) == "[]"
+
+    # without fork, the default context of process pool is used
+    monkeypatch.undo()
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    assert json.marshal_parallel(v, workers=2, chunksize=16) == json.marshal(v)
+
+    monkeypatch.undo()
+    monkeypatch.setattr(json, "free_threaded", lambda: True)
+    assert json.marshal_parallel(v, workers=2, chunksize=4) == json.marshal(v)
@@ -0,0 +1,58 @@
+import io
+import json as std_json
+
+import pytest
+
+from pydeclares import Declared, var
+from pydeclares.marshals import json, jsonl
+from pydeclares.variables import vec
+
+
+class Event(Declared):
+    p0 = var(int)
+    p1 = var(str, required=False)
+
+
+def test_dump_many():
+    fp = io.StringIO()
+    assert jsonl.dump_many([Event(1, "a"), Event(2, None)], fp) == 2
+    assert fp.getvalue() == '{"p0": 1, "p1": "a"}\n{"p0": 2, "p1": null}\n'
+
+    fp = io.StringIO()
+    jsonl.dump_many([Event(1, "a"), Event(2, None)], fp, json.Options(True))
+    assert fp.getvalue() == '{"p0": 1, "p1": "a"}\n{"p0": 2}\n'
+
+
+def test_dump_many_binary():
+    fp = io.BytesIO()
+    jsonl.dump_many((Event(i, "é") for i in range(5)), fp, batch_size=2)
+    assert fp.getvalue().splitlines() == [b'{"p0": %d, "p1": "\\u00e9"}' % i for i in range(5)]
+
+
+def test_dump_many_indent():
+    with pytest.raises(ValueError):
+        jsonl.dump_many([Event(1, "a")], io.StringIO(), json.Options(json_dumps={"indent": 2}))
+
+
+def test_iter_load():
+    fp = io.StringIO('{"p0": 1, "p1": "a"}\n\n{"p0": "2"}\n')
+    assert list(jsonl.iter_load(Event, fp)) == [Event(1, "a"), Event(2, None)]
+
+    fp = io.BytesIO(b"[1, 2]\n[3]\n")
+    assert list(jsonl.iter_load(vec(int), fp)) == [[1, 2], [3]]
+
+    class Decoder(std_json.JSONDecoder):
+        def __init__(self, **kw):
+            super().__init__(parse_float=lambda s: float(s) + 1, **kw)
+
+    fp = io.StringIO("[1.5]\n[2.5]\n")
+    options = json.Options(json_loads={"cls": Decoder})
+    assert list(jsonl.iter_load(vec(float), fp, options)) == [[2.5], [3.5]]
+
+
+def test_round_trip():
+    events = [Event(i, str(i)) for i in range(100)]
+    fp = io.BytesIO()
+    jsonl.dump_many(events, fp, batch_size=7)
+    fp.seek(0)
+    assert list(jsonl.iter_load(Event, fp)) == events
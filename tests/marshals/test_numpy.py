@@ -0,0 +1,62 @@
+import pytest
+
+from pydeclares import Declared, DeclaredArray, var, vec
+from pydeclares.marshals.exceptions import MarshalError
+
+np = pytest.importorskip("numpy")
+from pydeclares.marshals import numpy as np_marshal  # noqa: E402
+
+
+class Sample(Declared):
+    ts = var(int)
+    value = var(float, required=False)
+    z = var(complex)
+    ok = var(bool)
+    tag = var(bytes, size=4)
+    name = var(str)
+    items = vec(int, required=False)
+
+
+def test_dtype():
+    dt = np_marshal.dtype(Sample)
+    assert dt.names == ("ts", "value", "z", "ok", "tag", "name", "items")
+    assert [dt.fields[name][0] for name in dt.names] == [
+        np.dtype(np.int64),
+        np.dtype(np.float64),
+        np.dtype(np.complex128),
+        np.dtype(np.bool_),
+        np.dtype("S4"),
+        np.dtype(object),
+        np.dtype(object),
+    ]
+
+
+def test_round_trip():
+    samples = [Sample(1, 1.5, 1j, True, b"ab", "x", [1, 2]), Sample(2, None, 2, False, b"c", "yz", None)]
+    arr = np_marshal.to_numpy(samples)
+    assert arr["ts"].tolist() == [1, 2]
+    assert np.isnan(arr["value"][1])
+    assert arr["items"][0] == [1, 2]
+    assert np_marshal.from_numpy(Sample, arr) == samples
+
+    assert np_marshal.from_numpy(Sample, np_marshal.to_numpy(DeclaredArray(Sample, samples))) == samples
+    columns = np_marshal.from_numpy(Sample, arr, columnar=True)
+    assert isinstance(columns, DeclaredArray) and columns.to_list() == samples
+
+    fixed = np_marshal.to_numpy(samples, fixed_width=True)
+    assert fixed.dtype.fields["name"][0] == np.dtype("U2")
+    assert np_marshal.to_numpy([], Sample).shape == (0,)
+
+
+def test_none_values():
+    class Item(Declared):
+        p0 = var(int, required=False)
+        p1 = var(float, required=False)
+
+    with pytest.raises(MarshalError):
+        np_marshal.to_numpy([Item(None, 1.0)])
+    with pytest.raises(MarshalError):
+        np_marshal.to_numpy(DeclaredArray(Item, [Item(None, 1.0)]))
+
+    arr = np.array([(1, np.nan)], dtype=np_marshal.dtype(Item))
+    assert np_marshal.from_numpy(Item, arr) == [Item(1, None)]
@@ -0,0 +1,74 @@
+import pytest
+
+from pydeclares import Declared, var
+from pydeclares.marshals import record
+from pydeclares.marshals.exceptions import MarshalError
+
+
+class Sample(Declared):
+    ts = var(int)
+    value = var(float)
+    z = var(complex, required=False)
+    ok = var(bool, required=False)
+    tag = var(bytes, size=4, required=False)
+
+
+def test_layout():
+    layout = record.layout(Sample)
+    assert layout.size == 1 + 8 + 8 + 16 + 1 + 4
+    sample = Sample(-1, 1.5, 1 - 2j, True, b"ab\x00\x00")
+    assert layout.unpack(layout.pack(sample)) == sample
+    assert layout.unpack(layout.pack(Sample(1, 2.0))) == Sample(1, 2.0)
+
+    with pytest.raises(MarshalError):
+        layout.pack(Sample(1, 2.0, tag=b"abcde"))
+    with pytest.raises(MarshalError):
+        layout.pack(Sample(1, 2.0, tag=b"ab"))
+
+    class Text(Declared):
+        p0 = var(str)
+
+    with pytest.raises(TypeError):
+        record.layout(Text)
+
+
+def test_record_file(tmp_path):
+    path = tmp_path / "samples.rec"
+    samples = [Sample(i, i / 2, ok=i % 2 == 0) for i in range(10)]
+    with record.RecordFile(Sample, path) as records:
+        records.append(samples[0])
+        assert records[0] == samples[0]
+        records.extend(samples[1:])
+        assert len(records) == 10
+        assert records[-1] == samples[-1]
+        assert list(records) == samples
+
+    with record.RecordFile(Sample, path, views=True) as records:
+        view = records[2]
+        records.append(samples[0])
+        # the mapping is made again to see the appended record
+        last = records[10]
+        assert last == samples[0]
+        assert view._buf is not last._buf
+        window = records[2:8:2]
+        assert len(window) == 3
+        assert window[1].ts == 4 and window[1].z is None and window[1].ok is True
+        assert window[-1].materialize() == samples[6]
+        assert list(window[1:]) == samples[4:8:2]
+        with pytest.raises(IndexError):
+            records[11]
+    # old and current mappings are closed with the file
+    for stale in (view, last):
+        with pytest.raises(ValueError):
+            stale.ts
+
+    class Other(Declared):
+        ts = var(int)
+
+    with pytest.raises(MarshalError):
+        record.RecordFile(Other, path)
+
+    with open(path, "ab") as fp:
+        fp.write(b"\x00")
+    with pytest.raises(MarshalError):
+        record.RecordFile(Sample, path)
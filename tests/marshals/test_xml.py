@@ -192,3 +192,138 @@ def test_unmarshal_xml_seiralize_text():
     out = unmarshal(Struct, _str)
     assert out.p0 == 'olleh'
     assert marshal(out) == _str
+
+
+def test_iter_unmarshal():
+    import io
+
+    from pydeclares import vec
+
+    class Item(Declared):
+        __xml_tag_name__ = "item"
+
+        p0 = var(int, as_xml_attr=True)
+        p1 = var(str)
+
+    _str = '<root><head>1</head><items><item p0="1"><p1>a</p1></item><item p0="2"><p1>b</p1></item></items></root>'
+    expect = [Item(1, "a"), Item(2, "b")]
+    assert list(xml.iter_unmarshal(Item, io.StringIO(_str))) == expect
+    assert list(xml.iter_unmarshal(Item, io.BytesIO(_str.encode()), tag="item")) == expect
+    assert list(xml.iter_unmarshal(vec(Item, field_name="item"), io.StringIO(_str))) == expect
+    with pytest.raises(ValueError):
+        xml.iter_unmarshal(vec(Item), io.StringIO(_str))
+
+
+def test_iter_unmarshal_detach(monkeypatch):
+    import io
+
+    class Item(Declared):
+        __xml_tag_name__ = "item"
+
+        p0 = var(int)
+
+    roots = []
+    iterparse = xml.ET.iterparse
+
+    def record_root(source, events):
+        for event, elem in iterparse(source, events):
+            if not roots:
+                roots.append(elem)
+            yield event, elem
+
+    # skipped siblings and their subtrees don't pile up on the root
+    monkeypatch.setattr(xml.ET, "iterparse", record_root)
+    _str = "<root>" + "<other><a>x</a></other><item><p0>1</p0></item>" * 5000 + "</root>"
+    sizes = []
+    for item in xml.iter_unmarshal(Item, io.StringIO(_str)):
+        assert item == Item(1)
+        sizes.append(len(roots[0]))
+    assert len(sizes) == 5000
+    # only elements parsed ahead of the current one are attached
+    assert max(sizes) < 1000 and len(roots[0]) == 0
+
+
+def test_unmarshal_xml_children_grouping():
+    from pydeclares import vec
+
+    class Item(Declared):
+        p0 = var(str, as_xml_text=True)
+
+    class Struct(Declared):
+        __xml_tag_name__ = "root"
+
+        p0 = var(int)
+        p1 = vec(Item, field_name="item")
+        p2 = var(str, field_name="inner/p2")
+        p3 = var(str, required=False)
+
+    _str = "<root><item>a</item><p0>1</p0><item>b</item><p0>2</p0><inner><p2>c</p2></inner><item>d</item></root>"
+    out = unmarshal(Struct, _str)
+    assert out.p0 == 1
+    assert [i.p0 for i in out.p1] == ["a", "b", "d"]
+    assert out.p2 == "c"
+    assert out.p3 is None
+
+
+def test_dump():
+    import io
+
+    from pydeclares import vec
+    from pydeclares.utils import xml_prettify
+
+    class Item(Declared):
+        __xml_tag_name__ = "item"
+
+        p0 = var(str, as_xml_attr=True)
+        p1 = var(str, as_xml_text=True, required=False)
+        p2 = var(int, required=False)
+
+    items = xml.Vec("root", vec(Item, field_name="item"))
+    items.extend([Item("a&", "<x>", 1), Item("b", None, None), Item("c", "中", 2)])
+    for indent in (None, "  "):
+        for skip_none_field in (False, True):
+            elem = xml.marshal(items, xml.Options(skip_none_field))
+            if indent:
+                xml_prettify(elem, indent)
+            for encoding in (None, "utf-8", "unicode"):
+                stream = io.StringIO() if encoding == "unicode" else io.BytesIO()
+                xml.dump(items, stream, xml.Options(skip_none_field, indent), encoding)
+                assert stream.getvalue() == ET.tostring(elem, encoding)
+            expect = ET.tostring(items[0].to_xml(skip_none_field, indent))
+            assert items[0].to_xml_bytes(skip_none_field, indent) == expect
+
+
+def test_dump_qualified_names():
+    import io
+
+    class Inner(Declared):
+        p0 = var(str, field_name="{urn:y}b", as_xml_attr=True)
+
+    class Outer(Declared):
+        __xml_tag_name__ = "{urn:x}item"
+
+        p0 = var(str, field_name="{urn:y}b", as_xml_attr=True)
+        p1 = var(Inner)
+
+    class Plain(Declared):
+        p0 = var(Inner, field_name="inner")
+
+    for obj in (Outer("q", Inner("<")), Plain(Inner("r"))):
+        for indent in (None, "  "):
+            expect = ET.tostring(obj.to_xml(indent=indent))
+            assert b"ns0:" in expect
+            assert obj.to_xml_bytes(indent=indent) == expect
+            stream = io.BytesIO()
+            xml.dump(obj, stream, xml.Options(indent=indent))
+            assert stream.getvalue() == expect
+
+
+class PoolItem(Declared):
+    __xml_tag_name__ = "item"
+
+    p0 = var(int, as_xml_attr=True)
+
+
+def test_unmarshal_many():
+    docs = [f'<item p0="{i}" />' for i in range(20)]
+    assert list(xml.unmarshal_many(PoolItem, docs, workers=2, chunksize=3)) == [PoolItem(i) for i in range(20)]
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from pydeclares import Codec, Declared, var, vec
+
+
+class Item(Declared):
+    __xml_tag_name__ = "item"
+
+    name = var(str, as_xml_attr=True)
+    price = var(float, required=False)
+
+
+class Order(Declared):
+    __xml_tag_name__ = "order"
+
+    id = var(int)
+    items = vec(Item, field_name="item")
+    note = var(str, required=False)
+
+
+order = Order(1, [Item("a", 1.5), Item("b", None)], None)
+
+
+def test_json_codec():
+    codec = Codec(Order)
+    s = codec.encode(order)
+    assert s == order.to_json()
+    assert codec.decode(s) == order
+    assert codec.decode(s.encode("utf-16")) == order
+
+    codec = Codec(Order, skip_none_field=True, sort_keys=True, indent=2)
+    s = codec.encode(order)
+    assert s == order.to_json(skip_none_field=True, sort_keys=True, indent=2)
+    assert json.loads(s)["item"][1] == {"name": "b"}
+    assert codec.decode(s) == order
+
+    codec = Codec(Order, json_loads={"parse_int": lambda s: int(s) + 1})
+    assert codec.decode('{"id": 1, "item": []}').id == 2
+
+
+def test_xml_codec():
+    codec = Codec(Order, format="xml", skip_none_field=True)
+    s = codec.encode(order)
+    assert s == order.to_xml_bytes(skip_none_field=True)
+    assert codec.decode(s) == order
+    assert codec.decode(order.to_xml()) == order
+    assert Codec(Order, format="xml", encoding="unicode").encode(order) == order.to_xml_bytes(encoding="unicode")
+
+
+def test_codec_many():
+    codec = Codec(Order)
+    orders = [order, Order(2, [], "x")]
+    docs = codec.encode_many(orders)
+    assert docs == [o.to_json() for o in orders]
+    assert codec.decode_many(docs) == orders
+
+
+def test_codec_invalid():
+    with pytest.raises(TypeError):
+        Codec(dict)
+    with pytest.raises(ValueError):
+        Codec(Order, format="yaml")
@@ -0,0 +1,66 @@
+import sys
+from array import array
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from pydeclares import Declared, DeclaredArray, var, vec
+from pydeclares.exceptions import FieldRequiredError
+from pydeclares.marshals import json, xml
+from pydeclares.marshals.exceptions import MarshalError
+
+
+class Person(Declared):
+    __xml_tag_name__ = "person"
+
+    name = var(str)
+    age = var(int)
+    score = var(float, required=False)
+    tags = vec(str, required=False)
+
+
+def test_declared_array():
+    people = [Person("sam", 18, 1.5), Person("tom", 20, None, ["a"])]
+    arr = DeclaredArray(Person, people)
+    assert len(arr) == 2
+    assert arr.column("age") == array("q", [18, 20])
+    assert arr.column("score") == [1.5, None]
+    assert arr[1].name == "tom" and arr[1].score is None and arr[-1].tags == ["a"]
+    assert arr[0] == people[0]
+    assert arr.to_list() == people
+    with pytest.raises(IndexError):
+        arr[2]
+    with pytest.raises(AttributeError):
+        arr[0].missing
+
+    arr.extend_columns({"name": ["ann", "bob"], "age": array("q", [30, 40]), "score": [None, 2.0]})
+    assert len(arr) == 4
+    assert arr.column("tags") == [None, ["a"], None, None]
+    assert [row.score for row in arr] == [1.5, None, None, 2.0]
+    with pytest.raises(ValueError):
+        arr.extend_columns({"name": ["x"], "age": []})
+
+    tail = arr[1::2]
+    assert tail.to_list() == [people[1], Person("bob", 40, 2.0)]
+    assert tail.column("score") == [None, 2.0]
+
+
+def test_unmarshal_columnar():
+    s = '[{"name": "sam", "age": 18, "score": 1}, {"name": "tom", "age": "20", "tags": ["a"]}]'
+    arr = json.unmarshal(vec(Person), s, columnar=True)
+    assert isinstance(arr, DeclaredArray)
+    assert arr.to_list() == [Person("sam", 18, 1.0), Person("tom", 20, None, ["a"])]
+    assert arr.column("age") == array("q", [18, 20])
+    assert arr.column("name")[0] is sys.intern("sam")
+
+    with pytest.raises(FieldRequiredError):
+        json.unmarshal(vec(Person), '[{"name": "sam"}]', columnar=True)
+    with pytest.raises(MarshalError):
+        json.unmarshal(vec(int), "[1]", columnar=True)
+
+    elem = ET.XML(
+        "<root><person><name>sam</name><age>18</age></person><person><name>tom</name><age>20</age></person></root>"
+    )
+    arr = xml.unmarshal(vec(Person, field_name="person"), elem, columnar=True)
+    assert arr.column("name") == ["sam", "tom"]
+    assert arr.column("age") == array("q", [18, 20])
@@ -5,7 +5,7 @@ from typing import List
 
 import pytest
 
-from pydeclares import Declared, NamingStyle, var, vec
+from pydeclares import Declared, NamingStyle, kv, var, vec
 from pydeclares.exceptions import FieldRequiredError
 
 
@@ -588,3 +588,415 @@ def test_dict_v3():
     out = Struct.from_dict({"p0": 1})
     assert out.to_dict() == {"p0": 1, "p1": 2}
     assert out.to_dict() == {"p0": 1, "p1": 2}
+
+
+def test_field_plan():
+    from pydeclares import declares
+    from pydeclares.variables import Kind, kv
+
+    class Fruit(Enum):
+        Apple = 0
+
+    class Inner(Declared):
+        p0 = var(int)
+
+    class Struct(Declared):
+        p0 = var(int, field_name="a", default=1)
+        p1 = var(Inner)
+        p2 = vec(Inner)
+        p3 = kv(str, int)
+        p4 = var(Fruit)
+        p5 = var(bytes, serializer=BytesSerializer())
+
+    assert declares.fields(Struct) is declares.fields(Struct)
+    plans = declares.field_plan(Struct)
+    assert [p.kind for p in plans] == [Kind.scalar, Kind.declared, Kind.vec, Kind.kv, Kind.enum, Kind.serializer]
+    assert plans[0].field_name == "a"
+    assert plans[0].make_default() == 1
+    assert plans[1].make_default is None
+    assert plans[2].items[0].kind is Kind.declared
+    assert plans[2].items[0].var is Struct.meta["vars"]["p2"].item_var
+    assert [p.kind for p in plans[3].items] == [Kind.scalar, Kind.scalar]
+
+
+def test_slots():
+    class Base(Declared, slots=True):
+        p0 = var(int)
+
+    class Struct(Base, slots=True):
+        p1 = var(str)
+        p2 = var(int, required=False)
+
+    assert Base.__slots__ == ("p0", "_is_empty")
+    assert Struct.__slots__ == ("p1", "p2")
+
+    out = Struct.from_json('{"p0": 1, "p1": "1"}')
+    assert not hasattr(out, "__dict__")
+    assert out == Struct(1, "1", None)
+    assert out.to_json() == '{"p0": 1, "p1": "1", "p2": null}'
+    assert not Struct.empty()
+
+
+def test_slots_inherit_not_slotted_base():
+    class Base(Declared):
+        p0 = var(int)
+
+    class Struct(Base, slots=True):
+        p1 = var(int)
+
+    assert Struct.__slots__ == ("p0", "p1", "_is_empty")
+    assert Struct(1, 2).to_dict() == {"p0": 1, "p1": 2}
+
+
+def test_construct():
+    class Item(Declared):
+        name = var(str)
+
+    class Struct(Declared):
+        a = var(int)
+        b = var(str, default="b")
+        c = var(int, init=False)
+        items = vec(Item)
+
+        def __post_init__(self, **omits):
+            raise AssertionError("not called")
+
+    s = Struct.construct(a="1", c=3, items=[])
+    assert (s.a, s.b, s.c, s.items) == ("1", "b", 3, [])
+    assert s
+
+    s = Struct.from_dict({"a": 1, "c": 2, "items": [{"name": "x"}]}, validate=False)
+    assert (s.a, s.b, s.c) == (1, "b", 2)
+    assert s.items == [Item("x")]
+
+
+def test_projection():
+    from pydeclares.defines import MISSING
+
+    class Customer(Declared):
+        name = var(str)
+        email = var(str)
+
+    class Item(Declared):
+        __xml_tag_name__ = "item"
+
+        sku = var(str)
+        price = var(float)
+
+    class Order(Declared):
+        __xml_tag_name__ = "order"
+
+        id = var(int)
+        customer = var(Customer)
+        items = vec(Item, field_name="item")
+        note = var(str, required=False)
+
+    order = Order(1, Customer("sam", "s@x"), [Item("a", 1.0), Item("b", 2.0)], "n")
+    only = {"id", "customer.name", "items[*].sku"}
+    data = {"id": 1, "customer": {"name": "sam"}, "item": [{"sku": "a"}, {"sku": "b"}]}
+    for out in (
+        Order.from_json(order.to_json(), only=only),
+        Order.from_dict(data, only=only),
+        Order.from_dict(data, only=only, validate=False),
+        Order.from_xml(order.to_xml(), only=only),
+    ):
+        assert out.id == 1
+        assert out.customer.name == "sam"
+        assert out.customer.email is MISSING
+        assert [(i.sku, i.price) for i in out.items] == [("a", MISSING), ("b", MISSING)]
+        assert out.note is MISSING
+
+    assert Order.from_json('{"id": "2"}', only=["id"]).id == 2
+    assert Order.from_json(order.to_json(), only=["customer"]).customer == order.customer
+    assert Order.from_json(order.to_json(), only=["items"]).items == order.items
+    with pytest.raises(FieldRequiredError):
+        Order.from_json('{"id": null}', only=["id"])
+    with pytest.raises(ValueError):
+        Order.from_json("{}", only=["unknown"])
+    with pytest.raises(ValueError):
+        Order.from_json("{}", only=["items.sku"])
+    with pytest.raises(ValueError):
+        Order.from_json("{}", only=["id.x"])
+
+
+def test_mask():
+    class Customer(Declared):
+        __xml_tag_name__ = "customer"
+
+        name = var(str)
+        email = var(str)
+
+    class Item(Declared):
+        sku = var(str)
+        price = var(float)
+
+    class Order(Declared):
+        __xml_tag_name__ = "order"
+
+        id = var(int)
+        customer = var(Customer)
+        items = vec(Item)
+        note = var(str, required=False)
+
+    order = Order(1, Customer("sam", "s@x"), [Item("a", 1.0)], None)
+    assert order.to_json(include={"id", "customer.name"}) == '{"id": 1, "customer": {"name": "sam"}}'
+    assert order.to_json(include={"id", "customer.name"}, indent=None) == '{"id": 1, "customer": {"name": "sam"}}'
+    assert order.to_json(exclude={"customer", "items[*].price"}) == '{"id": 1, "items": [{"sku": "a"}], "note": null}'
+    assert order.to_json(True, exclude={"items[*].price"}, sort_keys=True) == (
+        '{"customer": {"email": "s@x", "name": "sam"}, "id": 1, "items": [{"sku": "a"}]}'
+    )
+    assert order.to_json(include={"customer"}, exclude={"customer.email"}) == '{"customer": {"name": "sam"}}'
+    assert order.to_json() == (
+        '{"id": 1, "customer": {"name": "sam", "email": "s@x"}, "items": [{"sku": "a", "price": 1.0}], "note": null}'
+    )
+    assert order.to_dict(include={"id", "customer.email"}) == {"id": 1, "customer": {"email": "s@x"}}
+    assert order.to_dict(include={"items[*].sku"}) == {"items": [{"sku": "a"}]}
+    assert order.to_dict(exclude={"id", "customer", "items[*].price"}) == {"items": [{"sku": "a"}], "note": None}
+    assert order.to_dict(include={"items"})["items"][0] is order.items[0]
+    assert order.to_xml_bytes(True, exclude={"items", "customer.name"}) == (
+        b"<order><id>1</id><customer><email>s@x</email></customer></order>"
+    )
+    with pytest.raises(ValueError):
+        order.to_json(include={"unknown"})
+
+
+class PickleItem(Declared):
+    p0 = var(int)
+    p1 = var(str, required=False)
+
+
+class PickleSlotted(Declared, slots=True):
+    p0 = var(int)
+    p1 = vec(PickleItem)
+
+
+class PickleExtra(Declared):
+    p0 = var(int)
+
+    def __post_init__(self):
+        self.extra = [self.p0]
+
+
+def test_pickle():
+    import copy
+    import pickle
+
+    from pydeclares.declares import _rebuild
+    from pydeclares.defines import MISSING
+
+    items = [PickleItem(i, None) for i in range(3)]
+    assert pickle.loads(pickle.dumps(items)) == items
+    out = pickle.loads(pickle.dumps(PickleSlotted(1, items)))
+    assert out == PickleSlotted(1, items)
+    assert out.p1[0] is not items[0]
+    assert copy.deepcopy(out) == out
+    assert not pickle.loads(pickle.dumps(PickleItem.empty()))
+    assert pickle.loads(pickle.dumps(PickleItem.empty())).p0 is MISSING
+
+    # attributes out of fields are kept
+    out = PickleExtra(1)
+    assert out.extra == [1]
+    out.extra.append(2)
+    for copied in (pickle.loads(pickle.dumps(out)), copy.copy(out), copy.deepcopy(out)):
+        assert (copied.p0, copied.extra) == (1, [1, 2])
+    assert copy.deepcopy(out).extra is not out.extra
+    assert pickle.loads(pickle.dumps(PickleItem(1))).__dict__ == PickleItem(1).__dict__
+
+    # field names are pickled once per class instead of once per instance
+    items = [PickleItem(i, "a") for i in range(100)]
+    assert pickle.dumps(items).count(b"p1") == 1
+    assert pickle.loads(pickle.dumps(items)) == items
+
+    # values of another schema are matched by names
+    out = _rebuild(PickleItem, ("p1", "p2"), ("a", "b"))
+    assert (out.p0, out.p1) == (None, "a")
+
+
+class CachedLeaf(Declared, cache_encoded=True):
+    p0 = var(int)
+
+
+class CachedNode(Declared, cache_encoded=True):
+    p0 = var(str)
+    p1 = var(CachedLeaf)
+
+
+def test_cache_encoded():
+    import copy
+    import pickle
+
+    from pydeclares.marshals import json
+
+    class Leaf(Declared, cache_encoded=True):
+        p0 = var(int)
+
+    class Node(Declared, slots=True, cache_encoded=True):
+        p0 = var(str)
+        p1 = var(Leaf)
+        p2 = vec(Leaf, required=False)
+
+    leaf = Leaf(1)
+    node = Node("a", leaf, [Leaf(2)])
+    s = node.to_json()
+    assert node.to_json() is s
+    assert node.to_json(indent=2) is not s
+    assert node.to_xml_bytes() is node.to_xml_bytes()
+    assert leaf.to_query_string() is leaf.to_query_string()
+
+    leaf.p0 = 3
+    assert node.to_json() == '{"p0": "a", "p1": {"p0": 3}, "p2": [{"p0": 2}]}'
+    node.p2[0].p0 = 4
+    assert node.to_json() == '{"p0": "a", "p1": {"p0": 3}, "p2": [{"p0": 4}]}'
+    node.p2.append(Leaf(5))
+    node.invalidate_cache()
+    assert node.to_json() == '{"p0": "a", "p1": {"p0": 3}, "p2": [{"p0": 4}, {"p0": 5}]}'
+
+    # decoded children are linked as well
+    node = json.unmarshal(Node, s)
+    assert node.to_json() == s
+    node.p1.p0 = 6
+    assert node.to_json() != s
+
+    # copies don't share encoded results, and children of copies invalidate their own parents
+    node = CachedNode("a", CachedLeaf(1))
+    s = node.to_json()
+    shallow = copy.copy(node)
+    shallow.p0 = "b"
+    assert shallow.to_json() == '{"p0": "b", "p1": {"p0": 1}}'
+    assert node.to_json() is s
+    shallow.p1.p0 = 2
+    assert node.to_json() == shallow.to_json().replace('"b"', '"a"') == '{"p0": "a", "p1": {"p0": 2}}'
+    for copied in (copy.deepcopy(node), pickle.loads(pickle.dumps(node))):
+        assert copied.to_json() == node.to_json()
+        copied.p1.p0 = 5
+        assert copied.to_json() == '{"p0": "a", "p1": {"p0": 5}}'
+        assert node.to_json() == '{"p0": "a", "p1": {"p0": 2}}'
+
+    with pytest.raises(TypeError):
+
+        class Parent(Declared, cache_encoded=True):
+            p0 = var(InnerJSONTestClass)
+
+
+def test_track_changes():
+    import copy
+    import json as _json
+
+    from pydeclares.marshals import json
+
+    class Customer(Declared, track_changes=True):
+        name = var(str)
+        email = var(str, field_name="e/mail", required=False)
+
+    class Order(Declared, slots=True, track_changes=True):
+        id = var(int)
+        customer = var(Customer)
+        items = vec(Customer, required=False)
+        note = var(str, required=False)
+
+    order = json.unmarshal(Order, '{"id": 1, "customer": {"name": "sam"}, "items": [{"name": "a"}]}')
+    assert order.changed_fields() == set()
+    assert order.to_json(only_changed=True) == "{}"
+
+    order.note = "n"
+    order.customer.email = "s@x"
+    assert order.changed_fields() == {"note", "customer.email"}
+    assert order.to_json(only_changed=True) == '{"customer": {"e/mail": "s@x"}, "note": "n"}'
+    assert _json.loads(order.to_json(only_changed=True, json_patch=True)) == [
+        {"op": "add", "path": "/customer/e~1mail", "value": "s@x"},
+        {"op": "add", "path": "/note", "value": "n"},
+    ]
+
+    order.items[0].name = "b"
+    order.note = None
+    assert order.changed_fields() == {"note", "customer.email", "items"}
+    assert _json.loads(order.to_json(True, only_changed=True, json_patch=True))[1:] == [
+        {"op": "add", "path": "/items", "value": [{"name": "b"}]},
+        {"op": "remove", "path": "/note"},
+    ]
+
+    order.mark_clean()
+    assert order.changed_fields() == set()
+    assert order.customer.changed_fields() == set()
+    assert Order(1, Customer("sam")).changed_fields() == set()
+
+    # copies start clean and don't share changes with the original
+    order.note = "n"
+    for copied in (copy.copy(order), copy.deepcopy(order)):
+        assert copied.changed_fields() == set()
+        copied.id = 3
+        assert copied.changed_fields() == {"id"}
+        assert order.to_json(only_changed=True) == '{"note": "n"}'
+    copied.customer.name = "bob"
+    assert copied.changed_fields() == {"id", "customer.name"}
+    assert order.changed_fields() == {"note"}
+
+    with pytest.raises(TypeError):
+        InnerJSONTestClass(1, 2).changed_fields()
+
+
+def test_apply_patch():
+    from pydeclares.exceptions import FieldRequiredError
+    from pydeclares.marshals.exceptions import MarshalError
+
+    class Customer(Declared, track_changes=True):
+        name = var(str)
+        email = var(str, field_name="e/mail", required=False)
+
+    class Order(Declared, track_changes=True):
+        id = var(int)
+        customer = var(Customer)
+        items = vec(Customer, required=False)
+        tags = kv(str, int, required=False)
+        contacts = kv(str, Customer, required=False)
+        note = var(str, required=False)
+
+    order = Order.from_json('{"id": 1, "customer": {"name": "sam"}, "items": [{"name": "a"}], "tags": {"x": 1}}')
+    order.apply_merge_patch('{"customer": {"e/mail": "s@x"}, "tags": {"x": null, "y": 2}, "note": "n", "z": 1}')
+    assert order.customer == Customer("sam", "s@x")
+    assert order.tags == {"y": 2}
+    assert order.changed_fields() == {"customer.email", "tags", "note"}
+    order.apply_merge_patch({"items": [{"name": "b"}], "note": None})
+    assert order.items == [Customer("b")] and order.note is None
+    with pytest.raises(FieldRequiredError):
+        order.apply_merge_patch({"id": None})
+    with pytest.raises(MarshalError):
+        order.apply_merge_patch("[]")
+    for patch in ({"items": {"name": "b"}}, {"items": [1]}, {"customer": [1]}, {"contacts": {"a": "sam"}}):
+        with pytest.raises(MarshalError):
+            order.apply_merge_patch(patch)
+
+    # declared items of kv fields are merged too
+    order.contacts = {"a": Customer("sam"), "b": Customer("bob")}
+    sam = order.contacts["a"]
+    order.apply_merge_patch({"contacts": {"a": {"e/mail": "s@x"}, "b": None, "c": {"name": "cat"}}})
+    assert order.contacts == {"a": Customer("sam", "s@x"), "c": Customer("cat")}
+    assert order.contacts["a"] is sam
+
+    order.mark_clean()
+    order.apply_json_patch(
+        [
+            {"op": "test", "path": "/customer/e~1mail", "value": "s@x"},
+            {"op": "replace", "path": "/id", "value": "2"},
+            {"op": "add", "path": "/items/-", "value": {"name": "c"}},
+            {"op": "add", "path": "/items/0", "value": {"name": "a"}},
+            {"op": "copy", "from": "/items/2", "path": "/customer"},
+            {"op": "move", "from": "/tags/y", "path": "/tags/z"},
+            {"op": "remove", "path": "/items/1"},
+            {"op": "remove", "path": "/customer/e~1mail"},
+        ]
+    )
+    assert order.id == 2
+    assert order.items == [Customer("a"), Customer("c")]
+    assert order.customer == Customer("c")
+    assert order.tags == {"z": 2}
+    assert order.changed_fields() == {"id", "items", "customer", "tags"}
+
+    with pytest.raises(MarshalError):
+        order.apply_json_patch('[{"op": "test", "path": "/id", "value": 3}]')
+    with pytest.raises(MarshalError):
+        order.apply_json_patch([{"op": "replace", "path": "/items/5", "value": {"name": "d"}}])
+    with pytest.raises(MarshalError):
+        order.apply_json_patch([{"op": "add", "path": "/unknown", "value": 1}])
+    with pytest.raises(FieldRequiredError):
+        order.apply_json_patch([{"op": "remove", "path": "/customer"}])